@@ -0,0 +1,201 @@
+# bench/fake_servers.py
+"""
+ベンチマーク用の Influx / Notion スタンドイン（標準ライブラリのみ）
+
+- FakeInflux : POST /api/v2/write（line protocol の行数を数えて 204）
+               POST /api/v2/query（annotated CSV を query_rows 行返す）
+- FakeNotion : POST /v1/pages, PATCH|GET /v1/pages/{id},
+               POST /v1/databases/{id}/query, PATCH /v1/blocks/{id}/children
+- どちらも latency（秒）/ error_rate（500）/ rate_limit_rate（429 + Retry-After）を設定でき、
+  乱数は seed 固定で再現可能
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.0          # 1 リクエストあたりの応答遅延（秒）
+    error_rate: float = 0.0       # 500 を返す割合
+    rate_limit_rate: float = 0.0  # 429 を返す割合
+    retry_after: float = 1.0      # 429 の Retry-After（秒）
+    query_rows: int = 100         # FakeInflux の query が返す行数
+    seed: int = 0
+
+
+class _FakeServer:
+    """ThreadingHTTPServer をバックグラウンドスレッドで動かす共通部分"""
+
+    def __init__(self, config: FakeConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeConfig()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- 障害注入 ---
+    def _fault(self) -> int | None:
+        with self._lock:
+            self.stats["requests"] += 1
+            r = self._rng.random()
+            if r < self.config.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429
+            if r < self.config.rate_limit_rate + self.config.error_rate:
+                self.stats["errors"] += 1
+                return 500
+        return None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> bytes:
+                n = int(self.headers.get("content-length") or 0)
+                data = self.rfile.read(n) if n else b""
+                if self.headers.get("content-encoding") == "gzip":
+                    data = gzip.decompress(data)
+                return data
+
+            def _reply(self, status: int, body: bytes = b"", content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def _dispatch(self):
+                body = self._body()
+                if fake.config.latency:
+                    time.sleep(fake.config.latency)
+
+                status = fake._fault()
+                if status == 429:
+                    return self._reply(429, fake.error_body(429, "rate_limited"),
+                                       headers={"retry-after": str(fake.config.retry_after)})
+                if status == 500:
+                    return self._reply(500, fake.error_body(500, "internal_server_error"))
+
+                return fake.handle(self, self.command, self.path.split("?")[0], body)
+
+            do_GET = do_POST = do_PATCH = _dispatch
+
+        return Handler
+
+    def error_body(self, status: int, code: str) -> bytes:
+        return json.dumps({"object": "error", "status": status, "code": code, "message": code}).encode()
+
+    def handle(self, h, method: str, path: str, body: bytes):
+        raise NotImplementedError
+
+
+# ============================================================
+# InfluxDB v2
+# ============================================================
+class FakeInflux(_FakeServer):
+
+    def __init__(self, config: FakeConfig | None = None, **kwargs):
+        super().__init__(config, **kwargs)
+        self.points = 0
+
+    def _csv(self) -> bytes:
+        lines = [
+            "#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,double,string,string,string",
+            "#group,false,false,true,true,false,false,true,true,true",
+            "#default,_result,,,,,,,,",
+            ",result,table,_start,_stop,_time,_value,_field,_measurement,host",
+        ]
+        for i in range(self.config.query_rows):
+            lines.append(f",,0,2024-01-01T00:00:00Z,2024-01-02T00:00:00Z,"
+                         f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z,{i * 0.5},value,cpu,bench")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    def handle(self, h, method, path, body):
+        if method == "POST" and path == "/api/v2/write":
+            n = body.count(b"\n") + (1 if body and not body.endswith(b"\n") else 0)
+            with self._lock:
+                self.points += n
+            return h._reply(204)
+        if method == "POST" and path == "/api/v2/query":
+            return h._reply(200, self._csv(), content_type="text/csv; charset=utf-8")
+        if path in ("/ping", "/health"):
+            return h._reply(204)
+        return h._reply(404, self.error_body(404, "not_found"))
+
+
+# ============================================================
+# Notion
+# ============================================================
+class FakeNotion(_FakeServer):
+
+    def __init__(self, config: FakeConfig | None = None, **kwargs):
+        super().__init__(config, **kwargs)
+        self.pages: dict[str, dict] = {}
+
+    def _page(self, page_id: str, properties: dict) -> dict:
+        return {"object": "page", "id": page_id, "url": f"https://www.notion.so/{page_id.replace('-', '')}",
+                "properties": properties}
+
+    def handle(self, h, method, path, body):
+        data = json.loads(body) if body else {}
+        parts = path.strip("/").split("/")   # ["v1", "pages", ...]
+
+        if parts[:2] == ["v1", "pages"]:
+            if method == "POST" and len(parts) == 2:
+                page = self._page(str(uuid.uuid4()), data.get("properties", {}))
+                with self._lock:
+                    self.pages[page["id"]] = page
+                return h._reply(200, json.dumps(page).encode())
+            if len(parts) == 3:
+                page = self.pages.get(parts[2])
+                if page is None:
+                    return h._reply(404, self.error_body(404, "object_not_found"))
+                if method == "PATCH":
+                    page["properties"].update(data.get("properties", {}))
+                return h._reply(200, json.dumps(page).encode())
+
+        if method == "POST" and parts[:2] == ["v1", "databases"] and parts[-1] == "query":
+            return h._reply(200, json.dumps({"object": "list", "results": [], "has_more": False,
+                                             "next_cursor": None}).encode())
+
+        if method == "PATCH" and parts[:2] == ["v1", "blocks"] and parts[-1] == "children":
+            return h._reply(200, json.dumps({"object": "list", "results": data.get("children", [])}).encode())
+
+        return h._reply(404, self.error_body(404, "invalid_request_url"))
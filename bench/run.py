@@ -0,0 +1,333 @@
+# bench/run.py
+"""
+ChronoNeura Ingest Server – 負荷ベンチマーク
+
+fake Influx / fake Notion（bench/fake_servers.py）を立て、そこへ向けた
+python -m server.serve（server/app.py の create_app）を起動し、
+並列の負荷をかけて throughput / p50 / p99 / RSS を測る。
+
+  python -m bench.run                              # 全シナリオ
+  python -m bench.run -s ingest_batch -n 200 -c 16 # シナリオ・件数・並列数を指定
+  python -m bench.run --influx-latency 0.005 --notion-429 0.05
+  python -m bench.run --workers 4                  # マルチワーカー（RSS は全プロセスの合計）
+  python -m bench.run --baseline bench/results/<前回>.json   # 退行チェック（閾値超えで exit 1）
+
+結果は bench/results/<git sha>.json（--out で変更可）に JSON で保存する。
+RSS は /proc/<pid>/status から読む（Linux 以外では null）。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.fake_servers import FakeConfig, FakeInflux, FakeNotion
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "bench", "results")
+
+BATCH_POINTS = 500
+
+
+# ============================================================
+# シナリオ：i 番目のリクエスト → (method, path, kwargs)
+# ============================================================
+def _point(i: int) -> dict:
+    return {"mode": "sandbox", "measurement": "bench_cpu",
+            "fields": {"value": i * 0.5, "count": i}, "tags": {"host": f"h{i % 8}"}}
+
+
+def _ingest_single(i):
+    return "POST", "/ingest/ingest", {"json": _point(i)}
+
+
+def _ingest_batch(i):
+    return "POST", "/ingest/ingest/batch", {"json": [_point(i * BATCH_POINTS + j) for j in range(BATCH_POINTS)]}
+
+
+def _query(i):
+    # 毎回異なるクエリにしてキャッシュを外す
+    return "GET", "/query/query", {"params": {"mode": "sandbox", "q": f"range(start: -{i + 1}s)"}}
+
+
+def _query_cached(i):
+    return "GET", "/query/query", {"params": {"mode": "sandbox", "q": "range(start: -1h)"}}
+
+
+def _devlog(i):
+    return "POST", "/notion/devlog", {"json": {"mode": "create", "title": f"bench {i}",
+                                               "summary": "load test", "details": "x" * 200}}
+
+
+SCENARIOS = {
+    "ingest_single": (_ingest_single, 1),
+    "ingest_batch": (_ingest_batch, BATCH_POINTS),
+    "query": (_query, 0),
+    "query_cached": (_query_cached, 0),
+    "devlog": (_devlog, 0),
+}
+
+# シナリオごとの既定件数（-n で上書き）
+DEFAULT_REQUESTS = {"ingest_single": 2000, "ingest_batch": 100, "query": 500, "query_cached": 2000, "devlog": 200}
+
+
+# ============================================================
+# サーバプロセス
+# ============================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid: int) -> list:
+    """pid とその子孫（/proc の ppid を辿る）"""
+    children: dict = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        tree.append(p)
+        todo.extend(children.get(p, []))
+    return tree
+
+
+def rss_kb(pid: int) -> dict:
+    """プロセスツリー全体の VmRSS（現在）/ VmHWM（ピークの合計）を kB で返す"""
+    rss = peak = 0
+    try:
+        for p in _process_tree(pid):
+            try:
+                with open(f"/proc/{p}/status") as f:
+                    fields = dict(line.split(":", 1) for line in f if ":" in line)
+            except OSError:
+                continue
+            rss += int(fields["VmRSS"].split()[0])
+            peak += int(fields["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return {"rss_kb": None, "peak_rss_kb": None}
+    return {"rss_kb": rss, "peak_rss_kb": peak}
+
+
+class AppProcess:
+    """python -m server.serve（create_app を workers プロセスで配信）"""
+
+    def __init__(self, env: dict, workers: int = 1):
+        self.target = f"server.serve --workers {workers}"
+        self.workers = workers
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = env
+        self.proc = None
+
+    def start(self, timeout: float = 20.0):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "server.serve", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=PROJECT_ROOT, env=self.env,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.target} exited with {self.proc.returncode}")
+            try:
+                if httpx.get(self.url + "/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"{self.target} did not become healthy in {timeout}s")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# ============================================================
+# 負荷生成
+# ============================================================
+def percentile(sorted_values: list, p: float) -> float | None:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def drive(url: str, scenario: str, requests: int, concurrency: int, warmup: int) -> dict:
+    make, points_per_request = SCENARIOS[scenario]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def one(i):
+            method, path, kwargs = make(i)
+            t0 = time.perf_counter()
+            try:
+                res = await client.request(method, url + path, **kwargs)
+                status = res.status_code
+            except httpx.HTTPError:
+                status = 0
+            return time.perf_counter() - t0, status
+
+        for i in range(warmup):
+            await one(requests + i)
+
+        latencies = []
+        statuses: dict = {}
+        counter = iter(range(requests))
+
+        async def worker():
+            for i in counter:
+                dt, status = await one(i)
+                latencies.append(dt)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    ok = sum(n for s, n in statuses.items() if 200 <= s < 300)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "rps": round(requests / elapsed, 2),
+        "points_per_s": round(ok * points_per_request / elapsed, 2) if points_per_request else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "ok": ok,
+        "errors": requests - ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+# ============================================================
+# 結果の保存 / 比較
+# ============================================================
+def git_sha() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """throughput 低下 / p99 悪化が threshold（割合）を超えたシナリオを返す"""
+    regressions = []
+    for name, cur in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if cur["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']} -> {cur['rps']}")
+        if cur["p99_ms"] > base["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {base['p99_ms']}ms -> {cur['p99_ms']}ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="ChronoNeura ingest server benchmark")
+    ap.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                    help="実行するシナリオ（複数指定可、既定は全て）")
+    ap.add_argument("-n", "--requests", type=int, help="シナリオあたりのリクエスト数")
+    ap.add_argument("-c", "--concurrency", type=int, default=32)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=1, help="server.serve のワーカー数")
+    ap.add_argument("--influx-latency", type=float, default=0.002)
+    ap.add_argument("--influx-errors", type=float, default=0.0)
+    ap.add_argument("--influx-429", type=float, default=0.0)
+    ap.add_argument("--notion-latency", type=float, default=0.02)
+    ap.add_argument("--notion-errors", type=float, default=0.0)
+    ap.add_argument("--notion-429", type=float, default=0.0)
+    ap.add_argument("--notion-rate", type=float, default=1000.0,
+                    help="scheduler の NOTION_RATE_PER_SEC（実 API は ~3）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="結果 JSON の出力先（既定 bench/results/<sha>.json）")
+    ap.add_argument("--baseline", help="比較対象の結果 JSON")
+    ap.add_argument("--threshold", type=float, default=0.15, help="退行とみなす割合")
+    args = ap.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+
+    influx = FakeInflux(FakeConfig(args.influx_latency, args.influx_errors, args.influx_429, seed=args.seed)).start()
+    notion = FakeNotion(FakeConfig(args.notion_latency, args.notion_errors, args.notion_429,
+                                   retry_after=0.1, seed=args.seed)).start()
+
+    env = {
+        **os.environ,
+        "INFLUX_URL": influx.url, "INFLUX_TOKEN": "bench", "INFLUX_ORG": "bench",
+        "NOTION_BASE_URL": notion.url, "NOTION_TOKEN_AUTOJOURNAL": "bench", "NOTION_DB_DEVLOG_ID": "bench-db",
+        "NOTION_RATE_PER_SEC": str(args.notion_rate), "NOTION_BURST": str(int(args.notion_rate)),
+        "NOTION_KEY_INDEX_FILE": "",
+    }
+    app = AppProcess(env, args.workers)
+
+    result = {
+        "git_sha": git_sha(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": {},
+    }
+
+    try:
+        app.start()
+
+        for scenario in scenarios:
+            n = args.requests or DEFAULT_REQUESTS[scenario]
+            stats = asyncio.run(drive(app.url, scenario, n, args.concurrency, args.warmup))
+            stats.update(rss_kb(app.proc.pid))
+            result["scenarios"][scenario] = stats
+            print(f"{scenario:14s} {stats['rps']:>10.1f} req/s  p50 {stats['p50_ms']:>8.2f}ms  "
+                  f"p99 {stats['p99_ms']:>8.2f}ms  errors {stats['errors']}  rss {stats['rss_kb']} kB")
+    finally:
+        app.stop()
+        influx.stop()
+        notion.stop()
+
+    result["fakes"] = {"influx": {**influx.stats, "points": influx.points}, "notion": notion.stats}
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{result['git_sha']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"results -> {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
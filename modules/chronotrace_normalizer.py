@@ -1,33 +1,91 @@
 # modules/chronotrace_normalizer.py
 import re
+from functools import lru_cache
+
+# 事前コンパイル済みパターン
+_NON_ASCII = re.compile(r"[^\x00-\x7F]+")
+_INVALID_CHARS = re.compile(r"[^A-Za-z0-9_]")
+
+# raw → normalized キーの LRU 上限（キー語彙は小さく、繰り返し出現する）
+KEY_CACHE_SIZE = 4096
+
+# payload にこのキーが真で入っていれば field の値は変換しない（line protocol は 5i / true で型を明示している。
+# JSON と同じく float にすると、既存の int / bool field と型が衝突して Influx に拒否される）
+TYPED_FIELDS = "_typed_fields"
+
 
 class ChronoTraceNormalizer:
 
-    def __init__(self, default_value="Unknown"):
+    def __init__(self, default_value="Unknown", cache_size: int = KEY_CACHE_SIZE):
         self.default_value = default_value
 
-    def normalize_key(self, raw: str) -> str:
+        # インスタンス単位の LRU（hit / miss は cache_info() で参照）
+        self.normalize_key = lru_cache(maxsize=cache_size)(self._normalize_key)
+
+    def _normalize_key(self, raw: str) -> str:
         if not raw:
             return self.default_value
 
-        s = re.sub(r"[^\x00-\x7F]+", "", raw)
-        s = re.sub(r"[^A-Za-z0-9_]", "_", s)
+        # fast path：ASCII 識別子（先頭が数字でない [A-Za-z0-9_]+）はそのまま
+        if raw.isascii() and raw.isidentifier():
+            return raw
+
+        s = _NON_ASCII.sub("", raw)
+        s = _INVALID_CHARS.sub("_", s)
 
-        if re.match(r"^[0-9]", s):
+        if s and "0" <= s[0] <= "9":
             s = "M_" + s
 
         return s or self.default_value
 
+    def cache_info(self) -> dict:
+        info = self.normalize_key.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+
     def normalize_value(self, v):
         return str(v)
 
+    @staticmethod
+    def _to_number(v):
+        # 型で先に振り分け、文字列など変換できない可能性があるものだけ try する
+        t = type(v)
+        if t is float:
+            return v
+        try:
+            return float(v)
+        except (TypeError, ValueError, OverflowError):
+            return v
+
     def normalize_fields(self, fields: dict):
-        out = {}
-        for k, v in fields.items():
-            nk = self.normalize_key(k)
-            try:
-                nv = float(v)
-            except:
-                nv = v
-            out[nk] = nv
+        key = self.normalize_key
+        num = self._to_number
+        return {key(k): num(v) for k, v in fields.items()}
+
+    def normalize_tags(self, tags: dict | None):
+        key = self.normalize_key
+        return {key(k): str(v) for k, v in (tags or {}).items()}
+
+    # ---------------------------------------------------------
+    # batch：複数 payload をまとめて正規化（キーキャッシュを共有）
+    #   payloads: [{"measurement", "fields", "tags", "timestamp"}, ...]
+    # ---------------------------------------------------------
+    def normalize_batch(self, payloads):
+        key = self.normalize_key
+        num = self._to_number
+
+        out = []
+        for p in payloads:
+            fields = p["fields"]
+            out.append({
+                "measurement": key(p["measurement"]),
+                "fields": ({key(k): v for k, v in fields.items()} if p.get(TYPED_FIELDS)
+                           else {key(k): num(v) for k, v in fields.items()}),
+                "tags": {key(k): str(v) for k, v in (p.get("tags") or {}).items()},
+                "timestamp": p.get("timestamp"),
+            })
         return out
@@ -0,0 +1,148 @@
+# modules/flux_builder.py
+# 構造化クエリ → Flux パイプライン
+#   range / filter / projection / aggregateWindow / limit をサーバ側で組み立て、
+#   ユーザー入力は全て Flux 文字列リテラルとしてエスケープする。
+#   range の無いクエリ・上限を超える範囲は FluxQueryError で拒否する。
+
+import os
+import re
+from datetime import datetime, timezone
+
+# 生データ（window なし）で許可する最大範囲 / window 集約ありで許可する最大範囲（秒）
+STRUCTURED_MAX_RANGE = int(os.getenv("STRUCTURED_MAX_RANGE", str(7 * 86400)))
+STRUCTURED_MAX_RANGE_WINDOWED = int(os.getenv("STRUCTURED_MAX_RANGE_WINDOWED", str(366 * 86400)))
+STRUCTURED_DEFAULT_LIMIT = int(os.getenv("STRUCTURED_DEFAULT_LIMIT", "1000"))
+STRUCTURED_MAX_LIMIT = int(os.getenv("STRUCTURED_MAX_LIMIT", "10000"))
+
+AGGREGATES = ("mean", "median", "sum", "min", "max", "count", "first", "last", "spread", "stddev")
+
+_UNIT_SECONDS = {
+    "ns": 1e-9, "us": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600,
+    "d": 86400, "w": 7 * 86400, "mo": 30 * 86400, "y": 365 * 86400,
+}
+_DURATION = re.compile(r"^(?:\d+(?:ns|us|ms|mo|s|m|h|d|w|y))+$")
+_DURATION_PART = re.compile(r"(\d+)(ns|us|ms|mo|s|m|h|d|w|y)")
+
+
+class FluxQueryError(ValueError):
+    """構造化クエリの検証エラー（API 側で 400）"""
+
+
+# --------------------------
+# リテラル
+# --------------------------
+def flux_string(value: str) -> str:
+    """Flux の文字列リテラル（\\ " ${ 改行 をエスケープ）"""
+    s = (str(value)
+         .replace("\\", "\\\\")
+         .replace('"', '\\"')
+         .replace("${", "\\${")
+         .replace("\n", "\\n")
+         .replace("\r", "\\r"))
+    return f'"{s}"'
+
+
+def duration_seconds(d: str) -> float:
+    if not _DURATION.match(d):
+        raise FluxQueryError(f"Invalid duration: {d}")
+    return sum(int(n) * _UNIT_SECONDS[u] for n, u in _DURATION_PART.findall(d))
+
+
+def _parse_time(value: str, now: datetime) -> tuple[str, datetime | float]:
+    """"-1h" などの相対時間 / RFC3339 を (Flux 表記, datetime) に変換"""
+    if value == "now()":
+        return "now()", now
+
+    if value.startswith("-"):
+        return value, now.timestamp() - duration_seconds(value[1:])
+
+    try:
+        t = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise FluxQueryError(f"Invalid time: {value}")
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    t = t.astimezone(timezone.utc)
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), t
+
+
+def _epoch(t) -> float:
+    return t if isinstance(t, float) else t.timestamp()
+
+
+# --------------------------
+# 構造化クエリ → Flux
+# --------------------------
+def build_flux(bucket: str,
+               measurement: str,
+               start: str | None,
+               stop: str | None = None,
+               tags: dict | None = None,
+               fields: list[str] | None = None,
+               window: str | None = None,
+               aggregate: str | None = None,
+               limit: int | None = None,
+               now: datetime | None = None) -> str:
+
+    if not start:
+        raise FluxQueryError("start is required (unbounded scans are not allowed)")
+    if not measurement:
+        raise FluxQueryError("measurement is required")
+
+    now = now or datetime.now(timezone.utc)
+    start_flux, start_t = _parse_time(start, now)
+    stop_flux, stop_t = _parse_time(stop or "now()", now)
+
+    span = _epoch(stop_t) - _epoch(start_t)
+    if span <= 0:
+        raise FluxQueryError("start must be before stop")
+
+    # --- window / aggregate ---
+    if bool(window) != bool(aggregate):
+        raise FluxQueryError("window and aggregate must be given together")
+    if aggregate and aggregate not in AGGREGATES:
+        raise FluxQueryError(f"Unknown aggregate: {aggregate}")
+    if window:
+        duration_seconds(window)
+
+    max_range = STRUCTURED_MAX_RANGE_WINDOWED if window else STRUCTURED_MAX_RANGE
+    if span > max_range:
+        raise FluxQueryError(f"Time range too large ({int(span)}s > {max_range}s)"
+                             + ("" if window else "; use window/aggregate"))
+
+    # --- limit ---
+    limit = STRUCTURED_DEFAULT_LIMIT if limit is None else limit
+    if limit <= 0 or limit > STRUCTURED_MAX_LIMIT:
+        raise FluxQueryError(f"limit must be between 1 and {STRUCTURED_MAX_LIMIT}")
+
+    # --- filter（1 本の predicate にまとめて storage へ pushdown）---
+    preds = [f"r._measurement == {flux_string(measurement)}"]
+
+    for k, v in (tags or {}).items():
+        values = v if isinstance(v, list) else [v]
+        if not values:
+            raise FluxQueryError(f"Empty tag filter: {k}")
+        ors = " or ".join(f"r[{flux_string(k)}] == {flux_string(x)}" for x in values)
+        preds.append(f"({ors})" if len(values) > 1 else ors)
+
+    if fields:
+        ors = " or ".join(f"r._field == {flux_string(f)}" for f in fields)
+        preds.append(f"({ors})" if len(fields) > 1 else ors)
+
+    lines = [
+        f"from(bucket: {flux_string(bucket)})",
+        f"  |> range(start: {_time_literal(start_flux)}, stop: {_time_literal(stop_flux)})",
+        f"  |> filter(fn: (r) => {' and '.join(preds)})",
+    ]
+    if window:
+        lines.append(f"  |> aggregateWindow(every: {window}, fn: {aggregate}, createEmpty: false)")
+    lines.append(f"  |> limit(n: {int(limit)})")
+
+    return "\n".join(lines)
+
+
+def _time_literal(t: str) -> str:
+    # 相対時間・now() はそのまま、絶対時刻は time() で明示
+    if t == "now()" or t.startswith("-"):
+        return t
+    return f"time(v: {flux_string(t)})"
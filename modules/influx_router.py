@@ -0,0 +1,199 @@
+# modules/influx_router.py
+# 複数 Influx ターゲットへの振り分け（bucket_selector の上に載るルーティング層）
+#   INFLUX_TARGETS（JSON 文字列 または JSON ファイルのパス）が無ければ従来どおり
+#   INFLUX_URL / INFLUX_ORG / INFLUX_TOKEN の 1 台に bucket_selector の bucket で書く。
+#
+#   {
+#     "targets": [
+#       {"name": "a", "url": "http://influx-a:8086", "org": "chrono", "token_env": "INFLUX_TOKEN_A",
+#        "bucket": "chrono_trace", "mode": "prod"},
+#       {"name": "b", "url": "http://influx-b:8086", "org": "chrono", "token_env": "INFLUX_TOKEN_B",
+#        "bucket": "chrono_trace", "mode": "prod"},
+#       {"name": "s", "url": "http://influx-s:8086", "org": "chrono", "token": "...",
+#        "bucket": "chrono_test", "mode": "sandbox"}
+#     ],
+#     "rules": [{"measurement": "notion_*", "target": "b"}]
+#   }
+#
+#   - mode が一致するターゲット群（無ければ全ターゲット）を 1 つの ring とし、
+#     measurement の consistent hash で持ち主を決める（ターゲット追加時の移動は約 1/N）
+#   - rules は measurement の glob（任意で mode も）で持ち主を固定する。先に一致したものが優先
+#   - 書き込み先は "target/bucket" の文字列キー（writer / spool はこの文字列で束ねる）。
+#     "/" を含まないキーは既定ターゲットの bucket（単一ターゲット時・旧 spool のレコード）
+#     "/" を含むのに target が設定に無いキー（ターゲットを外す前に spool されたレコードなど）は
+#     InfluxRoutingError（spool はそのレコードを dead letter へ移す）
+
+import bisect
+import fnmatch
+import json
+import os
+from hashlib import blake2b
+from typing import NamedTuple
+
+from modules.bucket_selector import bucket_selector
+
+# ring 上のターゲット 1 台あたりの仮想ノード数
+INFLUX_RING_VNODES = int(os.getenv("INFLUX_RING_VNODES", "64"))
+
+DEFAULT_TARGET = "default"
+
+
+class InfluxTarget(NamedTuple):
+    name: str
+    url: str | None
+    org: str | None
+    token: str | None
+    bucket: str | None = None
+    mode: str | None = None
+
+
+class InfluxRoutingError(ValueError):
+    """ターゲット設定の誤り（起動時の設定読み込みで RuntimeError にする）"""
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(blake2b(s.encode(), digest_size=8).digest(), "big")
+
+
+def _mode(mode: str | None) -> str:
+    # bucket_selector と同じく sandbox 以外は prod 扱い
+    return "sandbox" if mode == "sandbox" else "prod"
+
+
+class InfluxRouter:
+
+    def __init__(self, targets: list[InfluxTarget], rules: list[dict] | None = None,
+                 vnodes: int = INFLUX_RING_VNODES):
+        if not targets:
+            raise InfluxRoutingError("Influx targets are empty")
+
+        self.targets = {t.name: t for t in targets}
+        if len(self.targets) != len(targets):
+            raise InfluxRoutingError("Duplicate Influx target name")
+        for t in targets:
+            if "/" in t.name:
+                raise InfluxRoutingError(f"Invalid target name: {t.name!r}")
+
+        self.rules = list(rules or [])
+        for rule in self.rules:
+            if rule.get("target") not in self.targets:
+                raise InfluxRoutingError(f"Unknown target in rule: {rule.get('target')!r}")
+
+        self.default_target = targets[0].name
+        self.vnodes = vnodes
+        self._rings: dict[str, tuple[list[int], list[str]]] = {}
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.targets) > 1
+
+    # --------------------------
+    # ring（mode ごとに 1 本、初回に構築）
+    # --------------------------
+    def _pool(self, mode: str) -> list[str]:
+        names = [t.name for t in self.targets.values() if t.mode is None or _mode(t.mode) == mode]
+        return names or list(self.targets)
+
+    def _ring(self, mode: str):
+        ring = self._rings.get(mode)
+        if ring is None:
+            nodes = sorted((_hash(f"{name}#{i}"), name)
+                           for name in self._pool(mode) for i in range(self.vnodes))
+            ring = self._rings[mode] = ([h for h, _ in nodes], [name for _, name in nodes])
+        return ring
+
+    def owner(self, mode: str | None, measurement: str) -> str:
+        """measurement を持つターゲット名"""
+        mode = _mode(mode)
+        for rule in self.rules:
+            if rule.get("mode") and _mode(rule["mode"]) != mode:
+                continue
+            if fnmatch.fnmatchcase(measurement, rule.get("measurement", "*")):
+                return rule["target"]
+
+        hashes, names = self._ring(mode)
+        i = bisect.bisect(hashes, _hash(measurement)) % len(hashes)
+        return names[i]
+
+    # --------------------------
+    # 書き込み先キー
+    # --------------------------
+    def _key(self, target: str, mode: str | None, requested_bucket: str | None) -> str:
+        bucket = requested_bucket or self.targets[target].bucket or bucket_selector(mode, None)
+        # "/" を含む bucket は split で target と読み違えないよう常に接頭辞を付ける
+        if target == self.default_target and not self.sharded and "/" not in bucket:
+            return bucket
+        return f"{target}/{bucket}"
+
+    def route(self, mode: str | None, requested_bucket: str | None, measurement: str) -> str:
+        """1 point の書き込み先キー（bucket 指定があればそれを優先、ターゲットは measurement で決定）"""
+        return self._key(self.owner(mode, measurement), mode, requested_bucket)
+
+    def shards(self, mode: str | None, requested_bucket: str | None,
+               measurement: str | None = None) -> list[str]:
+        """クエリの問い合わせ先キー。measurement が分かれば持ち主 1 台、無ければ mode の全ターゲット"""
+        if measurement is not None:
+            return [self.route(mode, requested_bucket, measurement)]
+        targets = self._pool(_mode(mode))
+        # rules で固定されたターゲットは ring の外にいることがある
+        for rule in self.rules:
+            if rule["target"] not in targets and (not rule.get("mode") or _mode(rule["mode"]) == _mode(mode)):
+                targets.append(rule["target"])
+        return [self._key(t, mode, requested_bucket) for t in targets]
+
+    def split(self, key: str) -> tuple[str, str]:
+        """書き込み先キー → (target, bucket)"""
+        target, sep, bucket = key.partition("/")
+        if not sep:
+            return self.default_target, key
+        if target not in self.targets:
+            raise InfluxRoutingError(f"Unknown Influx target in key: {key!r}")
+        return target, bucket
+
+    # --------------------------
+    # 設定の読み込み
+    # --------------------------
+    @classmethod
+    def from_config(cls, config, vnodes: int = INFLUX_RING_VNODES) -> "InfluxRouter":
+        if isinstance(config, list):
+            config = {"targets": config}
+
+        targets = []
+        for i, t in enumerate(config.get("targets") or []):
+            if not isinstance(t, dict) or not t.get("url"):
+                raise InfluxRoutingError(f"targets[{i}]: url required")
+            token = t.get("token")
+            if token is None and t.get("token_env"):
+                token = os.getenv(t["token_env"])
+            targets.append(InfluxTarget(
+                name=str(t.get("name") or f"influx{i}"),
+                url=t["url"],
+                org=t.get("org"),
+                token=token,
+                bucket=t.get("bucket"),
+                mode=t.get("mode"),
+            ))
+        return cls(targets, config.get("rules"), vnodes=vnodes)
+
+    @classmethod
+    def from_env(cls) -> "InfluxRouter":
+        raw = (os.getenv("INFLUX_TARGETS") or "").strip()
+        if not raw:
+            return cls([InfluxTarget(DEFAULT_TARGET, os.getenv("INFLUX_URL"),
+                                     os.getenv("INFLUX_ORG"), os.getenv("INFLUX_TOKEN"))])
+
+        try:
+            if raw[0] in "[{":
+                config = json.loads(raw)
+            else:
+                with open(raw, encoding="utf-8") as f:
+                    config = json.load(f)
+            return cls.from_config(config)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"INFLUX_TARGETS の読み込みに失敗しました: {e}")
+
+
+# ------------------------------------
+# アプリ共有インスタンス（接続はしない。クライアントは utils/influx_client.py がターゲットごとに保持）
+# ------------------------------------
+influx_router = InfluxRouter.from_env()
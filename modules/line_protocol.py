@@ -0,0 +1,255 @@
+# modules/line_protocol.py
+# InfluxDB line protocol
+#   measurement[,tag=value...] field=value[,field=value...] [timestamp]
+#
+#   - measurement：「,」「 」を \ でエスケープ
+#   - tag key / value・field key：「,」「=」「 」を \ でエスケープ
+#   - field value：float / 1i（int）/ 1u（uint）/ t・true・f・false など / "string"（\" \\ をエスケープ）
+#   - timestamp：整数（ns）。省略時は None（サーバ側で時刻を振る）
+#   エスケープも引用符も無い行（大半）は str.split だけで分解する
+#
+# エンコード（LineProtocolEncoder）は influxdb_client の Point.to_line_protocol() と同じバイト列を出す
+#   - tag / field はキー順、None と非有限 float は出さない、float の末尾 ".0" は落とす
+#   - int は "1i"、bool は "true" / "false"、str は "..."
+#   - timestamp は int ns（文字列は RFC3339 として ns に換算）
+#   measurement・キーのエスケープ結果と、series ごとのソート済み tag 部分はキャッシュする
+
+import math
+import os
+import re
+from decimal import Decimal
+
+from modules.timestamps import parse_rfc3339
+
+LINE_PROTOCOL_CACHE_MAX = int(os.getenv("LINE_PROTOCOL_CACHE_MAX", "100000"))
+
+_UNESCAPE = re.compile(r"\\([ ,=])")
+_UNESCAPE_STRING = re.compile(r'\\(["\\])')
+
+_TRUE = frozenset(("t", "T", "true", "True", "TRUE"))
+_FALSE = frozenset(("f", "F", "false", "False", "FALSE"))
+
+
+class LineProtocolError(ValueError):
+    """line protocol の構文エラー（API 側で行ごとの reject）"""
+
+
+def _unescape(s: str) -> str:
+    return _UNESCAPE.sub(r"\1", s) if "\\" in s else s
+
+
+def _split(s: str, sep: str, quoted: bool) -> list[str]:
+    """エスケープ（と quoted なら "..." の中）を除いた sep で分割"""
+    if "\\" not in s and (not quoted or '"' not in s):
+        return s.split(sep)
+
+    parts, start, i, n = [], 0, 0, len(s)
+    in_string = False
+    while i < n:
+        c = s[i]
+        if c == "\\":
+            i += 2
+            continue
+        if quoted and c == '"':
+            in_string = not in_string
+        elif c == sep and not in_string:
+            parts.append(s[start:i])
+            start = i + 1
+        i += 1
+    if in_string:
+        raise LineProtocolError("unterminated string field")
+    parts.append(s[start:])
+    return parts
+
+
+def _pair(s: str, quoted: bool) -> tuple[str, str]:
+    """key=value（最初のエスケープされていない = で分ける）"""
+    key, sep, value = s.partition("=")
+    if "\\" in key:
+        head = _split(s, "=", quoted)
+        key, value = head[0], s[len(head[0]) + 1:]
+        sep = "=" if len(head) > 1 else ""
+    if not sep or not key:
+        raise LineProtocolError(f"invalid key=value: {s!r}")
+    return _unescape(key), value
+
+
+def _field_value(v: str):
+    if not v:
+        raise LineProtocolError("empty field value")
+    if v[0] == '"':
+        if len(v) < 2 or v[-1] != '"':
+            raise LineProtocolError(f"invalid string field: {v!r}")
+        body = v[1:-1]
+        return _UNESCAPE_STRING.sub(r"\1", body) if "\\" in body else body
+    if v in _TRUE:
+        return True
+    if v in _FALSE:
+        return False
+    try:
+        if v[-1] in "iu":
+            return int(v[:-1])
+        return float(v)
+    except ValueError:
+        raise LineProtocolError(f"invalid field value: {v!r}")
+
+
+def parse_line(line: str) -> dict:
+    """1 行 → {"measurement", "tags", "fields", "timestamp"}（timestamp は int ns または None）"""
+    sections = _split(line.strip(), " ", quoted=True)
+    if len(sections) not in (2, 3) or not all(sections):
+        raise LineProtocolError("expected 'measurement[,tags] fields [timestamp]'")
+
+    head = _split(sections[0], ",", quoted=False)
+    measurement = _unescape(head[0])
+    if not measurement:
+        raise LineProtocolError("empty measurement")
+    tags = dict(_pair(t, quoted=False) for t in head[1:])
+    for k, v in tags.items():
+        tags[k] = _unescape(v)
+
+    fields = {}
+    for f in _split(sections[1], ",", quoted=True):
+        key, value = _pair(f, quoted=True)
+        fields[key] = _field_value(value)
+
+    timestamp = None
+    if len(sections) == 3:
+        try:
+            timestamp = int(sections[2])
+        except ValueError:
+            raise LineProtocolError(f"invalid timestamp: {sections[2]!r}")
+
+    return {"measurement": measurement, "tags": tags, "fields": fields, "timestamp": timestamp}
+
+
+# --------------------------
+# エンコード
+# --------------------------
+_ESCAPE_MEASUREMENT = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_KEY = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_STRING = str.maketrans({'"': r'\"', "\\": r"\\"})
+
+
+def _escape_tag_value(value) -> str:
+    s = str(value).translate(_ESCAPE_KEY)
+    # 末尾の \ が区切りの空白をエスケープしないように
+    return s + " " if s.endswith("\\") else s
+
+
+def _field(key: str, value) -> str | None:
+    t = type(value)
+    if t is float:
+        if not math.isfinite(value):
+            return None
+        s = repr(value)
+        return f"{key}={s[:-2] if s.endswith('.0') else s}"
+    if t is str:
+        return f'{key}="{value.translate(_ESCAPE_STRING)}"'
+    if t is bool:
+        return f"{key}={'true' if value else 'false'}"
+    if t is int:
+        return f"{key}={value}i"
+    if value is None:
+        return None
+    # サブクラス / Decimal（通常の ingest では来ない）
+    if isinstance(value, (float, Decimal)):
+        if not math.isfinite(value):
+            return None
+        s = str(value)
+        return f"{key}={s[:-2] if s.endswith('.0') else s}"
+    if isinstance(value, bool):
+        return f"{key}={str(value).lower()}"
+    if isinstance(value, int):
+        return f"{key}={value}i"
+    if isinstance(value, str):
+        return f'{key}="{value.translate(_ESCAPE_STRING)}"'
+    raise ValueError(f'Type: "{t}" of field: "{key}" is not supported.')
+
+
+def _time(timestamp) -> str:
+    if timestamp is None or timestamp == "":
+        return ""
+    if type(timestamp) is int:
+        return f" {timestamp}"
+    if isinstance(timestamp, str):
+        return f" {parse_rfc3339(timestamp)}"
+    if isinstance(timestamp, int):
+        return f" {int(timestamp)}"
+    raise ValueError(timestamp)
+
+
+class LineProtocolEncoder:
+
+    def __init__(self, cache_max: int = LINE_PROTOCOL_CACHE_MAX):
+        self.cache_max = cache_max
+        self._measurements: dict[str, str] = {}
+        self._keys: dict[str, str] = {}
+        self._tag_sets: dict[tuple, str] = {}   # tags.items() のタプル → ",k=v,... "（ソート・エスケープ済み）
+
+    def _cached(self, cache: dict, key, build):
+        value = cache.get(key)
+        if value is None:
+            value = build(key)
+            if len(cache) >= self.cache_max:
+                cache.clear()
+            cache[key] = value
+        return value
+
+    def _measurement(self, name) -> str:
+        return self._cached(self._measurements, name, lambda n: str(n).translate(_ESCAPE_MEASUREMENT))
+
+    def _key(self, key) -> str:
+        return self._cached(self._keys, key, lambda k: str(k).translate(_ESCAPE_KEY))
+
+    def _build_tag_set(self, items: tuple) -> str:
+        parts = []
+        for k, v in sorted(items):
+            if v is None:
+                continue
+            key, value = self._key(k), _escape_tag_value(v)
+            if key and value:
+                parts.append(f"{key}={value}")
+        return f",{','.join(parts)} " if parts else " "
+
+    def _tag_set(self, tags: dict | None) -> str:
+        if not tags:
+            return " "
+        items = tuple(tags.items())
+        try:
+            return self._cached(self._tag_sets, items, self._build_tag_set)
+        except TypeError:
+            # hash できない tag 値（通常の ingest では来ない）
+            return self._build_tag_set(items)
+
+    def encode_point(self, measurement, fields: dict, tags: dict | None = None, timestamp=None) -> str:
+        """1 point → 1 行（改行なし）。field が 1 つも残らなければ ""（Point と同じ）"""
+        key = self._key
+        encoded = []
+        for k in sorted(fields):
+            f = _field(key(k), fields[k])
+            if f is not None:
+                encoded.append(f)
+        if not encoded:
+            return ""
+        return f"{self._measurement(measurement)}{self._tag_set(tags)}{','.join(encoded)}{_time(timestamp)}"
+
+    def encode(self, points: list[dict]) -> bytes:
+        """[{"measurement", "fields", "tags", "timestamp"}, ...] → 改行区切りの 1 つのバッファ"""
+        encode_point = self.encode_point
+        lines = []
+        for p in points:
+            line = encode_point(p["measurement"], p["fields"], p.get("tags"), p.get("timestamp"))
+            if line:
+                lines.append(line)
+        return "\n".join(lines).encode()
+
+    def info(self) -> dict:
+        return {"measurements": len(self._measurements), "keys": len(self._keys),
+                "tag_sets": len(self._tag_sets), "cache_max": self.cache_max}
+
+
+# ------------------------------------
+# アプリ共有インスタンス
+# ------------------------------------
+line_encoder = LineProtocolEncoder()
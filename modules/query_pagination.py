@@ -0,0 +1,144 @@
+# modules/query_pagination.py
+# /query のカーソル方式ページング
+#   並び順は (_time, series key)。series key は _time / _value / _start / _stop / result / table 以外の列
+#   （_measurement・_field・tag）の組
+#   カーソルは「(t, k) まで返した」を表す不透明な文字列（base64url の JSON）
+#     t：最後の行の _time（int ns）、k：その行の series key（None なら t の行は全部返済み）
+#
+#   1 ページの取り方（どちらも range / limit を Flux 側に押し込む）
+#     - 続き：_time > t を _time 順に limit(page_size + 1)
+#       limit で切れた _time の行は全部揃っている保証が無いので、そこより前だけを返す
+#     - 同時刻：_time == t の行（上限 QUERY_MAX_ROWS）を series key 順に並べて k の次から
+#       1 つの時刻に page_size を超える series がある時だけ使う
+#   int ns の _time は Flux の map で _cursor 列として受け取る（datetime は µs までしか持てない）
+
+import base64
+import json
+import os
+
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+QUERY_DEFAULT_PAGE_SIZE = int(os.getenv("QUERY_DEFAULT_PAGE_SIZE", "1000"))
+
+_NOT_SERIES = frozenset(("_time", "_value", "_start", "_stop", "result", "table", "_cursor"))
+
+
+class QueryCursorError(ValueError):
+    """カーソル / page_size の不正（API 側で 400）"""
+
+
+class QueryRowLimitError(RuntimeError):
+    """QUERY_MAX_ROWS を超える結果（API 側で 413）"""
+
+
+# --------------------------
+# カーソル
+# --------------------------
+def encode_cursor(t: int, key: tuple | None) -> str:
+    body = json.dumps({"t": t, "k": [list(kv) for kv in key] if key is not None else None},
+                      separators=(",", ":"))
+    return base64.urlsafe_b64encode(body.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, tuple | None]:
+    try:
+        body = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        t, k = body["t"], body["k"]
+        if type(t) is not int:
+            raise TypeError(t)
+        return t, tuple((str(a), str(b)) for a, b in k) if k is not None else None
+    except (ValueError, TypeError, KeyError):
+        raise QueryCursorError("Invalid cursor")
+
+
+def series_key(row: dict) -> tuple:
+    return tuple((k, str(v)) for k, v in sorted(row.items()) if k not in _NOT_SERIES)
+
+
+# --------------------------
+# Flux（ユーザーのパイプラインの後ろに付ける）
+# --------------------------
+_TAIL = '|> map(fn: (r) => ({r with _cursor: int(v: r._time)}))'
+
+
+def after_stage(t: int | None, limit: int) -> str:
+    where = f"|> filter(fn: (r) => r._time > time(v: {t})) " if t is not None else ""
+    return f'{where}|> group() |> sort(columns: ["_time"]) |> limit(n: {limit}) {_TAIL}'
+
+
+def at_stage(t: int, limit: int) -> str:
+    return f"|> filter(fn: (r) => r._time == time(v: {t})) |> group() |> limit(n: {limit}) {_TAIL}"
+
+
+# --------------------------
+# ページング本体
+#   fetch(stage) → シャードごとの行リスト（各リストは _time 順）
+# --------------------------
+def _order(row: dict) -> tuple:
+    return row["_cursor"], series_key(row)
+
+
+def _same_time(fetch, t: int, max_rows: int) -> list[dict]:
+    rows = [r for part in fetch(at_stage(t, max_rows + 1)) for r in part]
+    if len(rows) > max_rows:
+        raise QueryRowLimitError(f"More than {max_rows} rows share one _time")
+    rows.sort(key=series_key)
+    return rows
+
+
+def _page(rows: list[dict], size: int, t: int) -> tuple[list[dict], str]:
+    """同時刻の行（series key 順）から size 件。残りがあれば (t, 最後の key)、無ければ (t, None) のカーソル"""
+    page = rows[:size]
+    if len(rows) > size:
+        return page, encode_cursor(t, series_key(page[-1]))
+    return page, encode_cursor(t, None)
+
+
+def paginate(fetch, page_size: int, cursor: str | None = None,
+             max_rows: int = QUERY_MAX_ROWS) -> tuple[list[dict], str | None]:
+    """1 ページ分の行と次のカーソル（最後のページなら None）"""
+    if page_size <= 0 or page_size > max_rows:
+        raise QueryCursorError(f"page_size must be between 1 and {max_rows}")
+    t, k = decode_cursor(cursor) if cursor else (None, None)
+
+    # 前のページが同時刻の途中で切れていたら、その続きから
+    page = []
+    if k is not None:
+        rest = [r for r in _same_time(fetch, t, max_rows) if series_key(r) > k]
+        if len(rest) > page_size:
+            page, next_cursor = _page(rest, page_size, t)
+            return _strip(page), next_cursor
+        page = rest
+
+    room = page_size - len(page)
+    parts = fetch(after_stage(t, room + 1))
+    rows = sorted((r for part in parts for r in part), key=_order)
+    truncated = [part[-1]["_cursor"] for part in parts if len(part) > room]
+
+    # limit で切れた時刻より前は全部揃っている（どのシャードも切れていなければ全部）
+    if truncated:
+        cutoff = min(truncated)
+        complete = [r for r in rows if r["_cursor"] < cutoff]
+    else:
+        complete = rows
+        if len(rows) <= room:
+            # 残りが全部このページに収まった
+            return _strip(page + rows), None
+
+    if not complete:
+        if page:
+            return _strip(page), encode_cursor(t, None)
+        # 1 つの時刻だけで page_size を超える
+        page, next_cursor = _page(_same_time(fetch, cutoff, max_rows), page_size, cutoff)
+        return _strip(page), next_cursor
+
+    take = complete[:room]
+    last = take[-1]
+    split = len(complete) > room and complete[room]["_cursor"] == last["_cursor"]
+    next_cursor = encode_cursor(last["_cursor"], series_key(last) if split else None)
+    return _strip(page + take), next_cursor
+
+
+def _strip(rows: list[dict]) -> list[dict]:
+    for r in rows:
+        r.pop("_cursor", None)
+    return rows
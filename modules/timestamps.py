@@ -0,0 +1,88 @@
+# modules/timestamps.py
+# ingest の timestamp → epoch ns（int）
+#   - 整数（数字だけの文字列も）：precision（s / ms / us / ns）で ns に換算。float は秒の小数も可
+#   - 文字列：RFC3339 / ISO 8601（タイムゾーン無しは UTC）を datetime.fromisoformat（C 実装）で解釈し、
+#     epoch ns は整数演算で出す（float を経由しない）。小数秒は 9 桁まで ns で保持
+#   - 正規化後の point の timestamp は int ns か None。Influx へは WritePrecision.NS でそのまま渡す
+#     （influx_client 側で per-point の日付パースをしない）
+
+import re
+from datetime import datetime, timezone
+
+PRECISIONS = {"s": 10 ** 9, "ms": 10 ** 6, "us": 10 ** 3, "ns": 1}
+
+# datetime は µs までなので、7〜9 桁目は文字列から足す
+_SUB_MICRO = re.compile(r"\.\d{6}(\d{1,3})")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class TimestampError(ValueError):
+    """timestamp / precision の解釈エラー（API 側で 422 / 行ごとの reject）"""
+
+
+def precision_factor(precision: str | None) -> int:
+    if precision is None:
+        return 1
+    try:
+        return PRECISIONS[precision]
+    except KeyError:
+        raise TimestampError(f"Unknown precision: {precision} (s / ms / us / ns)")
+
+
+def parse_rfc3339(s: str) -> int:
+    """RFC3339 / ISO 8601 → epoch ns（タイムゾーン無しは UTC）"""
+    try:
+        t = datetime.fromisoformat(s)
+    except ValueError:
+        raise TimestampError(f"Invalid timestamp: {s}")
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+
+    delta = t - _EPOCH
+    ns = (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    # "YYYY-MM-DDTHH:MM:SS.ffffffZ" より長い時だけ 7 桁目以降を探す
+    if len(s) > 27:
+        m = _SUB_MICRO.search(s)
+        if m:
+            digits = m.group(1)
+            ns += int(digits) * 10 ** (3 - len(digits))
+    return ns
+
+
+def to_ns(value, factor: int = 1) -> int | None:
+    """1 件分（factor は precision_factor() の値）"""
+    t = type(value)
+    if value is None or value == "":
+        return None
+    if t is int:
+        return value * factor
+    if t is str:
+        if value.isdigit():
+            return int(value) * factor
+        return parse_rfc3339(value)
+    if t is float:
+        # value * factor だと 1e18 台で丸めが出るので、整数部は整数演算
+        if value != value or value in (float("inf"), float("-inf")):
+            raise TimestampError(f"Invalid timestamp: {value}")
+        whole = int(value)
+        return whole * factor + round((value - whole) * factor)
+    raise TimestampError(f"Invalid timestamp type: {t.__name__}")
+
+
+def to_ns_batch(values: list, factor: int = 1) -> tuple[list, dict[int, str]]:
+    """バッチ分をまとめて換算 → (ns のリスト, {index: エラー})。エラーの位置は None"""
+    # 全部整数（エージェントからの送信で一番多い形）なら掛け算だけ
+    if all(type(v) is int for v in values):
+        return ([v * factor for v in values] if factor != 1 else list(values)), {}
+
+    out = []
+    errors = {}
+    append = out.append
+    for i, v in enumerate(values):
+        try:
+            append(to_ns(v, factor))
+        except TimestampError as e:
+            errors[i] = str(e)
+            append(None)
+    return out, errors
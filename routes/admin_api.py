@@ -0,0 +1,26 @@
+# routes/admin_api.py
+# 運用向け
+#   GET    /admin/cardinality                       : (measurement, tag key) ごとの distinct 数の推定値
+#   DELETE /admin/cardinality/{measurement}/{tag}   : 推定と制限を解除
+
+from fastapi import APIRouter, HTTPException
+
+from utils.cardinality import cardinality_guard
+
+router = APIRouter()
+
+
+@router.get("/cardinality")
+def cardinality(measurement: str | None = None, limit: int = 100):
+    rows = cardinality_guard.estimates(measurement)
+    return {
+        **cardinality_guard.info(),
+        "tags": rows[:max(0, limit)],
+    }
+
+
+@router.delete("/cardinality/{measurement}/{tag}")
+def reset_cardinality(measurement: str, tag: str):
+    if not cardinality_guard.reset(measurement, tag):
+        raise HTTPException(status_code=404, detail=f"No sketch for {measurement}.{tag}")
+    return {"status": "ok", "measurement": measurement, "tag": tag}
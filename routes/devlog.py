@@ -1,9 +1,10 @@
-from fastapi import APIRouter
-from utils.notion_client import NotionClient
-from datetime import datetime
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException
+from utils.notion_client import NotionPageNotFound, NotionRichTextFull
+from utils.notion_scheduler import notion_scheduler, NotionRateLimited
 
 router = APIRouter()
-notion = NotionClient()
 
 @router.post("/devlog/append")
 async def append_devlog(payload: dict):
@@ -13,47 +14,34 @@ async def append_devlog(payload: dict):
         "append_to": "Details",   # "Summary" or "NextAction" も可
         "text": "新しいログを追加します…",
     }
+
+    追記と UpdatedAt（date）の更新は 1 つのジョブとして scheduler へ投入する（rate limit・429 リトライ・同一 key マージ）。
+    Details はページ末尾へ block 追加（NOTION_APPEND_MODE=blocks の場合）、
+    Summary / NextAction は rich_text プロパティの read-modify-write。
     """
 
     key = payload["Key"]
     append_to = payload.get("append_to", "Details")
     new_text = payload["text"]
-
-    # 1. 既存ページ取得
-    page = notion.find_page_by_key(notion.devlog_db, "Key", key)
-    if not page:
+    touched = {"UpdatedAt": {"date": {"start": datetime.now(timezone.utc).isoformat()}}}
+
+    try:
+        _, fut = await notion_scheduler.submit({"mode": "append", "key": key, "append": new_text,
+                                                "append_to": append_to, "props": touched})
+        res = await fut
+    except NotionRateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(int(e.retry_after) or 1)})
+    except NotionPageNotFound:
         return {"status": "error", "message": "page not found", "key": key}
-
-    page_id = page["id"]
-
-    # 2. 既存 rich_text を抽出
-    current_val = page["properties"].get(append_to)
-    if current_val and "rich_text" in current_val:
-        existing_text = "".join([rt["plain_text"] for rt in current_val["rich_text"]])
-    else:
-        existing_text = ""
-
-    # 3. Append（2行以上の追記も自然に）
-    if existing_text:
-        updated_val = existing_text + "\n" + new_text
-    else:
-        updated_val = new_text
-
-    # 4. Notion プロパティ更新
-    props = {
-        append_to: {
-            "rich_text": [
-                {"type": "text", "text": {"content": updated_val}}
-            ]
-        },
-        "UpdatedAt": {"date": {"start": datetime.utcnow().isoformat()}}
-    }
-
-    notion.update_page(page_id, props)
+    except NotionRichTextFull as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     return {
         "status": "ok",
-        "page_id": page_id,
+        "page_id": res.get("id"),
         "append_to": append_to,
         "added_text": new_text
       }
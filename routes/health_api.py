@@ -1,10 +1,89 @@
 # routes/health_api.py
-# ChronoNeura Health Check API (FastAPI版)
+# 疎通確認
+#   GET /        : 生存確認のみ
+#   GET /health  : プロセス内の状態（Influx writer / spool / Notion scheduler）、外部への通信なし
+#   GET /ready   : Influx / Notion へ実際に問い合わせた結果（どちらかが落ちていれば 503）
+#                  INFLUX_TARGETS で複数台ある時は Influx をターゲットごとに "influx:<name>" で返す
+
+import asyncio
+import os
+import time
 
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from routes.ingest_api import normalizer
+from utils.cardinality import cardinality_guard
+from utils.dedup import ingest_dedup
+from utils.influx_client import influx_ping, influx_targets
+from utils.notion_client import notion_ping
+from utils.influx_writer import influx_writer
+from utils.influx_rollup import influx_rollup
+from utils.influx_spool import influx_spool
+from utils.notion_key_index import notion_key_index
+from utils.notion_scheduler import notion_scheduler
+from utils.worker import WORKER_ID, WORKERS
+
+# backend ごとの probe の待ち時間（秒）
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
 
 router = APIRouter()
 
+
+@router.get("/")
+def root():
+    return {
+        "status": "ok",
+        "message": "ChronoNeura Ingest Server — mode-switch enabled",
+    }
+
+
 @router.get("/health")
-def health_check():
-    return {"status": "ok"}
+def health():
+    return {
+        "status": "ok",
+        "worker": {"id": WORKER_ID, "workers": WORKERS},
+        "writer": {
+            "ack": influx_writer.ack_mode,
+            "depth": influx_writer.depth(),
+            **influx_writer.stats,
+        },
+        "spool": influx_spool.lag() if influx_spool else None,
+        "rollup": influx_rollup.info() if influx_rollup.rules else None,
+        "normalizer": normalizer.cache_info(),
+        "dedup": ingest_dedup.info(),
+        "cardinality": cardinality_guard.info(),
+        "notion": {"depth": notion_scheduler.depth(), **notion_scheduler.stats},
+        "key_index": notion_key_index.info(),
+    }
+
+
+async def _probe(check) -> dict:
+    t0 = time.perf_counter()
+    try:
+        ok = await asyncio.wait_for(check(), READY_TIMEOUT)
+        error = None if ok else "ping failed"
+    except asyncio.TimeoutError:
+        error = f"timeout after {READY_TIMEOUT}s"
+    except Exception as e:
+        error = str(e)
+
+    res = {"status": "ok" if error is None else "error",
+           "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if error is not None:
+        res["error"] = error
+    return res
+
+
+@router.get("/ready")
+async def ready():
+    targets = influx_targets()
+    names = ["influx"] if len(targets) == 1 else [f"influx:{t}" for t in targets]
+    *influx, notion = await asyncio.gather(
+        *(_probe(lambda t=t: asyncio.to_thread(influx_ping, t)) for t in targets),
+        _probe(notion_ping),
+    )
+    backends = {**dict(zip(names, influx)), "notion": notion}
+    is_ready = all(b["status"] == "ok" for b in backends.values())
+    return JSONResponse(status_code=200 if is_ready else 503,
+                        content={"status": "ready" if is_ready else "not_ready", "backends": backends})
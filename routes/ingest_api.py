@@ -1,17 +1,33 @@
 # routes/ingest_api.py
 # ChronoNeura Ingest API v1
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import os
+
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
 # 正しい import（modules 配下）
-from utils.influx_client import influx_write_point
+from utils.influx_writer import influx_writer, WriterQueueFull
+from utils.influx_spool import SpoolFull
+from utils.influx_rollup import influx_rollup, RollupLate
+from utils.query_cache import query_cache
+from utils.ndjson import read_records
+from utils.metrics import timed_stage, ingest_duplicates, ingest_cardinality_limited
+from utils.cardinality import cardinality_guard, CardinalityRejected
+from utils.dedup import ingest_dedup, request_key, point_key, INGEST_DEDUP_HASH
+from utils.codec import FastJSONResponse, read_payload
 from modules.bucket_selector import bucket_selector
+from modules.influx_router import influx_router
 from modules.chronotrace_normalizer import ChronoTraceNormalizer
+from modules.timestamps import TimestampError, precision_factor, to_ns, to_ns_batch
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 normalizer = ChronoTraceNormalizer()
 
+# 1 リクエストあたりの最大件数（JSON 配列 / NDJSON 共通）
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "10000"))
+
 
 # --------------------------
 # 入力モデル
@@ -22,42 +38,405 @@ class IngestPayload(BaseModel):
     measurement: str
     fields: dict
     tags: dict | None = None
-    timestamp: str | None = None
+    timestamp: str | int | float | None = None   # RFC3339 または epoch（?precision=s|ms|us|ns、既定 ns）
+
+
+# リクエスト本体は JSON / MessagePack（gzip / zstd 可）を自前でデコードするため、
+# OpenAPI には IngestPayload のスキーマを明示しておく
+def _body_schema(schema: dict) -> dict:
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+
+# --------------------------
+# 軽量バリデーション（IngestPayload と同じ型制約を dict のまま確認）
+#   1 点ごとに pydantic モデルを作らない。エラー文字列 / 問題なければ None
+# --------------------------
+_OPTIONAL_STR = ("bucket", "mode")
+_TIMESTAMP_TYPES = (str, int, float)
+
+
+def _check_payload(item) -> str | None:
+    if not isinstance(item, dict):
+        return "Item must be an object"
+    if not isinstance(item.get("measurement"), str):
+        return "measurement: string required"
+    fields = item.get("fields")
+    if not isinstance(fields, dict):
+        return "fields: object required"
+    tags = item.get("tags")
+    if tags is not None and not isinstance(tags, dict):
+        return "tags: object or null required"
+    # MessagePack の map は str 以外のキー（int / bytes）も持てる
+    if not all(type(k) is str for k in fields):
+        return "fields: keys must be strings"
+    if tags and not all(type(k) is str for k in tags):
+        return "tags: keys must be strings"
+    for k in _OPTIONAL_STR:
+        v = item.get(k)
+        if v is not None and not isinstance(v, str):
+            return f"{k}: string or null required"
+    ts = item.get("timestamp")
+    if ts is not None and (type(ts) not in _TIMESTAMP_TYPES):
+        return "timestamp: string, number or null required"
+    return None
+
+
+# --------------------------
+# timestamp の精度（?precision=s|ms|us|ns、epoch の整数に適用）
+#   正規化後の timestamp は int ns（modules/timestamps.py）
+# --------------------------
+def _precision(precision: str | None) -> int:
+    try:
+        return precision_factor(precision)
+    except TimestampError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# --------------------------
+# 書き込み先
+#   - 書き込み先キー：modules/influx_router.py が正規化後の measurement で決める
+#     （単一ターゲットなら bucket 名そのもの、シャード時は "target/bucket"）
+#   - クエリキャッシュの invalidate は bucket_selector の bucket 単位
+#     （シャードをまたぐ fan-out クエリも同じ単位でキャッシュされる）
+# --------------------------
+def _route(item: dict, point: dict) -> str:
+    return influx_router.route(item.get("mode"), item.get("bucket"), point["measurement"])
+
+
+def _cache_scope(item: dict) -> str:
+    return bucket_selector(item.get("mode"), item.get("bucket"))
+
+
+# --------------------------
+# 正規化（単発）
+# --------------------------
+def _normalize(item: dict, factor: int = 1):
+    point = {
+        "measurement": normalizer.normalize_key(item["measurement"]),
+        "fields": normalizer.normalize_fields(item["fields"]),
+        "tags": normalizer.normalize_tags(item.get("tags")),
+        "timestamp": to_ns(item.get("timestamp"), factor),
+    }
+    return _route(item, point), point
+
+
+# --------------------------
+# tag の cardinality ガード（utils/cardinality.py）
+#   上限を超えた tag key は policy に従って field へ移す / 捨てる / point ごと reject
+#   エラー文字列 / 問題なければ None
+# --------------------------
+def _guard(point: dict) -> str | None:
+    try:
+        limited = cardinality_guard.apply(point)
+    except CardinalityRejected as e:
+        ingest_cardinality_limited.inc("reject")
+        return str(e)
+    if limited:
+        ingest_cardinality_limited.inc(cardinality_guard.policy)
+    return None
+
+
+# --------------------------
+# 重複抑止（utils/dedup.py）
+#   Idempotency-Key ヘッダ：リクエスト単位（バッチなら全体）
+#   INGEST_DEDUP_HASH=1   ：timestamp 付き point の内容ハッシュ
+#   初出の key は書き込みが終わるまで「書き込み中」として Future を持つ
+#   - 書き込み中に届いたリトライは、その結果を待ってから判定する
+#     （成功なら duplicate、失敗なら key が外れているので改めて書き込む）
+#   - INGEST_DEDUP_WAIT 秒待っても終わらなければ DuplicateInFlight（API 側で 409 + Retry-After）
+#   - _settle(ok=False) で key を外して、クライアントのリトライを通す
+# --------------------------
+INGEST_DEDUP_WAIT = float(os.getenv("INGEST_DEDUP_WAIT", "30"))
+
+_writing: dict[int, asyncio.Future] = {}   # 書き込み中の key → 完了で解決
+
+
+class DuplicateInFlight(RuntimeError):
+    """同じ key の書き込みが INGEST_DEDUP_WAIT を過ぎても終わらない"""
+
+
+def _request_key(request: Request) -> int | None:
+    header = request.headers.get("idempotency-key")
+    if not header or not ingest_dedup.enabled:
+        return None
+    return request_key(header)
+
+
+async def _seen(key: int | None, kind: str, claimed: set | None = None) -> bool:
+    """既出なら True。初出なら key を記録して書き込み中にし（claimed にも追加）False"""
+    if key is None:
+        return False
+    while (writing := _writing.get(key)) is not None:
+        if claimed is not None and key in claimed:
+            # 同じリクエスト内の重複
+            break
+        try:
+            await asyncio.wait_for(asyncio.shield(writing), timeout=INGEST_DEDUP_WAIT)
+        except asyncio.TimeoutError:
+            raise DuplicateInFlight("A write with the same key is still in progress")
+
+    if ingest_dedup.seen(key):
+        ingest_duplicates.inc(kind)
+        return True
+    _writing[key] = asyncio.get_running_loop().create_future()
+    if claimed is not None:
+        claimed.add(key)
+    return False
+
+
+def _point_key(bucket: str, point: dict) -> int | None:
+    if not (INGEST_DEDUP_HASH and ingest_dedup.enabled):
+        return None
+    return point_key(bucket, point)
+
+
+def _settle(*keys, ok: bool = True):
+    """書き込み中の key を完了にする（失敗なら key を外してリトライを通す）"""
+    for key in keys:
+        writing = _writing.pop(key, None) if key is not None else None
+        if writing is None:
+            continue
+        if not ok:
+            ingest_dedup.discard(key)
+        if not writing.done():
+            writing.set_result(ok)
+
+
+def _in_flight_error(e: DuplicateInFlight) -> HTTPException:
+    return HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+
+
+# --------------------------
+# 事前集約（utils/influx_rollup.py、INGEST_ROLLUP で指定した measurement のみ）
+#   取り込んだ point は window を閉じた時に集約 point として writer へ流れる
+#   集約済みの window より前の遅着 point は RollupLate（ack せず拒否する）
+# --------------------------
+def _rollup(selected_bucket: str, item: dict, point: dict) -> bool:
+    return influx_rollup.running and influx_rollup.add(selected_bucket, _cache_scope(item), point)
 
 
 # --------------------------
 # Ingest API
 # --------------------------
-@router.post("/ingest")
-async def ingest(payload: IngestPayload):
+@router.post("/ingest", openapi_extra=_body_schema(IngestPayload.model_json_schema()))
+async def ingest(request: Request, precision: str = "ns"):
+
+    factor = _precision(precision)
+    item = await read_payload(request)
+    error = _check_payload(item)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
 
-    # bucket を決定（sandbox / prod）
-    selected_bucket = bucket_selector(payload.mode, payload.bucket)
+    # キーの正規化 ＋ 書き込み先を決定（sandbox / prod、シャード）
+    with timed_stage("normalize"):
+        try:
+            selected_bucket, point = _normalize(item, factor)
+        except TimestampError as e:
+            raise HTTPException(status_code=422, detail=str(e))
 
-    # キーの正規化
-    measurement = normalizer.normalize_key(payload.measurement)
-    fields = normalizer.normalize_fields(payload.fields)
-    tags = {normalizer.normalize_key(k): normalizer.normalize_value(v)
-            for k, v in (payload.tags or {}).items()}
+    error = _guard(point)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+
+    key = _request_key(request)
+    kind = "key"
+    if key is None:
+        key, kind = _point_key(selected_bucket, point), "hash"
+    try:
+        duplicate = await _seen(key, kind)
+    except DuplicateInFlight as e:
+        raise _in_flight_error(e)
+    if duplicate:
+        return FastJSONResponse({
+            "status": "ok",
+            "ack": influx_writer.ack_mode,
+            "bucket": selected_bucket,
+            "duplicate": True,
+            "normalized": point,
+        })
 
+    ok = False
     try:
-        result = influx_write_point(
-            bucket=selected_bucket,
-            measurement=measurement,
-            fields=fields,
-            tags=tags,
-            timestamp=payload.timestamp,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ingest failed: {e}")
-
-    return {
+        try:
+            rolled = _rollup(selected_bucket, item, point)
+        except RollupLate as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if rolled:
+            ok = True
+            return FastJSONResponse({
+                "status": "ok",
+                "ack": "rollup",
+                "bucket": selected_bucket,
+                "normalized": point,
+            })
+
+        try:
+            await influx_writer.write(selected_bucket, [point])
+        except (WriterQueueFull, SpoolFull) as e:
+            raise HTTPException(status_code=503, detail=f"Ingest busy: {e}", headers={"Retry-After": "1"})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ingest failed: {e}")
+        ok = True
+    finally:
+        _settle(key, ok=ok)
+
+    query_cache.invalidate(_cache_scope(item))
+
+    return FastJSONResponse({
         "status": "ok",
+        "ack": influx_writer.ack_mode,
         "bucket": selected_bucket,
-        "normalized": {
-            "measurement": measurement,
-            "fields": fields,
-            "tags": tags,
-            "timestamp": payload.timestamp,
-        },
-    }
+        "normalized": point,
+    })
+
+
+# --------------------------
+# Batch 入力の読み出し
+#   - application/json     : payload の JSON 配列
+#   - application/msgpack  : payload の MessagePack 配列
+#   - application/x-ndjson : 1 行 1 payload のストリーム
+#   いずれも Content-Encoding: gzip / zstd を受け付ける
+# --------------------------
+async def _read_batch(request: Request) -> list:
+    return await read_records(request, INGEST_BATCH_MAX)
+
+
+# --------------------------
+# Batch Ingest API
+# --------------------------
+@router.post("/ingest/batch",
+             openapi_extra=_body_schema({"type": "array", "items": IngestPayload.model_json_schema()}))
+async def ingest_batch(request: Request, precision: str = "ns"):
+
+    factor = _precision(precision)
+
+    # 同じ Idempotency-Key のバッチは本体を読まずに ack
+    req_key = _request_key(request)
+    try:
+        duplicate = await _seen(req_key, "key")
+    except DuplicateInFlight as e:
+        raise _in_flight_error(e)
+    if duplicate:
+        return FastJSONResponse({"status": "ok", "ack": influx_writer.ack_mode, "duplicate": True})
+
+    # 一部でも失敗したバッチはリトライを通す（INGEST_DEDUP_HASH なら成功済みの point は抑止される）
+    ok = False
+    try:
+        res, ok = await _ingest_batch(request, factor)
+        return res
+    finally:
+        _settle(req_key, ok=ok)
+
+
+async def _ingest_batch(request: Request, factor: int = 1):
+    claimed: set[int] = set()     # このリクエストで書き込み中にした point key（未完了のもの）
+
+    def settle(keys, ok: bool):
+        keys = [k for k in keys if k in claimed]
+        claimed.difference_update(keys)
+        _settle(*keys, ok=ok)
+
+    try:
+        return await _ingest_batch_items(request, factor, claimed, settle)
+    finally:
+        # 途中の例外（503 など）で残った key はリトライを通す
+        _settle(*claimed, ok=False)
+
+
+async def _ingest_batch_items(request: Request, factor: int, claimed: set, settle):
+    items = await _read_batch(request)
+    results: list[dict] = [None] * len(items)
+
+    # 1) 検証
+    valid: list[tuple[int, dict]] = []
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[i] = {"index": i, "status": "rejected", "error": f"Invalid JSON: {item}"}
+            continue
+        error = _check_payload(item)
+        if error:
+            results[i] = {"index": i, "status": "rejected", "error": error}
+            continue
+
+        valid.append((i, item))
+
+    # 正規化はバッチ単位（キーキャッシュを共有）→ 書き込み先ごとにグルーピング
+    with timed_stage("normalize_batch"):
+        points = normalizer.normalize_batch(item for _, item in valid)
+        stamps, stamp_errors = to_ns_batch([item.get("timestamp") for _, item in valid], factor)
+    groups: dict[str, list[tuple[int, dict]]] = {}
+    scopes: dict[str, set[str]] = {}
+    point_keys: dict[int, int] = {}
+    for n, ((i, item), point) in enumerate(zip(valid, points)):
+        if n in stamp_errors:
+            results[i] = {"index": i, "status": "rejected", "error": stamp_errors[n]}
+            continue
+        point["timestamp"] = stamps[n]
+        error = _guard(point)
+        if error:
+            results[i] = {"index": i, "status": "rejected", "error": error}
+            continue
+        selected_bucket = _route(item, point)
+        key = _point_key(selected_bucket, point)
+        try:
+            duplicate = await _seen(key, "hash", claimed)
+        except DuplicateInFlight as e:
+            results[i] = {"index": i, "status": "rejected", "bucket": selected_bucket, "error": str(e)}
+            continue
+        if duplicate:
+            results[i] = {"index": i, "status": "accepted", "bucket": selected_bucket, "duplicate": True}
+            continue
+        if key is not None:
+            point_keys[i] = key
+        try:
+            rolled = _rollup(selected_bucket, item, point)
+        except RollupLate as e:
+            settle([key], ok=False)
+            results[i] = {"index": i, "status": "rejected", "bucket": selected_bucket, "error": str(e)}
+            continue
+        if rolled:
+            settle([key], ok=True)
+            results[i] = {"index": i, "status": "accepted", "bucket": selected_bucket, "rollup": True}
+            continue
+        groups.setdefault(selected_bucket, []).append((i, point))
+        scopes.setdefault(selected_bucket, set()).add(_cache_scope(item))
+
+    # 2) bucket ごとに writer へ投入（満杯ならバッチ全体を 503）
+    total = sum(len(entries) for entries in groups.values())
+    if influx_writer.running and influx_writer.depth() + total > influx_writer.queue_max:
+        raise HTTPException(status_code=503, detail="Ingest busy: writer queue full",
+                            headers={"Retry-After": "1"})
+
+    async def _write_group(selected_bucket, entries):
+        keys = [point_keys.get(i) for i, _ in entries]
+        try:
+            await influx_writer.write(selected_bucket, [p for _, p in entries])
+        except (WriterQueueFull, SpoolFull) as e:
+            settle(keys, ok=False)
+            raise HTTPException(status_code=503, detail=f"Ingest busy: {e}", headers={"Retry-After": "1"})
+        except Exception as e:
+            settle(keys, ok=False)
+            for i, _ in entries:
+                results[i] = {"index": i, "status": "rejected", "bucket": selected_bucket,
+                              "error": f"Ingest failed: {e}"}
+            return
+
+        settle(keys, ok=True)
+        for scope in scopes[selected_bucket]:
+            query_cache.invalidate(scope)
+        for i, _ in entries:
+            results[i] = {"index": i, "status": "accepted", "bucket": selected_bucket}
+
+    await asyncio.gather(*(_write_group(b, entries) for b, entries in groups.items()))
+
+    accepted = sum(1 for r in results if r["status"] == "accepted")
+    rejected = len(results) - accepted
+
+    return FastJSONResponse({
+        "status": "ok" if rejected == 0 else ("partial" if accepted else "error"),
+        "ack": influx_writer.ack_mode,
+        "accepted": accepted,
+        "rejected": rejected,
+        "buckets": {b: len(entries) for b, entries in groups.items()},
+        "results": results,
+    }), rejected == 0
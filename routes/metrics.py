@@ -0,0 +1,13 @@
+# routes/metrics.py
+# Prometheus scrape endpoint（GET /metrics）
+
+from fastapi import APIRouter, Response
+
+from utils.metrics import registry, CONTENT_TYPE
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,148 @@
+# routes/notion_api.py
+# SyncBridge → NotionWriter ingest（POST /notion/devlog, /notion/devlog/bulk, GET /notion/devlog/tasks/{id}）
+
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from utils.ndjson import read_records
+from utils.notion_scheduler import notion_scheduler as scheduler, NotionRateLimited, is_unapplied, task_owner
+from utils.worker import WORKER_ID
+
+# bulk import：1 リクエストの最大件数 / 未送信エラー時の再試行回数と初回待ち（秒、倍々）
+NOTION_BULK_MAX = int(os.getenv("NOTION_BULK_MAX", "1000"))
+NOTION_BULK_RETRIES = int(os.getenv("NOTION_BULK_RETRIES", "2"))
+NOTION_BULK_BACKOFF = float(os.getenv("NOTION_BULK_BACKOFF", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+# -------- Input data model --------
+class NotionIngestModel(BaseModel):
+    mode: str = "create"    # create / upsert / append
+    key: str | None = None
+    title: str | None = None
+    summary: str | None = None
+    details: str | None = None
+    category: list[str] | None = None
+    append: str | None = None
+
+
+# -------- API route --------
+@router.post("/devlog")
+async def ingest_devlog(data: NotionIngestModel, wait: bool = True):
+    """
+    NotionWriter への書き込みを scheduler に投入する ingest endpoint
+      wait=true  : 書き込み結果（page_id / url）を待って返す
+      wait=false : 受付のみ（202 + task_id）
+    """
+    try:
+        task_id, fut = await scheduler.submit(data.dict())
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not wait:
+        return JSONResponse(status_code=202, content={"status": "accepted", "task_id": task_id})
+
+    try:
+        res = await fut
+        return {
+            "status": "success",
+            "task_id": task_id,
+            "page_id": res.get("id"),
+            "url": res.get("url")
+        }
+    except NotionRateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(int(e.retry_after) or 1)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# -------- bulk import --------
+async def _read_bulk(request: Request) -> list:
+    """JSON / MessagePack の配列 または NDJSON（1 行 1 レコード）"""
+    return await read_records(request, NOTION_BULK_MAX, "Bulk")
+
+
+async def _import_one(index: int, data: dict) -> dict:
+    """scheduler 経由で 1 件書き込む
+    create / append は冪等でないので、Notion に届いていないと分かるエラー（接続失敗）だけ backoff して再投入する。
+    5xx / タイムアウトは反映済みかもしれないのでそのまま error で返す
+    （同一 key にマージされた append は全員が同じ例外を受け取るため、ここで再投入すると重複する）"""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            task_id, fut = await scheduler.submit(data)
+            res = await fut
+            return {"index": index, "status": "success", "task_id": task_id,
+                    "page_id": res.get("id"), "url": res.get("url"), "attempts": attempt}
+        except NotionRateLimited as e:
+            return {"index": index, "status": "error", "error": str(e),
+                    "retry_after": e.retry_after, "attempts": attempt}
+        except Exception as e:
+            if attempt > NOTION_BULK_RETRIES or not is_unapplied(e):
+                return {"index": index, "status": "error", "error": str(e), "attempts": attempt}
+            await asyncio.sleep(NOTION_BULK_BACKOFF * 2 ** (attempt - 1))
+
+
+@router.post("/devlog/bulk")
+async def ingest_devlog_bulk(request: Request):
+    """
+    NotionIngestModel の JSON 配列 / NDJSON をまとめて書き込む
+      - upsert / append の key は 100 件ずつの or クエリで先に index へ解決
+      - 実行は scheduler（rate limit・同一 key マージ・NOTION_CONCURRENCY 並列）
+      - レコードごとの結果を index 順で返す
+    """
+    items = await _read_bulk(request)
+
+    results: list = [None] * len(items)
+    records = []
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[i] = {"index": i, "status": "error", "error": f"Invalid JSON: {item}"}
+            continue
+        try:
+            data = NotionIngestModel.model_validate(item).model_dump()
+        except ValidationError as e:
+            results[i] = {"index": i, "status": "error", "error": e.errors(include_url=False)}
+            continue
+        records.append((i, data))
+
+    keys = [d["key"] for _, d in records if d["mode"] in ("upsert", "append")]
+    try:
+        await scheduler.resolve_keys(keys)
+    except Exception as e:
+        # 解決できなくても書き込み側が query_by_key にフォールバックする
+        logger.warning("notion bulk key resolve failed: %s", e)
+
+    done = await asyncio.gather(*(_import_one(i, d) for i, d in records))
+    for r in done:
+        results[r["index"]] = r
+
+    failed = sum(1 for r in results if r["status"] != "success")
+    return {
+        "status": "ok" if failed == 0 else ("error" if failed == len(results) else "partial"),
+        "accepted": len(results) - failed,
+        "rejected": failed,
+        "results": results,
+    }
+
+
+@router.get("/devlog/tasks/{task_id}")
+def devlog_task(task_id: str):
+    status = scheduler.task_status(task_id)
+    if status is None:
+        # 結果の履歴はワーカープロセスごと。別ワーカーのタスクなら理由を返す
+        owner = task_owner(task_id)
+        if owner is not None and owner != (WORKER_ID or "0"):
+            raise HTTPException(status_code=404,
+                                detail=f"task belongs to worker {owner}; task status is kept per worker process")
+        raise HTTPException(status_code=404, detail="task not found")
+    return status
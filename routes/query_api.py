@@ -1,24 +1,260 @@
 # routes/query_api.py
 
-from fastapi import APIRouter, HTTPException
-from utils.influx_client import influx_query
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from utils.influx_client import influx_query, influx_query_flux, influx_query_stream, influx_query_csv
+from utils.query_cache import query_cache
 from modules.bucket_selector import bucket_selector
+from modules.influx_router import influx_router
+from modules.flux_builder import build_flux, FluxQueryError
+from modules.query_pagination import (
+    QUERY_MAX_ROWS, QUERY_DEFAULT_PAGE_SIZE, QueryCursorError, QueryRowLimitError, paginate,
+)
+from routes.ingest_api import normalizer
 
 router = APIRouter()
 
+# ストリーミング時に 1 チャンクへまとめるレコード数
+STREAM_CHUNK_ROWS = 500
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+# --------------------------
+# 出力形式の決定（format= が優先、無ければ Accept）
+# --------------------------
+def _stream_format(request: Request, fmt: str | None) -> str | None:
+    if fmt:
+        if fmt not in STREAM_FORMATS and fmt != "json":
+            raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+        return None if fmt == "json" else fmt
+
+    accept = request.headers.get("accept", "")
+    for name, media_type in STREAM_FORMATS.items():
+        if media_type in accept:
+            return name
+    return None
+
+
+def _json_default(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    return str(o)
+
+
+# --------------------------
+# チャンク単位のエンコーダ（メモリは STREAM_CHUNK_ROWS 分のみ）
+# --------------------------
+def _encode_ndjson(records):
+    lines = []
+    for values in records:
+        lines.append(json.dumps(values, default=_json_default, ensure_ascii=False))
+        if len(lines) >= STREAM_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _encode_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+        if n >= STREAM_CHUNK_ROWS:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+            n = 0
+    if n:
+        yield buf.getvalue().encode()
+
+
+def _prime(gen):
+    """最初の 1 件を先読みし、クエリエラーをレスポンス開始前に検出する"""
+    first = next(gen, None)
+    if first is None:
+        return iter(())
+
+    def chained():
+        yield first
+        yield from gen
+
+    return chained()
+
+
+# --------------------------
+# シャードの連結（modules/influx_router.py）
+#   measurement 指定があれば持ち主の 1 台、無ければ mode の全ターゲットへ問い合わせる
+#   （measurement は ingest と同じ normalizer で正規化してから振り分ける。書き込み時の名前で持ち主が決まる）
+#   CSV は 2 台目以降のヘッダ行を落とす
+# --------------------------
+def _chain_shards(source, shards: list[str], q: str, header: bool):
+    for n, shard in enumerate(shards):
+        rows = source(shard, q)
+        if header and n > 0:
+            next(rows, None)
+        yield from rows
+
+
+# --------------------------
+# ページング（modules/query_pagination.py）
+#   page_size / cursor のどちらかがあれば 1 ページ分と next_cursor を返す
+#   各ページはシャードごとに range / limit を押し込んだ Flux で取る（サーバのメモリは 1 ページ分）
+# --------------------------
+def _fetch_pages(shards: list[str], q: str):
+    def fetch(stage: str):
+        return [influx_query(bucket=shard, query=f"{q} {stage}") for shard in shards]
+    return fetch
+
 
 @router.get("/query")
-async def query_api(mode: str = "prod", bucket: str | None = None, q: str = ""):
+async def query_api(request: Request, mode: str = "prod", bucket: str | None = None, q: str = "",
+                    format: str | None = None, measurement: str | None = None,
+                    page_size: int | None = None, cursor: str | None = None):
 
     selected_bucket = bucket_selector(mode, bucket)
+    if measurement is not None:
+        measurement = normalizer.normalize_key(measurement)
+    shards = influx_router.shards(mode, bucket, measurement)
+    paged = page_size is not None or cursor is not None
+
+    # --- ストリーミング（NDJSON / CSV）---
+    stream_format = _stream_format(request, format)
+    if stream_format and paged:
+        raise HTTPException(status_code=400, detail="page_size / cursor are not supported with streaming formats")
+    if stream_format:
+        source = influx_query_csv if stream_format == "csv" else influx_query_stream
+        try:
+            rows = await run_in_threadpool(
+                _prime, _chain_shards(source, shards, q, header=stream_format == "csv"))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+        body = _encode_csv(rows) if stream_format == "csv" else _encode_ndjson(rows)
+        return StreamingResponse(
+            body,
+            media_type=STREAM_FORMATS[stream_format],
+            headers={"X-Bucket": ",".join(shards)},
+        )
+
+    # --- 通常 JSON（キャッシュ経由、同一クエリの同時実行は合流）---
+    #   ページング無しは QUERY_MAX_ROWS 件まで（超えたら 413、page_size で取り直してもらう）
+    if paged:
+        size = page_size or QUERY_DEFAULT_PAGE_SIZE
+
+        async def load():
+            return await run_in_threadpool(paginate, _fetch_pages(shards, q), size, cursor)
+
+        cache_query = f"page:{size}:{cursor or ''}:{','.join(shards)}:{q}"
+    else:
+        async def load():
+            parts = await asyncio.gather(
+                *(run_in_threadpool(influx_query, bucket=shard, query=q, max_rows=QUERY_MAX_ROWS)
+                  for shard in shards))
+            rows = [row for part in parts for row in part]
+            if len(rows) > QUERY_MAX_ROWS:
+                raise QueryRowLimitError(f"Query returned more than {QUERY_MAX_ROWS} rows")
+            return rows
+
+        # キャッシュは bucket 単位で invalidate される。問い合わせ先が bucket と異なる時はキーに含める
+        cache_query = q if shards == [selected_bucket] else f"{','.join(shards)}:{q}"
 
     try:
-        results = influx_query(bucket=selected_bucket, query=q)
+        results = await query_cache.get(selected_bucket, cache_query, load)
+    except QueryCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryRowLimitError as e:
+        raise HTTPException(status_code=413, detail=f"{e}; use page_size / cursor")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
-    return {
+    res = {
         "bucket": selected_bucket,
         "query": q,
+    }
+    if paged:
+        res["results"], res["next_cursor"] = results
+    else:
+        res["results"] = results
+    if influx_router.sharded:
+        res["shards"] = shards
+    return res
+
+
+# --------------------------
+# 構造化クエリ（range / filter / projection / window をサーバ側で組み立て）
+# --------------------------
+class StructuredQuery(BaseModel):
+    mode: str = "prod"
+    bucket: str | None = None
+    measurement: str
+    start: str                      # "-1h" / RFC3339
+    stop: str | None = None         # 省略時 now()
+    tags: dict[str, str | list[str]] | None = None
+    fields: list[str] | None = None
+    window: str | None = None       # "1m" など
+    aggregate: str | None = None    # mean / max / ...
+    limit: int | None = None
+
+
+@router.post("/structured")
+async def structured_query(body: StructuredQuery):
+
+    selected_bucket = bucket_selector(body.mode, body.bucket)
+
+    # measurement の持ち主のシャードだけへ問い合わせる（ingest と同じく正規化後の名前で）
+    measurement = normalizer.normalize_key(body.measurement)
+    target, shard_bucket = influx_router.split(
+        influx_router.route(body.mode, body.bucket, measurement))
+
+    try:
+        flux = build_flux(
+            bucket=shard_bucket,
+            measurement=measurement,
+            start=body.start,
+            stop=body.stop,
+            tags=body.tags,
+            fields=body.fields,
+            window=body.window,
+            aggregate=body.aggregate,
+            limit=body.limit,
+        )
+    except FluxQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def load():
+        return await run_in_threadpool(influx_query_flux, flux, target)
+
+    cache_query = f"{target}:{flux}" if influx_router.sharded else flux
+    try:
+        results = await query_cache.get(selected_bucket, cache_query, load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+    res = {
+        "bucket": selected_bucket,
+        "flux": flux,
         "results": results,
     }
+    if influx_router.sharded:
+        res["shard"] = target
+    return res
+
+
+@router.get("/cache/stats")
+async def query_cache_stats():
+    return query_cache.stats()
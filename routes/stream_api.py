@@ -0,0 +1,397 @@
+# routes/stream_api.py
+# ChronoNeura Stream Ingest
+#   1 本の接続で point を送り続ける長時間の ingest（リクエストごとの HTTP 処理 / JSON 応答を省く）
+#     WS   /ingest/stream : 1 メッセージに 1 行以上。空メッセージで送信終了（最終 ack の後に close）
+#     POST /ingest/stream : chunked 転送の本体（Content-Encoding: gzip / zstd 可）、応答は NDJSON の ack ストリーム
+#   1 行は JSON（"{" で始まる、/ingest と同じ payload）または line protocol（modules/line_protocol.py）
+#   mode / bucket / precision（epoch の単位 s|ms|us|ns）はクエリパラメータで接続ごとに指定
+#   （JSON 行の mode / bucket が優先）
+#
+#   - 行は届いた順に検証し、STREAM_BATCH 行 / STREAM_FLUSH_INTERVAL 秒ごとにまとめて正規化 → writer へ投入
+#     （cardinality ガード・重複抑止・rollup・シャードの振り分けは /ingest/batch と同じ）
+#   - ack は累積：{"seq": n, "accepted": a, "rejected": r, "errors": [{"line", "error"}]}
+#       seq 行目まで処理（writer の ack_mode に従った書き込み）が終わった。a + r == seq
+#       行番号は空行・# コメント行を除いた 1 始まりの通し番号、errors は前回の ack 以降の分
+#   - flow control：writer のキューが STREAM_HIGH_WATER を超えたら受信を止め（TCP の背圧）、
+#     STREAM_LOW_WATER まで減ったら再開する。止めている間は {"pause": true}、再開時に {"pause": false}
+#   - それでも writer / spool が満杯で投入できなければ、その行を reject にして {"error", "overloaded": true}
+#     → 投入済みの分の最終 ack で終える（WS は 1013 で close）。クライアントは seq の続きから再送する
+#   - line protocol の field は型を保つ（5i → int、true → bool）。JSON 行の数値は /ingest と同じく float
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from modules.line_protocol import parse_line
+from modules.chronotrace_normalizer import TYPED_FIELDS
+from modules.timestamps import to_ns_batch
+from routes.ingest_api import (
+    normalizer, _check_payload, _guard, _route, _cache_scope, _point_key, _seen, _settle, _rollup, _precision,
+    DuplicateInFlight,
+)
+from utils.codec import iter_body, json_dumps, json_loads
+from utils.influx_rollup import RollupLate
+from utils.influx_writer import influx_writer, WriterQueueFull
+from utils.influx_spool import SpoolFull
+from utils.metrics import timed_stage
+from utils.query_cache import query_cache
+
+router = APIRouter()
+
+STREAM_BATCH = int(os.getenv("STREAM_BATCH", "1000"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.2"))
+STREAM_ACK_INTERVAL = float(os.getenv("STREAM_ACK_INTERVAL", "1.0"))
+STREAM_MAX_LINE = int(os.getenv("STREAM_MAX_LINE", str(1024 * 1024)))
+STREAM_MAX_ERRORS = int(os.getenv("STREAM_MAX_ERRORS", "100"))
+STREAM_HIGH_WATER = float(os.getenv("STREAM_HIGH_WATER", "0.8"))
+STREAM_LOW_WATER = float(os.getenv("STREAM_LOW_WATER", "0.5"))
+
+# 受信側で先読みするチャンク数（これ以上は読まずに TCP の背圧に任せる）
+STREAM_READ_AHEAD = 4
+
+
+class StreamError(ValueError):
+    """ストリームを続けられないエラー（行が長すぎる / 本体の展開失敗 など）"""
+
+
+# --------------------------
+# 1 接続分の状態
+# --------------------------
+class _StreamSession:
+
+    def __init__(self, mode: str | None, bucket: str | None, factor: int = 1):
+        self.mode = mode
+        self.bucket = bucket
+        self.factor = factor
+
+        self.lines = 0             # 受信した行数（= 行番号）
+        self.seq = 0               # 処理が終わった行数（累積 ack）
+        self.accepted = 0
+        self.rejected = 0
+
+        self._carry = b""
+        self._buffer: list[tuple[int, dict]] = []
+        self._flushed = 0          # writer へ渡した行数
+        self._flushed_at = time.monotonic()
+        self._rejects: list[tuple[int, str]] = []       # seq 未到達の reject
+        self._errors: list[dict] = []                    # 次の ack で返す reject
+        self._inflight: deque = deque()                  # (end, accepted, [(fut, lines, bucket, scopes, keys)])
+        self._acked = (0, 0, 0)
+        self._acked_at = time.monotonic()
+
+    # ---------------------------------------------------------
+    # 受信
+    # ---------------------------------------------------------
+    def feed(self, data: bytes):
+        buf = self._carry + data
+        *lines, self._carry = buf.split(b"\n")
+        if len(self._carry) > STREAM_MAX_LINE:
+            raise StreamError(f"Line too long (max {STREAM_MAX_LINE} bytes)")
+        for line in lines:
+            self._line(line)
+
+    def end(self):
+        if self._carry:
+            self._line(self._carry)
+            self._carry = b""
+
+    def _line(self, raw: bytes):
+        line = raw.strip()
+        if not line or line[:1] == b"#":
+            return
+        self.lines += 1
+        n = self.lines
+
+        try:
+            if line[:1] == b"{":
+                item = json_loads(line)
+                error = _check_payload(item)
+                if error:
+                    raise ValueError(error)
+            else:
+                item = parse_line(line.decode())
+                item[TYPED_FIELDS] = True
+        except ValueError as e:
+            self._rejects.append((n, str(e)))
+            return
+
+        if item.get("mode") is None:
+            item["mode"] = self.mode
+        if item.get("bucket") is None:
+            item["bucket"] = self.bucket
+        self._buffer.append((n, item))
+
+    def due(self) -> bool:
+        return len(self._buffer) >= STREAM_BATCH or (
+            self.lines > self._flushed and time.monotonic() - self._flushed_at >= STREAM_FLUSH_INTERVAL)
+
+    # ---------------------------------------------------------
+    # writer へ投入（flow control の通知を yield）
+    # ---------------------------------------------------------
+    async def flush(self):
+        self._flushed_at = time.monotonic()
+        if self.lines == self._flushed:
+            return
+        entries, self._buffer = self._buffer, []
+        self._flushed = self.lines
+
+        # 1 チャンクに多数の行が来ても writer へは STREAM_BATCH 行ずつ渡す（flow control の単位）
+        for i in range(0, len(entries), STREAM_BATCH) or [0]:
+            part = entries[i:i + STREAM_BATCH]
+            end = part[-1][0] if i + STREAM_BATCH < len(entries) else self._flushed
+            async for msg in self._submit(part, end):
+                yield msg
+
+    async def _submit(self, entries: list[tuple[int, dict]], end: int):
+        with timed_stage("normalize_batch"):
+            points = normalizer.normalize_batch(item for _, item in entries)
+            stamps, stamp_errors = to_ns_batch([item.get("timestamp") for _, item in entries], self.factor)
+
+        accepted = 0
+        groups: dict[str, list] = {}
+        claimed: set[int] = set()
+        for j, ((n, item), point) in enumerate(zip(entries, points)):
+            if j in stamp_errors:
+                self._rejects.append((n, stamp_errors[j]))
+                continue
+            point["timestamp"] = stamps[j]
+            error = _guard(point)
+            if error:
+                self._rejects.append((n, error))
+                continue
+            selected_bucket = _route(item, point)
+            key = _point_key(selected_bucket, point)
+            try:
+                duplicate = await _seen(key, "hash", claimed)
+            except DuplicateInFlight as e:
+                self._rejects.append((n, str(e)))
+                continue
+            try:
+                rolled = not duplicate and _rollup(selected_bucket, item, point)
+            except RollupLate as e:
+                _settle(key, ok=False)
+                claimed.discard(key)
+                self._rejects.append((n, str(e)))
+                continue
+            if duplicate or rolled:
+                if not duplicate:
+                    _settle(key)
+                    claimed.discard(key)
+                accepted += 1
+                continue
+            group = groups.setdefault(selected_bucket, ([], [], set(), []))
+            group[0].append(n)
+            group[1].append(point)
+            group[2].add(_cache_scope(item))
+            if key is not None:
+                group[3].append(key)
+
+        total = sum(len(g[1]) for g in groups.values())
+        batch = []
+        try:
+            async for msg in self._wait_for_room(total):
+                yield msg
+
+            if not influx_writer.running:
+                await influx_writer.start()
+            for selected_bucket, (lines, pts, scopes, keys) in list(groups.items()):
+                fut = influx_writer.submit(selected_bucket, pts)
+                del groups[selected_bucket]
+                # 書き込み中の key は writer の結果で完了にする（ack の送出とは独立）
+                fut.add_done_callback(
+                    lambda f, keys=keys: _settle(*keys, ok=not f.cancelled() and f.exception() is None))
+                claimed.difference_update(keys)
+                batch.append((fut, lines, selected_bucket, scopes, keys))
+        except (WriterQueueFull, SpoolFull) as e:
+            # 投入できなかった行は reject として返す（seq はこの範囲の終わりまで進む）
+            for lines, *_ in groups.values():
+                self._rejects.extend((n, f"Ingest overloaded: {e}") for n in lines)
+            raise
+        finally:
+            # 投入前に切断 / 満杯になった分はリトライを通す
+            _settle(*claimed, ok=False)
+            self._inflight.append((end, accepted, batch))
+
+    async def _wait_for_room(self, n: int):
+        queue_max = influx_writer.queue_max
+        if not influx_writer.running or influx_writer.depth() + n <= queue_max * STREAM_HIGH_WATER:
+            return
+
+        yield {"pause": True, "depth": influx_writer.depth()}
+        while influx_writer.depth() > queue_max * STREAM_LOW_WATER or (
+                influx_writer.depth() and influx_writer.depth() + n > queue_max):
+            await asyncio.sleep(0.05)
+            ack = self.ack()
+            if ack:
+                yield ack
+        yield {"pause": False, "depth": influx_writer.depth()}
+
+    # ---------------------------------------------------------
+    # ack（先頭から書き込みの終わった範囲だけ seq を進める）
+    # ---------------------------------------------------------
+    def _reap(self):
+        while self._inflight:
+            end, accepted, batch = self._inflight[0]
+            if not all(fut.done() for fut, *_ in batch):
+                break
+            self._inflight.popleft()
+
+            self.accepted += accepted
+            for fut, lines, _, scopes, keys in batch:
+                e = fut.exception()
+                if e is None:
+                    self.accepted += len(lines)
+                    for scope in scopes:
+                        query_cache.invalidate(scope)
+                else:
+                    self._rejects.extend((n, f"Ingest failed: {e}") for n in lines)
+
+            self.seq = end
+            done = [r for r in self._rejects if r[0] <= end]
+            self._rejects = [r for r in self._rejects if r[0] > end]
+            self.rejected += len(done)
+            for n, error in sorted(done):
+                if len(self._errors) < STREAM_MAX_ERRORS:
+                    self._errors.append({"line": n, "error": error})
+
+    def ack(self, force: bool = False) -> dict | None:
+        self._reap()
+        state = (self.seq, self.accepted, self.rejected)
+        if not force and (state == self._acked or time.monotonic() - self._acked_at < STREAM_ACK_INTERVAL):
+            return None
+
+        msg = {"seq": self.seq, "accepted": self.accepted, "rejected": self.rejected}
+        if self._errors:
+            msg["errors"], self._errors = self._errors, []
+        self._acked, self._acked_at = state, time.monotonic()
+        return msg
+
+    async def drain(self):
+        """投入済みの書き込みを全て待って最終 ack を yield"""
+        futures = [fut for _, _, batch in self._inflight for fut, *_ in batch]
+        if futures:
+            await asyncio.wait(futures)
+        msg = self.ack(force=True)
+        msg["final"] = True
+        yield msg
+
+
+# --------------------------
+# 受信と送信の駆動（WS / HTTP 共通）
+#   受信は別タスクで有界キューへ。flow control で止めている間はキューが詰まり、受信も止まる
+# --------------------------
+async def _pump(chunks, queue: asyncio.Queue):
+    try:
+        async for chunk in chunks:
+            await queue.put(chunk)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(None)
+
+
+async def _drive(session: _StreamSession, chunks):
+    """ack / flow control / エラーのフレームを yield。writer / spool が満杯なら
+    {"error", "overloaded": True} を返し、投入済みの分の最終 ack で終える（続きはクライアントが seq から再送）"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_READ_AHEAD)
+    reader = asyncio.create_task(_pump(chunks, queue))
+    try:
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), timeout=STREAM_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    chunk = b""
+                if chunk is None:
+                    break
+                try:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    session.feed(chunk)
+                except Exception as e:
+                    # 受信側のエラー（行が長すぎる / 展開失敗 / 切断）：受け取り済みの行は書いてから終える
+                    yield {"error": getattr(e, "detail", None) or str(e) or type(e).__name__}
+                    break
+
+                if session.due():
+                    async for msg in session.flush():
+                        yield msg
+                ack = session.ack()
+                if ack:
+                    yield ack
+
+            session.end()
+            async for msg in session.flush():
+                yield msg
+        except (WriterQueueFull, SpoolFull) as e:
+            yield {"error": f"Ingest overloaded: {e}", "overloaded": True}
+
+        async for msg in session.drain():
+            yield msg
+    finally:
+        reader.cancel()
+
+
+# --------------------------
+# WebSocket
+# --------------------------
+async def _ws_chunks(ws: WebSocket):
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        data = message.get("bytes") or (message.get("text") or "").encode()
+        if not data:
+            return      # 空メッセージ = 送信終了
+        # メッセージの境界は行の境界
+        yield data + b"\n"
+
+
+@router.websocket("/stream")
+async def stream_ws(ws: WebSocket, mode: str | None = None, bucket: str | None = None,
+                    precision: str = "ns"):
+    await ws.accept()
+    try:
+        session = _StreamSession(mode, bucket, _precision(precision))
+    except HTTPException as e:
+        await ws.send_json({"error": e.detail})
+        await ws.close(code=1008)
+        return
+    try:
+        code = 1000
+        async for msg in _drive(session, _ws_chunks(ws)):
+            if msg.get("overloaded"):
+                code = 1013     # Try Again Later
+            await ws.send_json(msg)
+        await ws.close(code=code)
+    except (WebSocketDisconnect, RuntimeError):
+        # 送信中に切断された（投入済みの分は writer が書く。未投入の行は ack していない）
+        pass
+
+
+# --------------------------
+# chunked HTTP
+# --------------------------
+class _DuplexResponse(StreamingResponse):
+    """本体の受信と並行して応答を返す
+    （StreamingResponse の切断監視は receive を呼ぶため本体の読み出しと取り合いになる。
+      切断は本体の読み出し側で ClientDisconnect として検出する）"""
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+@router.post("/stream")
+async def stream_http(request: Request, mode: str | None = None, bucket: str | None = None,
+                      precision: str = "ns"):
+    session = _StreamSession(mode, bucket, _precision(precision))
+
+    async def body():
+        async for msg in _drive(session, iter_body(request, capped=False)):
+            yield json_dumps(msg) + b"\n"
+
+    return _DuplexResponse(body(), media_type="application/x-ndjson")
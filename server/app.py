@@ -0,0 +1,96 @@
+# server/app.py
+# ChronoNeura Ingest Server - アプリファクトリ
+#   Influx ingest / query と Notion devlog を 1 つの FastAPI にまとめる。
+#   uvicorn "server.app:create_app" --factory、または python -m server.serve（マルチワーカー）で起動する。
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from routes.admin_api import router as admin_router
+from routes.devlog import router as devlog_router
+from routes.health_api import router as health_router
+from routes.ingest_api import router as ingest_router
+from routes.metrics import router as metrics_router
+from routes.notion_api import router as notion_router
+from routes.query_api import router as query_router
+from routes.stream_api import router as stream_router
+from utils.influx_client import close_client as close_influx_client
+from utils.influx_rollup import influx_rollup
+from utils.influx_spool import influx_spool
+from utils.influx_writer import influx_writer
+from utils.metrics import MetricsMiddleware, registry
+from utils.notion_client import close_shared_writers
+from utils.notion_key_index import notion_key_index
+from utils.notion_scheduler import notion_scheduler
+
+
+# ----------------------------
+# lifespan
+#   起動：spool（replay）→ Influx writer → rollup → Notion scheduler → key index の差分更新
+#   停止：key index 更新を止め、rollup の開いている window を writer へ流し、
+#         Notion / Influx の投入済み分を drain してから
+#         spool の replay を止め、接続プールを閉じる
+#   Influx / Notion のクライアントは初回使用時に生成する（起動時に backend へ接続しない）
+# ----------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if influx_spool:
+        await influx_spool.start()
+    await influx_writer.start()
+    await influx_rollup.start()
+    await notion_scheduler.start()
+    index_task = asyncio.create_task(notion_key_index.keep_fresh(
+        lambda: notion_scheduler.writer, acquire=notion_scheduler.bucket.acquire))
+    try:
+        yield
+    finally:
+        index_task.cancel()
+        await notion_scheduler.stop()
+        await influx_rollup.stop()
+        await influx_writer.stop()
+        if influx_spool:
+            await influx_spool.stop()
+        await close_shared_writers()
+        await asyncio.to_thread(close_influx_client)
+        notion_key_index.save()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="ChronoNeura Ingest Server",
+        description="Influx ingest / query + SyncBridge → NotionWriter",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+
+    # メトリクス（GET /metrics、route ごとの latency / bytes in）
+    app.add_middleware(MetricsMiddleware)
+    registry.gauge("chrono_influx_writer_queue_depth", "Points waiting in the Influx batch writer",
+                   influx_writer.depth)
+    registry.gauge("chrono_rollup_open_series", "Series with an open rollup window",
+                   influx_rollup.depth)
+    registry.gauge("chrono_notion_queue_depth", "Notion writes waiting in the scheduler",
+                   notion_scheduler.depth)
+    if influx_spool:
+        registry.gauge("chrono_influx_spool_pending_bytes", "Spool bytes not yet replayed to InfluxDB",
+                       influx_spool.pending_bytes)
+
+    # 例:
+    #   GET  /health
+    #   POST /ingest/ingest, /ingest/ingest/batch
+    #   WS   /ingest/stream, POST /ingest/stream（長時間の stream ingest）
+    #   GET  /query/query, POST /query/structured
+    #   POST /notion/devlog, /notion/devlog/bulk, /notion/devlog/append
+    #   GET  /admin/cardinality
+    app.include_router(health_router, tags=["health"])
+    app.include_router(ingest_router, prefix="/ingest", tags=["ingest"])
+    app.include_router(stream_router, prefix="/ingest", tags=["ingest"])
+    app.include_router(query_router, prefix="/query", tags=["query"])
+    app.include_router(notion_router, prefix="/notion", tags=["notion"])
+    app.include_router(devlog_router, prefix="/notion", tags=["devlog"])
+    app.include_router(admin_router, prefix="/admin", tags=["admin"])
+    app.include_router(metrics_router)
+
+    return app
@@ -1,44 +1,6 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from utils.notion_client import NotionWriter
+# server/main.py
+# 旧エントリポイント（uvicorn server.main:app）の互換用。実体は server/app.py の create_app()
 
-app = FastAPI(
-    title="ChronoNeura Ingest Server",
-    description="SyncBridge → NotionWriter Ingest",
-    version="1.0.0"
-)
+from server.app import create_app
 
-# -------- Input data model --------
-class NotionIngestModel(BaseModel):
-    mode: str = "create"    # create / upsert / append
-    key: str | None = None
-    title: str | None = None
-    summary: str | None = None
-    details: str | None = None
-    category: list[str] | None = None
-    append: str | None = None
-
-
-# -------- API route --------
-@app.post("/notion/devlog")
-def ingest_devlog(data: NotionIngestModel):
-    """
-    NotionWriter.write_dynamic() に入力するための
-    ingest endpoint
-    """
-    try:
-        writer = NotionWriter()
-        res = writer.write_dynamic(data.dict())
-        return {
-            "status": "success",
-            "page_id": res.get("id"),
-            "url": res.get("url")
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-# -------- health --------
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+app = create_app()
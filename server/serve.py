@@ -0,0 +1,131 @@
+# server/serve.py
+"""
+ChronoNeura Ingest Server – マルチワーカー起動
+
+  python -m server.serve --workers 4 --port 8000
+
+- 親プロセスが listen socket を作り、N 個のワーカープロセス（uvicorn + create_app）で共有する
+- 各ワーカーは CHRONO_WORKER_ID=0..N-1 で起動し、Influx writer / Notion scheduler /
+  接続プールをプロセスごとに持つ。spool のディレクトリはワーカーごとに分かれ
+  （utils/worker.py）、Notion の rate limit はワーカー数で頭割りされる
+- Notion の key index は 1 つのファイルを共有し、DB スキャンと保存はワーカー 0 だけが行う
+  （他のワーカーは読み直すだけ）
+- SIGTERM / SIGINT で全ワーカーへ SIGTERM を送り、lifespan の drain
+  （writer / scheduler の投入済み分の書き込み）を --graceful-timeout まで待つ
+- 異常終了したワーカーは同じ ID で再起動する（spool を同じディレクトリから replay）
+
+既定は 1 ワーカー。2 以上にすると、次の状態はワーカーごとに別々で、
+同じ socket のどのワーカーに届くかは選べない
+- GET /notion/devlog/tasks/{id}：発行したワーカー以外では 404（detail に持ち主のワーカー ID）
+- /metrics・/admin/cardinality・/query/cache/stats：届いたワーカーの値だけ
+- query cache の invalidate：他のワーカーは TTL まで古い結果を返しうる
+  （TTL は QUERY_CACHE_WORKER_TTL、既定 1 秒に切り詰める）
+- INGEST_ROLLUP：series がワーカー間で割れて集約が壊れるため、複数ワーカーでは起動時にエラー
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+APP = "server.app:create_app"
+
+# ワーカー数の既定：CHRONO_WORKERS → WEB_CONCURRENCY → 1（複数にする時の制約はモジュール先頭を参照）
+DEFAULT_WORKERS = int(os.getenv("CHRONO_WORKERS") or os.getenv("WEB_CONCURRENCY") or 1)
+GRACEFUL_TIMEOUT = float(os.getenv("CHRONO_GRACEFUL_TIMEOUT", "30"))
+
+
+def _worker(worker_id: int, sock: socket.socket, graceful_timeout: float, log_level: str):
+    # アプリの import より前に ID を設定する（spool のパス、key index の担当、rate の頭割りに使う）
+    os.environ["CHRONO_WORKER_ID"] = str(worker_id)
+
+    import uvicorn
+
+    config = uvicorn.Config(APP, factory=True, log_level=log_level,
+                            timeout_graceful_shutdown=graceful_timeout)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(host: str, port: int, workers: int, graceful_timeout: float = GRACEFUL_TIMEOUT,
+          log_level: str = "info") -> int:
+
+    if workers <= 1:
+        import uvicorn
+        uvicorn.run(APP, factory=True, host=host, port=port, log_level=log_level,
+                    timeout_graceful_shutdown=graceful_timeout)
+        return 0
+
+    # 子プロセスへ引き継ぐ（rate limit の頭割りに使う）
+    os.environ["CHRONO_WORKERS"] = str(workers)
+
+    ctx = multiprocessing.get_context("spawn")
+    sock = _bind(host, port)
+    procs: dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def spawn(worker_id: int):
+        p = ctx.Process(target=_worker, args=(worker_id, sock, graceful_timeout, log_level),
+                        name=f"chrono-worker-{worker_id}")
+        p.start()
+        procs[worker_id] = p
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    for i in range(workers):
+        spawn(i)
+    print(f"chrono-ingest: {workers} workers on {host}:{port}", file=sys.stderr)
+
+    try:
+        while not stopping:
+            for worker_id, p in list(procs.items()):
+                if not p.is_alive() and not stopping:
+                    print(f"chrono-ingest: worker {worker_id} exited ({p.exitcode}), restarting",
+                          file=sys.stderr)
+                    spawn(worker_id)
+            time.sleep(0.5)
+    finally:
+        # graceful drain：SIGTERM → lifespan shutdown を待ち、期限を過ぎたら kill
+        for p in procs.values():
+            if p.is_alive():
+                p.terminate()
+        deadline = time.monotonic() + graceful_timeout + 5
+        for p in procs.values():
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+                p.join()
+        sock.close()
+
+    return 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="ChronoNeura ingest server")
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    ap.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT)
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args(argv)
+    return serve(args.host, args.port, args.workers, args.graceful_timeout, args.log_level)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
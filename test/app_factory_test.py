@@ -0,0 +1,42 @@
+# test/app_factory_test.py
+# ------------------------------------------------------------
+# create_app()：全ルーターのマウント / ワーカーごとのパス
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+os.environ.setdefault("NOTION_TOKEN_AUTOJOURNAL", "test-token")
+os.environ.setdefault("NOTION_DB_DEVLOG_ID", "test-db")
+
+from fastapi.testclient import TestClient
+
+import utils.worker as worker
+from server.app import create_app
+
+
+def test_create_app_mounts_all_routers():
+    client = TestClient(create_app())
+    paths = set(client.get("/openapi.json").json()["paths"])
+
+    assert {"/", "/health", "/ingest/ingest", "/ingest/ingest/batch", "/query/query", "/query/structured",
+            "/notion/devlog", "/notion/devlog/bulk", "/notion/devlog/append"} <= paths
+    assert client.get("/metrics").status_code == 200
+
+    health = client.get("/health").json()
+    assert {"writer", "notion", "key_index", "worker"} <= set(health)
+
+
+def test_worker_path(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_ID", None)
+    assert worker.worker_path("/data/spool") == "/data/spool"
+    monkeypatch.setattr(worker, "WORKER_ID", "2")
+    assert worker.worker_path("/data/spool") == "/data/spool.2"
+    assert worker.worker_path(None) is None
@@ -0,0 +1,49 @@
+# test/bench_fakes_test.py
+# ------------------------------------------------------------
+# bench/：fake Influx / fake Notion の応答と障害注入、結果比較
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import httpx
+
+from bench.fake_servers import FakeConfig, FakeInflux, FakeNotion
+from bench.run import compare, percentile
+
+
+def test_fake_influx_counts_points_and_serves_csv():
+    with FakeInflux(FakeConfig(query_rows=3)) as influx:
+        res = httpx.post(influx.url + "/api/v2/write?bucket=b", content=b"m v=1 1\nm v=2 2\n")
+        assert res.status_code == 204
+        assert influx.points == 2
+
+        res = httpx.post(influx.url + "/api/v2/query", json={"query": "x"})
+        rows = [line for line in res.text.splitlines() if line.startswith(",,")]
+        assert len(rows) == 3
+
+
+def test_fake_notion_injects_429_with_retry_after():
+    with FakeNotion(FakeConfig(rate_limit_rate=1.0, retry_after=2)) as notion:
+        res = httpx.post(notion.url + "/v1/pages", json={"properties": {}})
+        assert res.status_code == 429
+        assert res.headers["retry-after"] == "2"
+        assert notion.stats["rate_limited"] == 1
+
+    with FakeNotion() as notion:
+        page = httpx.post(notion.url + "/v1/pages", json={"properties": {"Key": {}}}).json()
+        assert httpx.get(f"{notion.url}/v1/pages/{page['id']}").json()["id"] == page["id"]
+
+
+def test_compare_flags_throughput_and_p99_regressions():
+    base = {"scenarios": {"a": {"rps": 100, "p99_ms": 10}, "b": {"rps": 100, "p99_ms": 10}}}
+    cur = {"scenarios": {"a": {"rps": 95, "p99_ms": 11}, "b": {"rps": 70, "p99_ms": 20}}}
+
+    regressions = compare(cur, base, threshold=0.15)
+    assert len(regressions) == 2
+    assert all(r.startswith("b:") for r in regressions)
+    assert percentile([1, 2, 3, 4], 50) in (2, 3)
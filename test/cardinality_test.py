@@ -0,0 +1,104 @@
+# test/cardinality_test.py
+# ------------------------------------------------------------
+# tag の cardinality ガード：HyperLogLog の推定精度 / policy（demote / drop / reject）/
+# ingest からの適用と /admin/cardinality（Influx 書き込みはスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+
+import routes.admin_api as admin_api
+import routes.ingest_api as ingest_api
+from utils.cardinality import HyperLogLog, CardinalityGuard, CardinalityRejected
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50000])
+def test_hll_estimate_within_error(n):
+    hll = HyperLogLog(p=10)
+    for i in range(n):
+        hll.add(f"req-{i}")
+    # 同じ値をもう一度入れても増えない
+    for i in range(n):
+        assert not hll.add(f"req-{i}")
+    assert abs(hll.estimate() - n) <= max(1, n * 0.1)
+    assert len(hll.registers) == 1024
+
+
+def point(request_id, host="h1"):
+    return {"measurement": "api", "fields": {"latency": 1.0},
+            "tags": {"host": host, "request_id": request_id}}
+
+
+def test_guard_demotes_only_the_exploding_tag():
+    guard = CardinalityGuard(max_values=100, policy="demote")
+    for i in range(150):
+        guard.apply(point(f"r{i}", host=f"h{i % 3}"))
+    p = point("r-last")
+    assert guard.apply(p) == ["request_id"]
+    assert p["tags"] == {"host": "h1"}
+    assert p["fields"] == {"latency": 1.0, "request_id": "r-last"}
+
+    rows = {r["tag"]: r for r in guard.estimates("api")}
+    assert rows["request_id"]["limited"] and rows["request_id"]["estimate"] > 100
+    assert not rows["host"]["limited"] and rows["host"]["estimate"] == 3
+
+    assert guard.reset("api", "request_id")
+    assert guard.apply(point("r-again")) == []
+
+
+def test_guard_drop_and_reject():
+    drop = CardinalityGuard(max_values=5, policy="drop")
+    reject = CardinalityGuard(max_values=5, policy="reject")
+    for i in range(20):
+        drop.apply(point(f"r{i}"))
+    p = point("x")
+    drop.apply(p)
+    assert "request_id" not in p["tags"] and "request_id" not in p["fields"]
+
+    with pytest.raises(CardinalityRejected):
+        for i in range(20):
+            reject.apply(point(f"r{i}"))
+    assert reject.stats["rejected"] == 1
+
+
+def test_ingest_applies_policy_and_admin_reports(monkeypatch, fake_ingest_app):
+    guard = CardinalityGuard(max_values=10, policy="reject")
+    monkeypatch.setattr(ingest_api, "cardinality_guard", guard)
+    monkeypatch.setattr(admin_api, "cardinality_guard", guard)
+    client, _, _ = fake_ingest_app((ingest_api.router, "/ingest"), (admin_api.router, "/admin"))
+
+    body = [{"measurement": "api", "fields": {"v": 1}, "tags": {"request_id": f"r{i}"}} for i in range(30)]
+    with client:
+        res = client.post("/ingest/ingest/batch", json=body).json()
+        single = client.post("/ingest/ingest", json=body[0])
+        admin = client.get("/admin/cardinality").json()
+        reset = client.delete("/admin/cardinality/api/request_id")
+        missing = client.delete("/admin/cardinality/api/nope")
+
+    assert res["status"] == "partial"
+    assert 0 < res["rejected"] < 30
+    assert "cardinality" in next(r for r in res["results"] if r["status"] == "rejected")["error"]
+    assert single.status_code == 422
+    assert admin["policy"] == "reject"
+    assert admin["tags"][0]["tag"] == "request_id" and admin["tags"][0]["limited"]
+    assert reset.status_code == 200 and missing.status_code == 404
+
+
+def test_guard_is_off_unless_configured():
+    guard = CardinalityGuard(max_values=0)
+    assert not guard.enabled
+    for i in range(100):
+        p = point(f"r{i}")
+        assert guard.apply(p) == []
+        assert p["tags"]["request_id"] == f"r{i}"
+    assert guard.info()["sketches"] == 0
@@ -0,0 +1,72 @@
+# test/chronotrace_normalizer_test.py
+# ------------------------------------------------------------
+# ChronoTraceNormalizer：旧実装との互換性 / キーキャッシュ / batch
+# ------------------------------------------------------------
+
+import sys
+import os
+import re
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from modules.chronotrace_normalizer import ChronoTraceNormalizer
+
+
+def legacy_normalize_key(raw, default_value="Unknown"):
+    if not raw:
+        return default_value
+    s = re.sub(r"[^\x00-\x7F]+", "", raw)
+    s = re.sub(r"[^A-Za-z0-9_]", "_", s)
+    if re.match(r"^[0-9]", s):
+        s = "M_" + s
+    return s or default_value
+
+
+KEYS = ["cpu", "cpu_load", "_x", "cpu load", "9lives", "温度", "温度_1", "temp-℃",
+        "a.b.c", "", "__", "１２３", "x１", "Ünïcode", "1", "-"]
+
+
+def test_normalize_key_matches_legacy():
+    n = ChronoTraceNormalizer()
+    for k in KEYS:
+        assert n.normalize_key(k) == legacy_normalize_key(k), k
+
+
+def test_key_cache_counts_hits_and_misses():
+    n = ChronoTraceNormalizer(cache_size=2)
+    n.normalize_key("a b")
+    n.normalize_key("a b")
+    n.normalize_key("c d")
+    n.normalize_key("e f")
+
+    info = n.cache_info()
+    assert info["hits"] == 1
+    assert info["misses"] == 3
+    assert info["size"] == 2
+
+
+def test_normalize_fields_keeps_legacy_coercion():
+    n = ChronoTraceNormalizer()
+    out = n.normalize_fields({"a": 1, "b": "2.5", "c": "text", "d": True, "e": [1], "f": 10 ** 400})
+
+    assert out["a"] == 1.0 and isinstance(out["a"], float)
+    assert out["b"] == 2.5
+    assert out["c"] == "text"
+    assert out["d"] == 1.0
+    assert out["e"] == [1]
+    assert out["f"] == 10 ** 400
+
+
+def test_normalize_batch_reuses_key_cache():
+    n = ChronoTraceNormalizer()
+    payloads = [
+        {"measurement": "cpu load", "fields": {"v 1": i}, "tags": {"host name": "a"}, "timestamp": None}
+        for i in range(100)
+    ]
+    out = n.normalize_batch(payloads)
+
+    assert out[0] == {"measurement": "cpu_load", "fields": {"v_1": 0.0},
+                      "tags": {"host_name": "a"}, "timestamp": None}
+    assert n.cache_info()["misses"] == 3
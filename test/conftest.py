@@ -0,0 +1,72 @@
+# test/conftest.py
+# ------------------------------------------------------------
+# テスト共通 fixture（Influx 書き込みをフェイク sink に差し替えたアプリ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.ingest_api as ingest_api
+from utils.influx_writer import InfluxBatchWriter
+
+
+@pytest.fixture
+def fake_ingest_app(monkeypatch):
+    """
+    フェイク sink の InfluxBatchWriter を差し込んだアプリを組み立てる factory を返す。
+
+        client, calls, writer = fake_ingest_app()
+        client, calls, writer = fake_ingest_app((query_api.router, "/query"), sink=..., batch_size=10)
+
+    - routers: (router, prefix) の並び。省略時は ingest_api.router を /ingest に載せる
+    - sink: (bucket, points) を受ける前処理。例外を投げればその書き込みは失敗扱い
+    - calls: 書き込めた (bucket, points) の記録
+    - module: influx_writer を差し替えるモジュール（stream_api など）
+    - services: writer の後に start / 前に stop するもの（lifespan 開始時に読むので後から追加してよい）
+    - writer_opts: InfluxBatchWriter への引数（flush_interval の既定は 0.01）
+    """
+
+    def build(*routers, sink=None, module=ingest_api, services=(), **writer_opts):
+        calls = []
+
+        def fake_write_points(bucket, points):
+            if sink is not None:
+                sink(bucket, points)
+            calls.append((bucket, points))
+            return len(points)
+
+        writer_opts.setdefault("flush_interval", 0.01)
+        writer = InfluxBatchWriter(sink=fake_write_points, **writer_opts)
+        monkeypatch.setattr(module, "influx_writer", writer)
+
+        @asynccontextmanager
+        async def lifespan(app):
+            started = list(services)
+            await writer.start()
+            for service in started:
+                await service.start()
+            yield
+            for service in reversed(started):
+                await service.stop()
+            await writer.stop()
+
+        app = FastAPI(lifespan=lifespan)
+        for router, prefix in routers or [(ingest_api.router, "/ingest")]:
+            app.include_router(router, prefix=prefix)
+        return TestClient(app), calls, writer
+
+    return build
@@ -0,0 +1,72 @@
+# test/flux_builder_test.py
+# ------------------------------------------------------------
+# 構造化クエリ → Flux 変換：エスケープ / range 必須 / pushdown の形
+# ------------------------------------------------------------
+
+import sys
+import os
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+from modules.flux_builder import build_flux, flux_string, FluxQueryError
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def test_full_pipeline():
+    flux = build_flux(
+        bucket="chrono_trace",
+        measurement="cpu",
+        start="-1h",
+        tags={"host": ["a", "b"], "region": "jp"},
+        fields=["usage"],
+        window="1m",
+        aggregate="mean",
+        limit=100,
+        now=NOW,
+    )
+    assert flux == "\n".join([
+        'from(bucket: "chrono_trace")',
+        "  |> range(start: -1h, stop: now())",
+        '  |> filter(fn: (r) => r._measurement == "cpu" and (r["host"] == "a" or r["host"] == "b")'
+        ' and r["region"] == "jp" and r._field == "usage")',
+        "  |> aggregateWindow(every: 1m, fn: mean, createEmpty: false)",
+        "  |> limit(n: 100)",
+    ])
+
+
+def test_absolute_range_is_utc():
+    flux = build_flux("b", "m", start="2024-05-31T09:00:00+09:00", stop="2024-05-31T01:00:00Z", now=NOW)
+    assert 'range(start: time(v: "2024-05-31T00:00:00.000000Z"), stop: time(v: "2024-05-31T01:00:00.000000Z"))' in flux
+
+
+def test_injection_is_escaped():
+    evil = '") |> drop() |> yield(name: "${x}'
+    flux = build_flux("b", evil, start="-5m", now=NOW)
+    assert flux_string(evil) in flux
+    assert 'r._measurement == "\\") |> drop() |> yield(name: \\"\\${x}"' in flux
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"start": None},
+    {"start": "-30d"},                                  # 生データでは範囲が大きすぎる
+    {"start": "-1h", "stop": "-2h"},
+    {"start": "-1h", "window": "1m"},                   # aggregate 無し
+    {"start": "-1h", "window": "1m", "aggregate": "drop"},
+    {"start": "-1h", "window": "1m) |> drop(", "aggregate": "mean"},
+    {"start": "-1h; drop"},
+    {"start": "-1h", "limit": 0},
+])
+def test_rejects_unbounded_or_invalid(kwargs):
+    with pytest.raises(FluxQueryError):
+        build_flux("b", "m", now=NOW, **kwargs)
+
+
+def test_large_range_allowed_with_window():
+    flux = build_flux("b", "m", start="-30d", window="1h", aggregate="max", now=NOW)
+    assert "aggregateWindow(every: 1h, fn: max" in flux
@@ -0,0 +1,180 @@
+# test/influx_rollup_test.py
+# ------------------------------------------------------------
+# ingest 側の事前集約：window ごとの min / max / mean / count / last、
+# window を閉じる契機（次の window・idle・停止）、ingest からの取り込み（Influx はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+from datetime import datetime, timezone
+
+import pytest
+
+import routes.ingest_api as ingest_api
+from utils.influx_rollup import InfluxRollup, RollupLate, parse_rules
+
+T0 = 1_700_000_000.0
+
+
+def ts(seconds: float) -> str:
+    return datetime.fromtimestamp(T0 + seconds, timezone.utc).isoformat()
+
+
+def point(t, v, measurement="accel", tags=None, **fields):
+    return {"measurement": measurement, "fields": {"x": float(v), **fields},
+            "tags": tags or {"sensor": "s1"}, "timestamp": ts(t)}
+
+
+def emitted(rollup):
+    return [p for _, _, p in rollup._out]
+
+
+def test_parse_rules():
+    rules = parse_rules({"accel_*": "1s", "temp": {"window": 10, "aggs": ["mean", "last"]}})
+    assert [(r.pattern, r.window, r.aggs) for r in rules] == [
+        ("accel_*", 1.0, ("min", "max", "mean", "count", "last")),
+        ("temp", 10.0, ("mean", "last")),
+    ]
+    with pytest.raises(ValueError):
+        parse_rules({"x": {"window": "1s", "aggs": ["p99"]}})
+    with pytest.raises(ValueError):
+        parse_rules({"x": "1 sec"})
+
+
+def test_one_point_per_window_and_series():
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=None)
+
+    # 100 Hz × 2 秒 × 2 series
+    for i in range(200):
+        assert rollup.add("chrono_trace", "chrono_trace", point(i / 100, i, state="moving"), now=T0)
+        assert rollup.add("chrono_trace", "chrono_trace", point(i / 100, -i, tags={"sensor": "s2"}), now=T0)
+    assert not rollup.add("chrono_trace", "chrono_trace", point(0, 1, measurement="temp"), now=T0)
+
+    # 2 秒目の最初の point で 1 秒目の window が閉じている
+    first = {p["tags"]["sensor"]: p for p in emitted(rollup)}
+    assert set(first) == {"s1", "s2"}
+    assert first["s1"]["timestamp"] == int(T0) * 10 ** 9
+    assert first["s1"]["fields"] == {"x_min": 0.0, "x_max": 99.0, "x_mean": 49.5, "x_count": 100,
+                                     "x_last": 99.0, "state_last": "moving"}
+    assert first["s2"]["fields"]["x_min"] == -99.0
+
+    rollup.close_all()
+    assert len(emitted(rollup)) == 4
+    assert rollup.stats["points"] == 400
+
+
+def test_late_point_is_merged_into_the_written_window_or_rejected():
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=None)
+    rollup.add("b", "b", point(0.1, 1), now=T0)
+    rollup.add("b", "b", point(0.2, 3), now=T0)
+    rollup.add("b", "b", point(1.1, 5), now=T0)
+
+    # 1 つ前の window（書き済み）への遅着は合算して同じ時刻で書き直す
+    assert rollup.add("b", "b", point(0.9, 8), now=T0)
+    first, rewritten = emitted(rollup)
+    assert first["timestamp"] == rewritten["timestamp"] == int(T0) * 10 ** 9
+    assert rewritten["fields"] == {"x_min": 1.0, "x_max": 8.0, "x_mean": 4.0, "x_count": 3, "x_last": 8.0}
+    assert rollup.stats["merged"] == 1
+
+    # それより前は ack せずに拒否する
+    with pytest.raises(RollupLate):
+        rollup.add("b", "b", point(-0.5, 1), now=T0)
+    assert rollup.stats["late"] == 1
+    assert rollup.stats["points"] == 4
+
+
+def test_window_split_across_batches_is_rewritten_whole():
+    # idle で閉じた後に同じ window の続きが届いても、後半だけの集約で上書きしない
+    rollup = InfluxRollup(parse_rules({"accel": {"window": "10s", "aggs": ["count", "max"]}}), writer=None, idle=1)
+    for i in range(5):
+        rollup.add("b", "b", point(i, i), now=T0 + 10)
+    assert rollup.close_idle(now=T0 + 11) == 1
+    for i in range(5, 10):
+        rollup.add("b", "b", point(i, i), now=T0 + 12)
+    assert rollup.close_idle(now=T0 + 13) == 1
+
+    first, second = emitted(rollup)
+    assert first["timestamp"] == second["timestamp"]
+    assert first["fields"] == {"x_count": 5, "x_max": 4.0}
+    assert second["fields"] == {"x_count": 10, "x_max": 9.0}
+
+
+def test_int_fields_are_aggregated():
+    # line protocol の整数 field（5i）は int のまま届く
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=None)
+    for v in (3, 1, 2):
+        rollup.add("b", "b", {"measurement": "accel", "fields": {"n": v, "ok": True},
+                              "tags": {}, "timestamp": ts(0)}, now=T0)
+    rollup.close_all()
+    assert emitted(rollup)[0]["fields"] == {"n_min": 1, "n_max": 3, "n_mean": 2.0, "n_count": 3, "n_last": 2,
+                                            "ok_last": True}
+
+
+def test_idle_close_waits_for_window_end():
+    rollup = InfluxRollup(parse_rules({"accel": {"window": "10s", "aggs": ["mean"]}}), writer=None, idle=1)
+    rollup.add("b", "b", point(0, 1), now=T0)
+    rollup.add("b", "b", point(1, 3), now=T0 + 1)
+
+    # window（10 秒）の途中で止まっても閉じない
+    assert rollup.close_idle(now=T0 + 5) == 0
+    assert rollup.close_idle(now=T0 + 10.5) == 1
+    assert emitted(rollup)[0]["fields"] == {"x_mean": 2.0}
+
+
+def test_series_limit_passes_points_through():
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=None, max_series=1)
+    assert rollup.add("b", "b", point(0, 1), now=T0)
+    assert not rollup.add("b", "b", point(0, 1, tags={"sensor": "other"}), now=T0)
+    assert rollup.stats["overflow"] == 1
+
+
+def test_ingest_batch_writes_rollup_points(monkeypatch, fake_ingest_app):
+    services = []
+    client, writes, writer = fake_ingest_app(services=services)
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=writer, idle=60)
+    services.append(rollup)
+    monkeypatch.setattr(ingest_api, "influx_rollup", rollup)
+
+    body = [{"measurement": "accel", "fields": {"x": i}, "timestamp": ts(i / 100)} for i in range(300)]
+    body.append({"measurement": "temp", "fields": {"c": 21.5}})
+    with client:
+        res = client.post("/ingest/ingest/batch", json=body).json()
+        single = client.post("/ingest/ingest", json={"measurement": "accel", "fields": {"x": 1},
+                                                     "timestamp": ts(3.5)}).json()
+        late = client.post("/ingest/ingest", json={"measurement": "accel", "fields": {"x": 1},
+                                                   "timestamp": ts(1.5)})
+
+    assert res["accepted"] == 301
+    assert sum(1 for r in res["results"] if r.get("rollup")) == 300
+    assert single["ack"] == "rollup"
+
+    points = [p for _, batch in writes for p in batch]
+    accel = sorted((p for p in points if p["measurement"] == "accel"), key=lambda p: p["timestamp"])
+    assert [p["fields"]["x_count"] for p in accel] == [100, 100, 100, 1]
+    assert [p for p in points if p["measurement"] == "temp"][0]["fields"] == {"c": 21.5}
+    assert late.status_code == 422
+
+
+def test_refuses_multiple_workers_and_bounds_pending():
+    import asyncio
+
+    multi = InfluxRollup(parse_rules({"accel": "1s"}), writer=None, workers=2)
+    with pytest.raises(RuntimeError):
+        asyncio.run(multi.start())
+
+    # writer が詰まったままでも送出待ちは max_pending まで
+    rollup = InfluxRollup(parse_rules({"accel": "1s"}), writer=None, max_pending=3)
+    for i in range(10):
+        rollup.add("chrono_trace", "chrono_trace", point(i, i), now=T0 + 20)
+    rollup.close_all()
+    assert len(rollup._out) == 3
+    assert rollup.stats["dropped"] == 7
@@ -0,0 +1,153 @@
+# test/influx_router_test.py
+# ------------------------------------------------------------
+# 複数 Influx ターゲットへのルーティング：consistent hash / rules / 書き込み先キー
+# および ingest・query が持ち主のシャードへ届くこと（Influx はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+
+import routes.ingest_api as ingest_api
+import routes.query_api as query_api
+from modules.influx_router import InfluxRouter, InfluxRoutingError
+from utils.query_cache import QueryCache
+
+
+def target(name, mode="prod", bucket="chrono_trace"):
+    return {"name": name, "url": f"http://{name}:8086", "org": "o", "token": "t",
+            "bucket": bucket, "mode": mode}
+
+
+CONFIG = {
+    "targets": [target("a"), target("b"), target("c"), target("s", "sandbox", "chrono_test")],
+    "rules": [{"measurement": "notion_*", "target": "c"}],
+}
+
+
+def test_single_target_keeps_plain_bucket_keys():
+    router = InfluxRouter.from_config([{"url": "http://influx:8086"}])
+    assert not router.sharded
+    assert router.route("prod", None, "cpu") == "chrono_trace"
+    assert router.route("sandbox", None, "cpu") == "chrono_test"
+    assert router.route("prod", "custom", "cpu") == "custom"
+    assert router.split("chrono_trace") == ("influx0", "chrono_trace")
+    assert router.shards("prod", None) == ["chrono_trace"]
+
+
+def test_hash_routing_is_stable_and_spread_within_mode():
+    router = InfluxRouter.from_config(CONFIG)
+    owners = {m: router.owner("prod", m) for m in (f"m{i}" for i in range(600))}
+
+    assert set(owners.values()) == {"a", "b", "c"}
+    assert all(600 / 3 * 0.6 < list(owners.values()).count(t) < 600 / 3 * 1.4 for t in "abc")
+    assert all(InfluxRouter.from_config(CONFIG).owner("prod", m) == t for m, t in owners.items())
+
+    # sandbox は sandbox のターゲットだけ
+    assert {router.owner("sandbox", m) for m in owners} == {"s"}
+    assert router.route("sandbox", None, "m1") == "s/chrono_test"
+    assert router.route("prod", None, "m1") == f"{owners['m1']}/chrono_trace"
+
+
+def test_adding_a_target_moves_only_its_share():
+    before = InfluxRouter.from_config(CONFIG["targets"][:3])
+    after = InfluxRouter.from_config(CONFIG["targets"][:3] + [target("d")])
+    names = [f"m{i}" for i in range(1000)]
+    moved = [m for m in names if before.owner("prod", m) != after.owner("prod", m)]
+
+    assert all(after.owner("prod", m) == "d" for m in moved)
+    assert len(moved) < 1000 * 0.4
+
+
+def test_rules_pin_measurements_and_queries_fan_out():
+    router = InfluxRouter.from_config(CONFIG)
+    assert router.owner("prod", "notion_devlog") == "c"
+    assert router.shards("prod", None, "notion_devlog") == ["c/chrono_trace"]
+    assert router.shards("prod", None) == ["a/chrono_trace", "b/chrono_trace", "c/chrono_trace"]
+    assert router.split("c/chrono_trace") == ("c", "chrono_trace")
+    # 旧形式（"/" なし）のキーは先頭ターゲット
+    assert router.split("chrono_trace") == ("a", "chrono_trace")
+
+
+def test_unknown_target_key_is_rejected():
+    router = InfluxRouter.from_config(CONFIG)
+    # 外されたターゲット宛てのキーを "x/chrono_trace" という bucket として書かない
+    with pytest.raises(InfluxRoutingError):
+        router.split("x/chrono_trace")
+
+    # 単一ターゲットでも "/" を含む bucket は接頭辞付きのキーになり、そのまま戻る
+    single = InfluxRouter.from_config([{"url": "http://influx:8086"}])
+    key = single.route("prod", "db/autogen", "cpu")
+    assert key == "influx0/db/autogen"
+    assert single.split(key) == ("influx0", "db/autogen")
+
+
+def test_invalid_config():
+    with pytest.raises(InfluxRoutingError):
+        InfluxRouter.from_config({"targets": [target("a"), target("a")]})
+    with pytest.raises(InfluxRoutingError):
+        InfluxRouter.from_config({"targets": [target("a")], "rules": [{"measurement": "*", "target": "x"}]})
+    with pytest.raises(InfluxRoutingError):
+        InfluxRouter.from_config({"targets": [{"name": "a"}]})
+
+
+def test_ingest_and_query_use_owning_shard(monkeypatch, fake_ingest_app):
+    router = InfluxRouter.from_config(CONFIG)
+    monkeypatch.setattr(ingest_api, "influx_router", router)
+    monkeypatch.setattr(query_api, "influx_router", router)
+    monkeypatch.setattr(query_api, "query_cache", QueryCache())
+
+    client, writes, _ = fake_ingest_app((ingest_api.router, "/ingest"), (query_api.router, "/query"))
+    queries = []
+
+    def fake_query(bucket, query, max_rows=None):
+        queries.append(bucket)
+        return [{"shard": bucket}]
+
+    def fake_query_flux(flux, target=None):
+        queries.append((target, flux))
+        return []
+
+    monkeypatch.setattr(query_api, "influx_query", fake_query)
+    monkeypatch.setattr(query_api, "influx_query_flux", fake_query_flux)
+
+    points = [{"measurement": f"m{i}", "fields": {"v": i}} for i in range(30)]
+    points.append({"measurement": "room-temp", "fields": {"v": 1}})   # 正規化で room_temp になる
+    with client:
+        res = client.post("/ingest/ingest/batch", json=points)
+        assert res.json()["accepted"] == 31
+
+        fan_out = client.get("/query/query", params={"q": "range(start: -1h)"}).json()
+        one = client.get("/query/query", params={"q": "range(start: -1h)", "measurement": "m1"}).json()
+        structured = client.post("/query/structured", json={"measurement": "m1", "start": "-1h"}).json()
+        renamed = client.post("/query/structured", json={"measurement": "room-temp", "start": "-1h"}).json()
+        renamed_q = client.get("/query/query", params={"q": "range(start: -1h)", "measurement": "room-temp"}).json()
+
+    owner = router.owner("prod", "m1")
+    assert {key for key, _ in writes} == {f"{t}/chrono_trace" for t in "abc"}
+    for key, batch in writes:
+        assert all(router.route("prod", None, p["measurement"]) == key for p in batch)
+
+    assert fan_out["shards"] == ["a/chrono_trace", "b/chrono_trace", "c/chrono_trace"]
+    assert len(fan_out["results"]) == 3
+    assert one["shards"] == [f"{owner}/chrono_trace"]
+    assert structured["shard"] == owner
+    flux_queries = [q for q in queries if isinstance(q, tuple)]
+    assert flux_queries[0][0] == owner and 'from(bucket: "chrono_trace")' in flux_queries[0][1]
+
+    # 書き込みと同じく正規化後の名前（room_temp）の持ち主へ問い合わせる
+    written = next(key for key, batch in writes for p in batch if p["measurement"] == "room_temp")
+    assert router.owner("prod", "room-temp") != router.owner("prod", "room_temp")
+    assert renamed["shard"] == router.owner("prod", "room_temp")
+    assert written == f"{renamed['shard']}/chrono_trace"
+    assert 'r._measurement == "room_temp"' in flux_queries[1][1]
+    assert renamed_q["shards"] == [written]
@@ -0,0 +1,173 @@
+# test/influx_spool_test.py
+# ------------------------------------------------------------
+# Influx Spool（WAL）テスト：追記 → replay → セグメント削除 / 再起動復元
+# ------------------------------------------------------------
+
+import sys
+import os
+import asyncio
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+
+from utils.influx_spool import InfluxSpool, SpoolFull
+
+
+def point(i, timestamp=None):
+    return {"measurement": "m", "fields": {"v": i}, "tags": {}, "timestamp": timestamp}
+
+
+async def wait_until(cond, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timeout")
+        await asyncio.sleep(0.01)
+
+
+def test_files_are_opened_on_start_not_on_creation(tmp_path):
+    directory = tmp_path / "spool"
+    spool = InfluxSpool(str(directory), sink=lambda b, p: None)
+    assert not directory.exists()
+    assert spool.lag()["pending_bytes"] == 0
+
+    async def scenario():
+        await spool.start()
+        assert directory.exists()
+        await spool.stop()
+
+    asyncio.run(scenario())
+
+
+def test_replay_in_order_with_backoff_and_truncate(tmp_path):
+    written = []
+    failures = {"left": 2}
+
+    def flaky_sink(bucket, points):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("influx down")
+        written.extend((bucket, p["fields"]["v"]) for p in points)
+
+    spool = InfluxSpool(str(tmp_path), sink=flaky_sink, segment_bytes=200,
+                        backoff_min=0.01, backoff_max=0.02)
+
+    async def scenario():
+        await spool.start()
+        for i in range(6):
+            await asyncio.to_thread(spool.append, "b1" if i < 3 else "b2", [point(i)])
+        await wait_until(lambda: len(written) == 6)
+        await spool.stop()
+
+    asyncio.run(scenario())
+
+    assert written == [("b1", 0), ("b1", 1), ("b1", 2), ("b2", 3), ("b2", 4), ("b2", 5)]
+    assert spool.stats["retries"] == 2
+    assert spool.pending_bytes() == 0
+    # 送信済みセグメントは削除され、書き込み中の 1 本だけ残る
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".seg")]) == 1
+
+
+def test_timestamp_is_fixed_at_append(tmp_path):
+    spool = InfluxSpool(str(tmp_path), sink=lambda b, p: None)
+    spool.append("b", [point(1), point(2, "2024-01-01T00:00:00Z")])
+
+    _, _, _, points, _ = spool._read_records()
+    assert isinstance(points[0]["timestamp"], int)
+    assert points[1]["timestamp"] == "2024-01-01T00:00:00Z"
+
+
+def test_restart_resumes_from_checkpoint(tmp_path):
+    written = []
+
+    first = InfluxSpool(str(tmp_path), sink=lambda b, p: written.extend(p), replay_batch=1)
+    first.append("b", [point(1)])
+    first.append("c", [point(2)])
+
+    # 1 件だけ replay 済みにして停止した状態を再現
+    seq, end, bucket, points, _ = first._read_records()
+    first.sink(bucket, points)
+    first._advance(seq, end)
+    first._fh.close()
+
+    second = InfluxSpool(str(tmp_path), sink=lambda b, p: written.extend(p))
+    second.open()
+    _, _, bucket, points, _ = second._read_records()
+    assert bucket == "c"
+    assert [p["fields"]["v"] for p in points] == [2]
+
+
+def test_size_cap_raises_spool_full(tmp_path):
+    spool = InfluxSpool(str(tmp_path), sink=lambda b, p: None, max_bytes=300)
+    spool.append("b", [point(1)])
+
+    with pytest.raises(SpoolFull):
+        spool.append("b", [point(i) for i in range(10)])
+    assert spool.stats["rejected"] == 10
+
+
+class Rejected(Exception):
+    status = 400
+
+
+def test_permanently_rejected_record_is_dead_lettered(tmp_path):
+    written = []
+
+    def sink(bucket, points):
+        if any(p["fields"]["v"] == "bad" for p in points):
+            # influx_write_points と同じく RuntimeError で包まれてくる
+            try:
+                raise Rejected("field type conflict")
+            except Rejected as e:
+                raise RuntimeError(f"Influx batch write failed: {e}")
+        written.extend(p["fields"]["v"] for p in points)
+
+    spool = InfluxSpool(str(tmp_path), sink=sink, backoff_min=0.01, backoff_max=0.02)
+
+    async def scenario():
+        for v in (1, "bad", 2, 3):
+            spool.append("b", [point(v)])
+        await spool.start()
+        await wait_until(lambda: len(written) == 3)
+        await spool.stop()
+
+    asyncio.run(scenario())
+
+    # 同じバッチの前後のレコードは 1 件ずつ送り直されて届く
+    assert written == [1, 2, 3]
+    assert spool.stats["dead_letter"] == 1
+    assert spool.pending_bytes() == 0
+    with open(tmp_path / "deadletter.jsonl") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1 and '"bad"' in lines[0] and "field type conflict" in lines[0]
+
+
+def test_record_for_removed_target_is_dead_lettered(tmp_path):
+    from modules.influx_router import InfluxRouter
+    router = InfluxRouter.from_config([{"name": "a", "url": "http://a:8086"}])
+    written = []
+
+    def sink(bucket, points):
+        router.split(bucket)
+        written.extend(points)
+
+    spool = InfluxSpool(str(tmp_path), sink=sink, backoff_min=0.01, backoff_max=0.02)
+
+    async def scenario():
+        spool.append("x/chrono_trace", [point(1)])
+        spool.append("a/chrono_trace", [point(2)])
+        await spool.start()
+        await wait_until(lambda: len(written) == 1)
+        await spool.stop()
+
+    asyncio.run(scenario())
+
+    assert spool.stats["dead_letter"] == 1
+    assert spool.pending_bytes() == 0
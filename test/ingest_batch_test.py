@@ -0,0 +1,167 @@
+# test/ingest_batch_test.py
+# ------------------------------------------------------------
+# Batch Ingest API テスト（Influx 書き込みはスタブに差し替え）
+# ------------------------------------------------------------
+
+import sys
+import os
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+from utils.influx_writer import InfluxBatchWriter
+
+
+def fail_on(bucket):
+    def sink(b, points):
+        if b == bucket:
+            raise RuntimeError("influx down")
+    return sink
+
+
+def test_json_array_grouped_by_bucket(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+
+    body = [
+        {"mode": "sandbox", "measurement": "cpu load", "fields": {"v": "1.5"}},
+        {"mode": "prod", "measurement": "mem", "fields": {"v": 2}, "tags": {"host": "a"}},
+        {"mode": "sandbox", "measurement": "cpu load", "fields": {"v": 3}},
+        {"mode": "prod", "fields": {"v": 1}},
+    ]
+    with client:
+        res = client.post("/ingest/ingest/batch", json=body)
+    data = res.json()
+
+    assert res.status_code == 200
+    assert data["status"] == "partial"
+    assert data["accepted"] == 3
+    assert data["buckets"] == {"chrono_test": 2, "chrono_trace": 1}
+    assert [r["status"] for r in data["results"]] == ["accepted", "accepted", "accepted", "rejected"]
+
+    # bucket ごとに 1 回ずつ write されている
+    assert sorted(b for b, _ in calls) == ["chrono_test", "chrono_trace"]
+    sandbox_points = dict(calls)["chrono_test"]
+    assert sandbox_points[0]["measurement"] == "cpu_load"
+    assert sandbox_points[0]["fields"] == {"v": 1.5}
+
+
+def test_ndjson_stream_with_broken_line(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+
+    lines = [
+        '{"measurement": "m1", "fields": {"a": 1}}',
+        "{not json",
+        '{"measurement": "m2", "fields": {"b": 2}}',
+    ]
+    with client:
+        res = client.post(
+            "/ingest/ingest/batch",
+            content="\n".join(lines) + "\n",
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+    data = res.json()
+
+    assert data["accepted"] == 2
+    assert data["results"][1]["status"] == "rejected"
+    assert len(calls) == 1 and len(calls[0][1]) == 2
+
+
+def test_failed_bucket_rejects_its_items(fake_ingest_app):
+    client, _, _ = fake_ingest_app(sink=fail_on("chrono_trace"))
+
+    body = [
+        {"mode": "sandbox", "measurement": "m", "fields": {"a": 1}},
+        {"mode": "prod", "measurement": "m", "fields": {"a": 1}},
+    ]
+    with client:
+        data = client.post("/ingest/ingest/batch", json=body).json()
+
+    assert [r["status"] for r in data["results"]] == ["accepted", "rejected"]
+    assert "influx down" in data["results"][1]["error"]
+
+
+def test_non_array_body_is_400(fake_ingest_app):
+    client, _, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch", json={"measurement": "m"})
+    assert res.status_code == 400
+
+
+# ------------------------------------------------------------
+# writer の ack モード / backpressure / drain
+# ------------------------------------------------------------
+def test_queue_full_returns_503(fake_ingest_app):
+    client, _, _ = fake_ingest_app(queue_max=2)
+
+    body = [{"measurement": "m", "fields": {"a": i}} for i in range(3)]
+    with client:
+        res = client.post("/ingest/ingest/batch", json=body)
+
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+
+
+def test_only_waiters_of_the_failed_sub_batch_fail():
+    import asyncio
+
+    sent = []
+
+    def sink(bucket, points):
+        values = [p["fields"]["a"] for p in points]
+        if 3 in values:
+            raise RuntimeError("bad sub-batch")
+        sent.append(values)
+        return len(points)
+
+    writer = InfluxBatchWriter(sink=sink, batch_size=2, flush_interval=60)
+
+    async def main():
+        await writer.start()
+        # 5 件が 1 回の flush で [0, 1] [2, 3] [4] の sub-batch に分かれる
+        futs = [writer.submit("b", [{"fields": {"a": i}}], durable=False) for i in range(5)]
+        await writer.stop()
+        return [f.exception() for f in futs]
+
+    errors = asyncio.run(main())
+    assert [e is None for e in errors] == [True, True, False, False, True]
+    assert sent == [[0, 1], [4]]
+    assert writer.stats["written"] == 3 and writer.stats["failed"] == 2
+
+
+def test_enqueue_mode_is_drained_on_shutdown(fake_ingest_app):
+    # flush_interval を長くし、shutdown 時の drain だけで書き込まれることを確認
+    client, calls, writer = fake_ingest_app(ack_mode="enqueue", batch_size=1000)
+    writer.flush_interval = 60
+
+    with client:
+        for i in range(5):
+            res = client.post("/ingest/ingest", json={"measurement": "m", "fields": {"a": i}})
+            assert res.json()["ack"] == "enqueue"
+        assert calls == []
+
+    assert sum(len(points) for _, points in calls) == 5
+    assert writer.depth() == 0
+
+
+def test_durable_write_does_not_wait_for_flush_interval(fake_ingest_app):
+    # flush_interval は上限。durable の 1 件は linger 後すぐ書き込まれて応答する
+    client, calls, writer = fake_ingest_app()
+    writer.flush_interval = 0.5
+
+    with client:
+        client.post("/ingest/ingest", json={"measurement": "m", "fields": {"a": 0}})
+        elapsed = []
+        for i in range(5):
+            t0 = time.perf_counter()
+            res = client.post("/ingest/ingest", json={"measurement": "m", "fields": {"a": i}})
+            elapsed.append(time.perf_counter() - t0)
+            assert res.status_code == 200
+
+    assert sorted(elapsed)[2] < 0.1
+    assert sum(len(points) for _, points in calls) == 6
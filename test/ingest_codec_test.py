@@ -0,0 +1,156 @@
+# test/ingest_codec_test.py
+# ------------------------------------------------------------
+# ingest の本体デコード：gzip / zstd / MessagePack / 軽量バリデーション
+# （Influx 書き込みはスタブに差し替え）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import gzip
+import json
+
+import pytest
+
+import routes.ingest_api as ingest_api
+import utils.codec as codec
+
+
+POINTS = [{"mode": "sandbox", "measurement": "cpu", "fields": {"v": i}} for i in range(3)]
+
+
+def test_gzip_json_batch(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch", content=gzip.compress(json.dumps(POINTS).encode()),
+                          headers={"content-type": "application/json", "content-encoding": "gzip"})
+    assert res.json()["accepted"] == 3
+    assert sum(len(p) for _, p in calls) == 3
+
+
+def test_gzip_ndjson_stream(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+    body = "\n".join(json.dumps(p) for p in POINTS).encode()
+    with client:
+        res = client.post("/ingest/ingest/batch", content=gzip.compress(body),
+                          headers={"content-type": "application/x-ndjson", "content-encoding": "gzip"})
+        mixed_case = client.post("/ingest/ingest/batch", content=body,
+                                 headers={"content-type": "Application/X-NDJSON; charset=utf-8"})
+    assert res.json()["accepted"] == 3
+    assert mixed_case.json()["accepted"] == 3
+
+
+def test_single_ingest_gzip_and_validation(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+    with client:
+        ok = client.post("/ingest/ingest", content=gzip.compress(json.dumps(POINTS[0]).encode()),
+                         headers={"content-type": "application/json", "content-encoding": "gzip"})
+        bad = client.post("/ingest/ingest", json={"measurement": "cpu", "fields": [1]})
+    assert ok.status_code == 200
+    assert ok.json()["normalized"]["fields"] == {"v": 0}
+    assert bad.status_code == 422
+    assert "fields" in bad.json()["detail"]
+
+
+def test_lightweight_validator_matches_model_constraints():
+    assert ingest_api._check_payload({"measurement": "m", "fields": {}}) is None
+    assert ingest_api._check_payload([]) == "Item must be an object"
+    assert "measurement" in ingest_api._check_payload({"fields": {}})
+    assert "tags" in ingest_api._check_payload({"measurement": "m", "fields": {}, "tags": "x"})
+    assert ingest_api._check_payload({"measurement": "m", "fields": {}, "timestamp": 1}) is None
+    assert "timestamp" in ingest_api._check_payload({"measurement": "m", "fields": {}, "timestamp": True})
+    assert "timestamp" in ingest_api._check_payload({"measurement": "m", "fields": {}, "timestamp": [1]})
+
+
+def test_unsupported_and_corrupt_encoding(fake_ingest_app):
+    client, _, _ = fake_ingest_app()
+    with client:
+        unsupported = client.post("/ingest/ingest/batch", content=b"[]",
+                                  headers={"content-type": "application/json", "content-encoding": "br"})
+        corrupt = client.post("/ingest/ingest/batch", content=b"not gzip",
+                              headers={"content-type": "application/json", "content-encoding": "gzip"})
+    assert unsupported.status_code == 415
+    assert corrupt.status_code == 400
+
+
+def test_decompressed_size_is_capped(monkeypatch, fake_ingest_app):
+    monkeypatch.setattr(codec, "INGEST_MAX_BODY_BYTES", 1000)
+    client, _, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch", content=gzip.compress(b" " * 100000 + b"[]"),
+                          headers={"content-type": "application/json", "content-encoding": "gzip"})
+    assert res.status_code == 413
+
+
+def test_msgpack_batch(monkeypatch, fake_ingest_app):
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(codec, "msgpack", msgpack)
+    client, _, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch", content=msgpack.packb(POINTS),
+                          headers={"content-type": "application/msgpack"})
+    assert res.json()["accepted"] == 3
+
+
+def test_msgpack_non_string_keys_are_rejected(monkeypatch, fake_ingest_app):
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(codec, "msgpack", msgpack)
+    client, calls, _ = fake_ingest_app()
+    # bytes のキーは unpackb（strict_map_key）を通ってくる
+    items = [{"measurement": "cpu", "fields": {b"v": 2.0}},
+             {"measurement": "cpu", "fields": {"v": 1}, "tags": {b"host": "a"}},
+             POINTS[0]]
+    with client:
+        single = client.post("/ingest/ingest", content=msgpack.packb(items[0]),
+                             headers={"content-type": "application/msgpack"})
+        batch = client.post("/ingest/ingest/batch", content=msgpack.packb(items),
+                            headers={"content-type": "application/msgpack"})
+        int_key = client.post("/ingest/ingest", content=msgpack.packb({"measurement": "cpu", "fields": {1: 2.0}}),
+                              headers={"content-type": "application/msgpack"})
+
+    # 500（AttributeError）ではなく payload のエラー
+    assert single.status_code == 422
+    assert "fields" in single.json()["detail"]
+    body = batch.json()
+    assert body["accepted"] == 1 and body["rejected"] == 2
+    assert int_key.status_code == 400
+
+
+def test_zstd_batch(fake_ingest_app):
+    zstandard = pytest.importorskip("zstandard")
+    client, _, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch",
+                          content=zstandard.ZstdCompressor().compress(json.dumps(POINTS).encode()),
+                          headers={"content-type": "application/json", "content-encoding": "zstd"})
+    assert res.json()["accepted"] == 3
+
+
+def test_zstd_decompression_is_bounded(monkeypatch, fake_ingest_app):
+    zstandard = pytest.importorskip("zstandard")
+    monkeypatch.setattr(codec, "zstandard", zstandard)
+    bomb = zstandard.ZstdCompressor().compress(b" " * (32 * 1024 * 1024))
+
+    # 展開は _INFLATE_STEP ずつ受け取り、総量が上限を超えた時点で打ち切る
+    monkeypatch.setattr(codec, "INGEST_MAX_BODY_BYTES", 3 * codec._INFLATE_STEP)
+    seen = []
+    with pytest.raises(codec.HTTPException) as e:
+        for data in codec._Zstd().feed(bomb):
+            seen.append(len(data))
+    assert e.value.status_code == 413
+    assert max(seen, default=0) <= codec._INFLATE_STEP
+
+    monkeypatch.setattr(codec, "INGEST_MAX_BODY_BYTES", 1000)
+    client, _, _ = fake_ingest_app()
+    with client:
+        res = client.post("/ingest/ingest/batch", content=bomb,
+                          headers={"content-type": "application/json", "content-encoding": "zstd"})
+    assert res.status_code == 413
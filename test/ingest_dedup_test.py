@@ -0,0 +1,138 @@
+# test/ingest_dedup_test.py
+# ------------------------------------------------------------
+# 重複抑止：Idempotency-Key / 内容ハッシュ / 失敗時のリトライ / 時間窓
+# （Influx 書き込みはスタブに差し替え）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import routes.ingest_api as ingest_api
+import utils.dedup as dedup
+from utils.dedup import DedupWindow, point_key
+
+
+@pytest.fixture(autouse=True)
+def fresh_dedup(monkeypatch):
+    monkeypatch.setattr(ingest_api, "ingest_dedup", DedupWindow(window=60))
+    monkeypatch.setattr(ingest_api, "INGEST_DEDUP_HASH", False)
+
+
+POINT = {"mode": "sandbox", "measurement": "cpu", "fields": {"v": 1}, "timestamp": "2024-01-01T00:00:00Z"}
+
+
+def test_idempotency_key_suppresses_retries(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+    with client:
+        first = client.post("/ingest/ingest", json=POINT, headers={"Idempotency-Key": "req-1"}).json()
+        again = client.post("/ingest/ingest", json=POINT, headers={"Idempotency-Key": "req-1"}).json()
+        other = client.post("/ingest/ingest", json=POINT, headers={"Idempotency-Key": "req-2"}).json()
+
+        batch = [POINT, POINT]
+        client.post("/ingest/ingest/batch", json=batch, headers={"Idempotency-Key": "b-1"})
+        dup_batch = client.post("/ingest/ingest/batch", json=batch, headers={"Idempotency-Key": "b-1"}).json()
+
+    assert "duplicate" not in first and again["duplicate"] is True and "duplicate" not in other
+    assert dup_batch == {"status": "ok", "ack": "durable", "duplicate": True}
+    assert sum(len(p) for _, p in calls) == 4
+    assert ingest_api.ingest_dedup.stats["suppressed"] == 2
+
+
+def test_content_hash_only_for_timestamped_points(monkeypatch, fake_ingest_app):
+    monkeypatch.setattr(ingest_api, "INGEST_DEDUP_HASH", True)
+    client, calls, _ = fake_ingest_app()
+    untimed = {k: v for k, v in POINT.items() if k != "timestamp"}
+    with client:
+        body = client.post("/ingest/ingest/batch", json=[POINT, POINT, untimed, untimed]).json()
+        client.post("/ingest/ingest", json=POINT)
+
+    assert [r.get("duplicate", False) for r in body["results"]] == [False, True, False, False]
+    assert body["accepted"] == 4
+    assert sum(len(p) for _, p in calls) == 3
+
+
+def test_failed_write_does_not_suppress_retry(fake_ingest_app):
+    fail = [True]
+
+    def sink(bucket, points):
+        if fail[0]:
+            raise RuntimeError("influx down")
+
+    client, calls, _ = fake_ingest_app(sink=sink)
+    with client:
+        res = client.post("/ingest/ingest", json=POINT, headers={"Idempotency-Key": "req-1"})
+        assert res.status_code == 500
+        fail[0] = False
+        res = client.post("/ingest/ingest", json=POINT, headers={"Idempotency-Key": "req-1"}).json()
+
+    assert "duplicate" not in res
+    assert len(calls) == 1
+
+
+def test_window_rotation_and_size_bound(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+
+    w = DedupWindow(window=10, max_entries=100)
+    assert not w.seen(1)
+    now[0] += 6            # 半窓を超えて 1 回 rotate：前世代としてまだ残る
+    assert w.seen(1)
+    now[0] += 11           # 窓を超えて空く
+    assert not w.seen(1)
+
+    for k in range(1000):
+        w.seen(k + 10)
+    assert len(w) <= 100
+
+    p = {"measurement": "m", "fields": {"a": 1}, "tags": {"x": "1", "y": "2"}, "timestamp": "t"}
+    q = {"measurement": "m", "fields": {"a": 1}, "tags": {"y": "2", "x": "1"}, "timestamp": "t"}
+    assert point_key("b", p) == point_key("b", q) != point_key("other", p)
+
+
+def test_retry_during_slow_failing_write_is_not_acked_as_duplicate(fake_ingest_app):
+    # 1 回目の書き込みは遅れて失敗する。その間に届いたリトライは duplicate にせず、
+    # 1 回目の結果を待ってから改めて書き込む
+    started, attempts = threading.Event(), []
+
+    def slow_then_fail_once(bucket, points):
+        attempts.append(points)
+        if len(attempts) == 1:
+            started.set()
+            threading.Event().wait(0.3)
+            raise RuntimeError("influx timeout")
+
+    # 同時リクエストを流すため TestClient ではなく ASGI に直接つなぐ
+    test_client, calls, writer = fake_ingest_app(sink=slow_then_fail_once)
+    app = test_client.app
+    headers = {"Idempotency-Key": "req-slow"}
+
+    async def main():
+        await writer.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+                first = asyncio.create_task(client.post("/ingest/ingest", json=POINT, headers=headers))
+                await asyncio.to_thread(started.wait)
+                retry = await client.post("/ingest/ingest", json=POINT, headers=headers)
+                return await first, retry
+        finally:
+            await writer.stop()
+
+    first, retry = asyncio.run(main())
+
+    assert first.status_code == 500
+    assert retry.status_code == 200 and "duplicate" not in retry.json()
+    assert len(calls) == 1 and not ingest_api._writing
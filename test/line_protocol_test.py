@@ -0,0 +1,85 @@
+# test/line_protocol_test.py
+# ------------------------------------------------------------
+# line protocol エンコーダ：Point.to_line_protocol() とのバイト一致
+# （エスケープ / 型 / None・非有限値 / tag 順）と、influx_write_points が 1 バッファで送ること
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+from influxdb_client import Point, WritePrecision
+
+import utils.influx_client as influx_client
+from modules.line_protocol import LineProtocolEncoder, parse_line
+
+POINTS = [
+    {"measurement": "cpu", "tags": {"host": "a", "dc": "eu"}, "fields": {"v": 1.0, "n": 3}, "timestamp": 1700000000000000000},
+    {"measurement": "cpu", "tags": {"dc": "eu", "host": "a"}, "fields": {"v": 0.1}, "timestamp": 1},
+    {"measurement": "m e,x", "tags": {"k y": "v=1,2", "e": "", "n": None, "slash": "ends\\"},
+     "fields": {"s": 'a "q" \\ b', "ok": True, "no": False, "f k=": 1e21}, "timestamp": None},
+    {"measurement": "nl\nm", "tags": {"t\tk": "line\nbreak"}, "fields": {"x": -0.0, "big": 2 ** 63 - 1}},
+    {"measurement": "skip", "tags": {}, "fields": {"nan": float("nan"), "inf": float("inf"), "none": None, "v": 2.5}},
+    {"measurement": "ts", "tags": None, "fields": {"v": 1}, "timestamp": "2023-11-14T22:13:20.123456Z"},
+    {"measurement": "empty", "tags": {"a": "b"}, "fields": {"none": None}, "timestamp": 5},
+]
+
+
+def reference(p) -> str:
+    point = Point(p["measurement"])
+    for k, v in (p.get("tags") or {}).items():
+        point.tag(k, v)
+    for k, v in p["fields"].items():
+        point.field(k, v)
+    if p.get("timestamp") is not None:
+        point.time(p["timestamp"], WritePrecision.NS)
+    return point.to_line_protocol()
+
+
+@pytest.mark.parametrize("p", POINTS, ids=[p["measurement"] for p in POINTS])
+def test_encode_point_matches_point_to_line_protocol(p):
+    encoder = LineProtocolEncoder()
+    args = (p["measurement"], p["fields"], p.get("tags"), p.get("timestamp"))
+    assert encoder.encode_point(*args) == reference(p)
+    # 2 回目はキャッシュ経由
+    assert encoder.encode_point(*args) == reference(p)
+
+
+def test_encode_batch_and_round_trip():
+    encoder = LineProtocolEncoder(cache_max=2)
+    body = encoder.encode(POINTS)
+    expected = "\n".join(line for line in map(reference, POINTS) if line).encode()
+    assert body == expected
+    assert encoder.info()["tag_sets"] <= 2
+
+    first = parse_line(body.decode().split("\n")[0])
+    assert first == {"measurement": "cpu", "tags": {"dc": "eu", "host": "a"},
+                     "fields": {"n": 3, "v": 1.0}, "timestamp": 1700000000000000000}
+
+
+def test_unsupported_field_type():
+    with pytest.raises(ValueError):
+        LineProtocolEncoder().encode_point("m", {"v": [1]})
+
+
+def test_write_points_sends_one_encoded_buffer(monkeypatch):
+    sent = []
+
+    class FakeWriteApi:
+        def write(self, bucket, record, write_precision):
+            sent.append((bucket, record, write_precision))
+
+    monkeypatch.setattr(influx_client, "get_client", lambda target=None: {"write_api": FakeWriteApi()})
+    assert influx_client.influx_write_points("chrono_test", POINTS[:2]) == 2
+
+    bucket, record, precision = sent[0]
+    assert bucket == "chrono_test" and precision == WritePrecision.NS
+    assert record == (reference(POINTS[0]) + "\n" + reference(POINTS[1])).encode()
@@ -0,0 +1,84 @@
+# test/metrics_test.py
+# ------------------------------------------------------------
+# utils/metrics：text exposition / histogram の累積 / middleware の route ラベル
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from routes.metrics import router as metrics_router
+from utils.metrics import (Registry, MetricsMiddleware, http_bytes_in, http_requests,
+                           stage_duration, timed_stage, upstream_errors)
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = Registry()
+    h = reg.histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    h.observe(0.05, "a")
+    h.observe(0.5, "a")
+    h.observe(5, "a")
+
+    text = reg.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="a"} 3' in text
+
+
+def test_counter_labels_are_escaped_and_gauges_read_at_scrape():
+    reg = Registry()
+    c = reg.counter("t_total", "test", ("route",))
+    c.inc('a"b\\c', value=2)
+    depth = [3]
+    reg.gauge("t_depth", "test", lambda: depth[0])
+
+    text = reg.render()
+    assert 't_total{route="a\\"b\\\\c"} 2' in text
+    assert "t_depth 3" in text
+    depth[0] = 7
+    assert "t_depth 7" in reg.render()
+
+
+def test_timed_stage_counts_upstream_errors():
+    class RateLimited(Exception):
+        status = 429
+
+    before = upstream_errors.value("test_target", "rate_limited")
+    with pytest.raises(RateLimited):
+        with timed_stage("test_stage", "test_target"):
+            raise RateLimited()
+
+    assert upstream_errors.value("test_target", "rate_limited") == before + 1
+    assert stage_duration.count("test_stage") >= 1
+
+
+def test_middleware_labels_by_route_template_and_counts_bytes():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
+    @app.post("/items/{item_id}")
+    async def item(item_id: str, request: Request):
+        return {"n": len(await request.body())}
+
+    client = TestClient(app)
+    client.post("/items/a", content=b"x" * 10)
+    client.post("/items/b", content=b"x" * 5)
+    client.get("/nope")
+
+    assert http_requests.value("POST", "/items/{item_id}", 200) == 2
+    assert http_bytes_in.value("/items/{item_id}") == 15
+    assert http_requests.value("GET", "unmatched", 404) >= 1
+
+    res = client.get("/metrics")
+    assert res.headers["content-type"].startswith("text/plain")
+    assert 'chrono_http_request_duration_seconds_count{method="POST",route="/items/{item_id}"} 2' in res.text
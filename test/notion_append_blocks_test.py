@@ -0,0 +1,100 @@
+# test/notion_append_blocks_test.py
+# ------------------------------------------------------------
+# block children による append：分割サイズ / 呼び出し回数が履歴長に依存しないこと
+# （Notion API はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("NOTION_TOKEN_AUTOJOURNAL", "test-token")
+os.environ.setdefault("NOTION_DB_DEVLOG_ID", "test-db")
+
+import pytest
+
+from utils.notion_client import NotionRichTextFull, NotionWriter, split_text, text_blocks
+from utils.notion_key_index import NotionKeyIndex
+
+
+def utf16_len(s):
+    return len(s.encode("utf-16-le")) // 2
+
+
+def test_split_text_respects_utf16_limit():
+    text = "a" * 1999 + "😀" + "b" * 10
+    chunks = split_text(text)
+    assert "".join(chunks) == text
+    assert all(utf16_len(c) <= 2000 for c in chunks)
+    assert chunks[0] == "a" * 1999
+
+
+def test_text_blocks_one_paragraph_per_line_and_rich_text_cap():
+    long_line = "x" * (2000 * 150)
+    blocks = text_blocks("first\n" + long_line)
+
+    assert blocks[0]["paragraph"]["rich_text"][0]["text"]["content"] == "first"
+    # 150 要素 → 100 + 50 の 2 paragraph
+    assert [len(b["paragraph"]["rich_text"]) for b in blocks[1:]] == [100, 50]
+
+
+class FakeBlocksChildren:
+    def __init__(self):
+        self.calls = []
+
+    def append(self, block_id, children):
+        self.calls.append((block_id, len(children)))
+        return {"results": []}
+
+
+def make_writer():
+    index = NotionKeyIndex(path=None)
+    index.put("k", "page-1")
+    writer = NotionWriter(key_index=index, append_mode="blocks")
+
+    children = FakeBlocksChildren()
+    writer.client.blocks.children = children
+
+    def no_call(*args, **kwargs):
+        raise AssertionError("blocks モードでは page の読み出し・property 更新をしない")
+
+    writer.retrieve_page = no_call
+    writer.query_by_key = no_call
+    writer.update_page = no_call
+    return writer, children
+
+
+def test_append_is_constant_cost():
+    writer, children = make_writer()
+
+    res = writer.write_append("k", "line1\nline2")
+    assert res == {"id": "page-1", "appended_blocks": 2}
+    assert children.calls == [("page-1", 2)]
+
+
+def test_merged_appends_are_batched_by_100():
+    writer, children = make_writer()
+
+    writer.write_merged("k", None, [f"entry {i}" for i in range(150)])
+    assert children.calls == [("page-1", 100), ("page-1", 50)]
+
+
+def rich_text_page(prop, text):
+    return {"id": "page-1", "properties": {
+        prop: {"rich_text": [{"plain_text": c, "text": {"content": c}} for c in split_text(text)]}}}
+
+
+def test_property_appends_split_and_refuse_to_truncate():
+    # property モードの Details 追記も 2000 字ごとに分割する
+    props = NotionWriter._append_props(rich_text_page("Details", "head"), ["y" * 4500])
+    assert [len(rt["text"]["content"]) for rt in props["Details"]["rich_text"]] == [4, 2000, 2000, 501]
+
+    # 上限（100 要素）を超える追記は切り捨てずにエラー
+    full = rich_text_page("Summary", "z" * (2000 * 100))
+    with pytest.raises(NotionRichTextFull):
+        NotionWriter._append_text_prop(full, "Summary", "more")
+    with pytest.raises(NotionRichTextFull):
+        NotionWriter._append_props(rich_text_page("Details", "z" * (2000 * 99)), ["a", "b" * 2000])
@@ -0,0 +1,143 @@
+# test/notion_bulk_test.py
+# ------------------------------------------------------------
+# POST /notion/devlog/bulk：key の一括解決 / レコードごとの結果 / 一時エラーの再試行
+# （Notion API はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+import json
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("NOTION_TOKEN_AUTOJOURNAL", "test-token")
+os.environ.setdefault("NOTION_DB_DEVLOG_ID", "test-db")
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.notion_api as notion_api
+from utils.notion_client import NotionWriter
+from utils.notion_key_index import NotionKeyIndex
+from utils.notion_scheduler import NotionWriteScheduler
+
+
+def page(pid, key):
+    return {"id": pid, "properties": {"Key": {"rich_text": [{"plain_text": key}]}}}
+
+
+class Unavailable(Exception):
+    status = 503
+
+
+class FakeDatabases:
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        wanted = {c["rich_text"]["equals"] for c in kwargs["filter"]["or"]}
+        return {"results": [p for p in self.pages if p["properties"]["Key"]["rich_text"][0]["plain_text"] in wanted],
+                "has_more": False}
+
+
+def make_writer(flaky_creates=0, error=Unavailable):
+    writer = NotionWriter(key_index=NotionKeyIndex(path=None), append_mode="blocks")
+    writer.client.databases = FakeDatabases([page("page-1", "k1"), page("page-2", "k2")])
+    calls = {"query_by_key": 0, "create": 0, "update": [], "append": []}
+
+    def query_by_key(db_id, key, value):
+        calls["query_by_key"] += 1
+        return None
+
+    def create_page(db_id, props, children=None):
+        calls["create"] += 1
+        if calls["create"] <= flaky_creates:
+            raise error("service unavailable")
+        return {"id": f"new-{calls['create']}", "url": "https://notion.so/new"}
+
+    def update_page(page_id, props):
+        calls["update"].append(page_id)
+        return {"id": page_id}
+
+    def append_blocks(page_id, children):
+        calls["append"].append(page_id)
+        return {"results": []}
+
+    writer.query_by_key = query_by_key
+    writer.create_page = create_page
+    writer.update_page = update_page
+    writer.append_blocks = append_blocks
+    writer.retrieve_page = lambda page_id: page(page_id, "")
+    return writer, calls
+
+
+def make_client(monkeypatch, writer):
+    scheduler = NotionWriteScheduler(writer_factory=lambda: writer, rate=1000, burst=1000)
+    monkeypatch.setattr(notion_api, "scheduler", scheduler)
+    monkeypatch.setattr(notion_api, "NOTION_BULK_BACKOFF", 0)
+
+    app = FastAPI()
+    app.include_router(notion_api.router, prefix="/notion")
+    return TestClient(app)
+
+
+def test_bulk_resolves_keys_in_one_query_and_reports_per_record(monkeypatch):
+    writer, calls = make_writer()
+    client = make_client(monkeypatch, writer)
+
+    records = [
+        {"mode": "upsert", "key": "k1", "summary": "s"},
+        {"mode": "append", "key": "k2", "append": "line"},
+        {"mode": "upsert", "key": "k3", "title": "new"},
+        {"mode": "upsert"},                         # key なし → reject
+        {"mode": "create", "title": "plain"},
+    ]
+    res = client.post("/notion/devlog/bulk", json=records)
+    assert res.status_code == 200
+    body = res.json()
+
+    assert body["status"] == "partial"
+    assert body["accepted"] == 4 and body["rejected"] == 1
+    assert [r["index"] for r in body["results"]] == [0, 1, 2, 3, 4]
+    assert [r["status"] for r in body["results"]] == ["success", "success", "success", "error", "success"]
+    assert body["results"][0]["page_id"] == "page-1"
+    assert body["results"][1]["page_id"] == "page-2"
+
+    # k1 / k2 / k3 は 1 本の or クエリで解決、未知の k3 だけが個別 query にフォールバック
+    assert len(writer.client.databases.queries) == 1
+    assert len(writer.client.databases.queries[0]["filter"]["or"]) == 3
+    assert calls["query_by_key"] == 1
+    assert calls["update"] == ["page-1"]
+    assert calls["append"] == ["page-2"]
+
+
+def test_bulk_ndjson_with_broken_line_and_unsent_retry(monkeypatch):
+    writer, calls = make_writer(flaky_creates=1, error=httpx.ConnectError)
+    client = make_client(monkeypatch, writer)
+
+    body = json.dumps({"mode": "create", "title": "a"}) + "\n{broken\n"
+    res = client.post("/notion/devlog/bulk", content=body,
+                      headers={"content-type": "application/x-ndjson"})
+    results = res.json()["results"]
+
+    assert results[0]["status"] == "success"
+    assert results[0]["attempts"] == 2
+    assert results[1]["status"] == "error"
+    assert "Invalid JSON" in results[1]["error"]
+
+
+def test_bulk_does_not_resend_writes_that_may_have_been_applied(monkeypatch):
+    # 5xx は Notion 側で作成済みのことがある → 再送すると重複ページになる
+    writer, calls = make_writer(flaky_creates=1)
+    client = make_client(monkeypatch, writer)
+
+    res = client.post("/notion/devlog/bulk", json=[{"mode": "create", "title": "a"}])
+    result = res.json()["results"][0]
+
+    assert result["status"] == "error" and result["attempts"] == 1
+    assert calls["create"] == 1
@@ -0,0 +1,226 @@
+# test/notion_key_index_test.py
+# ------------------------------------------------------------
+# NotionKeyIndex：ページングスキャン / 差分更新 / 永続化 / stale フォールバック
+# （Notion API はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("NOTION_TOKEN_AUTOJOURNAL", "test-token")
+os.environ.setdefault("NOTION_DB_DEVLOG_ID", "test-db")
+
+from utils.notion_client import NotionWriter
+from utils.notion_key_index import NotionKeyIndex
+
+
+def page(pid, key):
+    return {"id": pid, "properties": {"Key": {"rich_text": [{"plain_text": key}]},
+                                      "Details": {"rich_text": []}}}
+
+
+class FakeDatabases:
+    def __init__(self, pages, page_size=2):
+        self.pages = pages
+        self.page_size = page_size
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        start = int(kwargs.get("start_cursor") or 0)
+        chunk = self.pages[start:start + self.page_size]
+        more = start + self.page_size < len(self.pages)
+        return {"results": chunk, "has_more": more, "next_cursor": str(start + self.page_size) if more else None}
+
+
+class FakeClient:
+    def __init__(self, pages):
+        self.databases = FakeDatabases(pages)
+
+
+class NotFound(Exception):
+    status = 404
+
+
+def test_warm_paginates_and_persists(tmp_path):
+    path = str(tmp_path / "index.json")
+    client = FakeClient([page(f"p{i}", f"k{i}") for i in range(5)])
+
+    index = NotionKeyIndex(path=path)
+    assert index.warm(client, "db") == 5
+    assert len(client.databases.queries) == 3
+    assert "filter" not in client.databases.queries[0]
+
+    # 再起動：ファイルから復元し、last_edited_time の差分だけを取りに行く
+    restarted = NotionKeyIndex(path=path)
+    client2 = FakeClient([page("p9", "k9")])
+    restarted.warm(client2, "db")
+
+    assert restarted.get("k0") == "p0"
+    assert restarted.get("k9") == "p9"
+    assert client2.databases.queries[0]["filter"]["timestamp"] == "last_edited_time"
+
+
+def test_lru_bound():
+    index = NotionKeyIndex(path=None, max_size=2)
+    index.put("a", "1")
+    index.put("b", "2")
+    index.get("a")
+    index.put("c", "3")
+    assert index.get("b") is None
+    assert index.get("a") == "1"
+
+
+def make_writer(index, pages):
+    writer = NotionWriter(key_index=index)
+    calls = []
+
+    def query_by_key(db_id, prop, value):
+        calls.append(("query", value))
+        return pages.get(value)
+
+    def update_page(page_id, props):
+        calls.append(("update", page_id))
+        if page_id == "deleted":
+            raise NotFound()
+        return {"id": page_id}
+
+    def create_page(db_id, props, children=None):
+        calls.append(("create",))
+        return {"id": "created"}
+
+    writer.query_by_key = query_by_key
+    writer.update_page = update_page
+    writer.create_page = create_page
+    return writer, calls
+
+
+def test_upsert_uses_index_and_skips_query():
+    index = NotionKeyIndex(path=None)
+    index.put("k1", "p1")
+    writer, calls = make_writer(index, {})
+
+    writer.write_upsert("k1", {"key": "k1", "summary": "s"})
+    assert calls == [("update", "p1")]
+
+
+def test_stale_entry_falls_back_to_query():
+    index = NotionKeyIndex(path=None)
+    index.put("k1", "deleted")
+    writer, calls = make_writer(index, {"k1": page("p-real", "k1")})
+
+    res = writer.write_upsert("k1", {"key": "k1"})
+    assert res == {"id": "p-real"}
+    assert calls == [("update", "deleted"), ("query", "k1"), ("update", "p-real")]
+    assert index.get("k1") == "p-real"
+    assert index.stats["stale"] == 1
+
+
+def test_create_fills_index():
+    index = NotionKeyIndex(path=None)
+    writer, calls = make_writer(index, {})
+
+    writer.write_upsert("new", {"key": "new"})
+    assert calls == [("query", "new"), ("create",)]
+    assert index.get("new") == "created"
+
+
+def test_renamed_and_archived_pages_are_evicted():
+    index = NotionKeyIndex(path=None)
+    client = FakeClient([page("p1", "old"), page("p2", "k2")])
+    index.refresh(client, "db")
+
+    # p1 の Key が書き換えられ、p2 は archive された
+    renamed = page("p1", "new")
+    archived = dict(page("p2", "k2"), archived=True)
+    index.refresh(FakeClient([renamed, archived]), "db")
+
+    assert index.get("old") is None
+    assert index.get("new") == "p1"
+    assert index.get("k2") is None
+
+
+class Archived(Exception):
+    status = 400
+
+    def __str__(self):
+        return "Can't edit block that is archived. You must unarchive the block before editing."
+
+
+def test_archived_entry_falls_back_to_query():
+    index = NotionKeyIndex(path=None)
+    index.put("k1", "archived")
+    writer, calls = make_writer(index, {"k1": page("p-real", "k1")})
+
+    def update_page(page_id, props):
+        calls.append(("update", page_id))
+        if page_id == "archived":
+            raise Archived()
+        return {"id": page_id}
+
+    writer.update_page = update_page
+    assert writer.write_upsert("k1", {"key": "k1"}) == {"id": "p-real"}
+    assert index.get("k1") == "p-real"
+
+
+def test_only_owner_scans_and_scans_use_rate_limit(tmp_path):
+    import asyncio
+    path = str(tmp_path / "index.json")
+    owner = NotionKeyIndex(path=path)
+    follower = NotionKeyIndex(path=path, owner=False)
+    writer = NotionWriter(key_index=owner)
+    writer.client = FakeClient([page(f"p{i}", f"k{i}") for i in range(5)])
+    acquired = []
+
+    async def acquire():
+        acquired.append(1)
+
+    async def run(index):
+        task = asyncio.create_task(index.keep_fresh(lambda: writer, interval=0.01, acquire=acquire))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run(owner))
+    scans = len(writer.client.databases.queries)
+    assert scans >= 3 and len(acquired) == scans
+
+    # owner 以外は DB を引かず、owner が保存したファイルを読む
+    asyncio.run(run(follower))
+    assert len(writer.client.databases.queries) == scans
+    assert follower.get("k4") == "p4"
+    follower.put("x", "px")
+    follower.save()
+    assert "x" not in open(path).read()
+
+
+def test_async_writer_shares_the_stale_fallback():
+    import asyncio
+    from types import SimpleNamespace
+    from utils.notion_client import AsyncNotionWriter
+
+    calls = []
+
+    def update(page_id, properties):
+        calls.append(("update", page_id))
+        if page_id == "deleted":
+            raise NotFound()
+        return {"id": page_id}
+
+    def query(**kwargs):
+        calls.append(("query", kwargs["filter"]["rich_text"]["equals"]))
+        return {"results": [page("p-real", "k1")]}
+
+    index = NotionKeyIndex(path=None)
+    index.put("k1", "deleted")
+    writer = AsyncNotionWriter(key_index=index)
+    writer.sync.client = SimpleNamespace(pages=SimpleNamespace(update=update),
+                                         databases=SimpleNamespace(query=query))
+
+    res = asyncio.run(writer.write_upsert("k1", {"key": "k1"}))
+    assert res == {"id": "p-real"}
+    assert calls == [("update", "deleted"), ("query", "k1"), ("update", "p-real")]
+    assert index.get("k1") == "p-real"
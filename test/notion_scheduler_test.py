@@ -0,0 +1,259 @@
+# test/notion_scheduler_test.py
+# ------------------------------------------------------------
+# NotionWriteScheduler：同一 key のマージ / 429 Retry-After / 同時実行上限
+# （Notion API は呼ばず、NotionWriter の代わりにスタブ / fake client / fake server を使う）
+# ------------------------------------------------------------
+
+import sys
+import os
+import asyncio
+import time
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("NOTION_TOKEN_AUTOJOURNAL", "test-token")
+os.environ.setdefault("NOTION_DB_DEVLOG_ID", "test-db")
+
+from bench.fake_servers import FakeConfig, FakeNotion
+from utils import notion_client
+from utils.notion_client import AsyncNotionWriter, NotionWriter
+from utils.notion_key_index import NotionKeyIndex
+from utils.notion_scheduler import NotionWriteScheduler, NotionRateLimited, task_owner
+
+
+class RateLimitError(Exception):
+    status = 429
+    headers = {"retry-after": "0.05"}
+
+
+class FakeWriter:
+    def __init__(self, limited=0):
+        self.calls = []
+        self.limited = limited
+
+    def write_create(self, data):
+        self.calls.append(("create", data.get("title")))
+        return {"id": "p-new", "url": "u"}
+
+    def write_merged(self, key, data, appends, props=None, prop_appends=()):
+        if self.limited:
+            self.limited -= 1
+            raise RateLimitError()
+        self.calls.append(("merged", key, data and data.get("summary"), list(appends)))
+        return {"id": f"p-{key}", "url": "u"}
+
+
+def run(writer, scenario, **opts):
+    scheduler = NotionWriteScheduler(writer_factory=lambda: writer, rate=1000, burst=1000, **opts)
+
+    async def main():
+        await scheduler.start()
+        try:
+            return await scenario(scheduler)
+        finally:
+            await scheduler.stop()
+
+    return scheduler, asyncio.run(main())
+
+
+def test_same_key_ops_are_merged_into_one_write():
+    writer = FakeWriter()
+
+    async def scenario(s):
+        # worker が動き出す前にまとめて投入する
+        futs = [
+            await s.submit({"mode": "upsert", "key": "k1", "summary": "first"}),
+            await s.submit({"mode": "append", "key": "k1", "append": "line 1"}),
+            await s.submit({"mode": "upsert", "key": "k1", "summary": "second", "details": None}),
+            await s.submit({"mode": "append", "key": "k1", "append": "line 2"}),
+            await s.submit({"mode": "append", "key": "k2", "append": "other"}),
+        ]
+        return [(tid, await f) for tid, f in futs]
+
+    scheduler, results = run(writer, scenario, concurrency=1)
+
+    assert writer.calls == [
+        ("merged", "k1", "second", ["line 1", "line 2"]),
+        ("merged", "k2", None, ["other"]),
+    ]
+    assert len({tid for tid, _ in results[:4]}) == 1
+    assert results[0][1]["id"] == "p-k1"
+    assert scheduler.stats["merged"] == 3
+
+
+def test_creates_are_not_merged():
+    writer = FakeWriter()
+
+    async def scenario(s):
+        futs = [await s.submit({"mode": "create", "title": t}) for t in ("a", "b")]
+        return [await f for _, f in futs]
+
+    run(writer, scenario)
+    assert sorted(writer.calls) == [("create", "a"), ("create", "b")]
+
+
+def test_task_ids_are_unique_across_schedulers():
+    # マルチワーカーでは scheduler がプロセスごと。連番だと別ワーカーの task と衝突する
+    async def scenario(s):
+        return [(await s.submit({"mode": "create", "title": "t"}))[0] for _ in range(3)]
+
+    first, ids = run(FakeWriter(), scenario)
+    second, more = run(FakeWriter(), scenario)
+    assert len(set(ids) | set(more)) == 6
+    assert all(task_owner(t) == "0" for t in ids)
+    assert first.task_status(ids[0])["status"] == "success"
+    assert second.task_status(ids[0]) is None
+    assert task_owner("1") is None
+
+
+class FakeEndpoints:
+    """NotionWriter.client の代わり（blocks.children.append だけ先頭 limited 回 429 を返す）"""
+
+    def __init__(self, limited=0, existing=None):
+        self.calls = []
+        self.limited = limited
+        self.existing = existing
+        self.pages = SimpleNamespace(create=self.create, update=self.update)
+        self.blocks = SimpleNamespace(children=SimpleNamespace(append=self.append))
+        self.databases = SimpleNamespace(query=self.query)
+
+    def query(self, **kwargs):
+        self.calls.append("query")
+        return {"results": [self.existing] if self.existing else []}
+
+    def create(self, **kwargs):
+        self.calls.append(("create", len(kwargs.get("children", []))))
+        return {"id": "p-new", "url": "u"}
+
+    def update(self, **kwargs):
+        self.calls.append(("update", kwargs["properties"]))
+        return {"id": kwargs["page_id"]}
+
+    def append(self, block_id, children):
+        if self.limited:
+            self.limited -= 1
+            self.calls.append("429")
+            raise RateLimitError()
+        self.calls.append(("append", len(children)))
+        return {"results": children}
+
+
+def long_job(n_lines):
+    return "\n".join(f"line {i}" for i in range(n_lines))
+
+
+def test_retry_after_is_honored_for_the_failed_call_only():
+    writer = NotionWriter()
+    writer.client = FakeEndpoints(limited=2)
+
+    async def scenario(s):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await s.submit({"mode": "upsert", "key": "k", "title": "t"})
+        _, fut = await s.submit({"mode": "append", "key": "k", "append": long_job(150)})
+        await fut
+        return loop.time() - started
+
+    scheduler, elapsed = run(writer, scenario)
+    assert elapsed >= 0.1
+    assert scheduler.stats["rate_limited"] == 2
+    # create 済みのページへの append だけを再送し、create は 1 回
+    assert writer.client.calls == ["query", ("create", 100), "429", "429", ("append", 50)]
+
+
+def test_rate_limited_after_max_retries():
+    writer = NotionWriter()
+    writer.client = FakeEndpoints(limited=10)
+
+    async def scenario(s):
+        await s.submit({"mode": "upsert", "key": "k", "title": "t"})
+        _, fut = await s.submit({"mode": "append", "key": "k", "append": long_job(150)})
+        try:
+            await fut
+        except NotionRateLimited as e:
+            return e
+
+    _, err = run(writer, scenario, max_retries=1)
+    assert isinstance(err, NotionRateLimited)
+    assert writer.client.calls == ["query", ("create", 100), "429", "429"]
+
+
+def test_property_appends_and_extra_props_are_one_merged_write():
+    # routes/devlog.py：Summary への追記と UpdatedAt を 1 ジョブ（update_page 1 回）で書く
+    writer = NotionWriter()
+    writer.client = FakeEndpoints(existing={
+        "id": "p1", "properties": {"Summary": {"rich_text": [{"plain_text": "old"}]}}})
+    touched = {"UpdatedAt": {"date": {"start": "2025-11-16T00:00:00+00:00"}}}
+
+    async def scenario(s):
+        futs = [
+            await s.submit({"mode": "append", "key": "k", "append": "new", "append_to": "Summary",
+                            "props": touched}),
+            await s.submit({"mode": "append", "key": "k", "append": "line", "props": touched}),
+            await s.submit({"mode": "append", "key": "k", "append": "more", "append_to": "Summary"}),
+        ]
+        return [await f for _, f in futs]
+
+    scheduler, results = run(writer, scenario)
+    assert results[0] == {"id": "p1"}
+    assert scheduler.stats["merged"] == 2
+    assert writer.client.calls == [
+        "query",
+        ("update", {**touched, "Summary": {"rich_text": [{"type": "text", "text": {"content": "old\nnew\nmore"}}]}}),
+        ("append", 1),
+    ]
+
+
+def test_long_job_takes_a_token_per_http_call(monkeypatch):
+    rate = 20
+
+    with FakeNotion(FakeConfig(rate_limit_rate=0.3, retry_after=0.05, seed=1)) as notion:
+        monkeypatch.setattr(notion_client, "NOTION_BASE_URL", notion.url)
+        writer = AsyncNotionWriter(key_index=NotionKeyIndex(path=None))
+        if not hasattr(writer.client.databases, "query"):
+            # notion-client 3.x には databases.query が無い（requirements は <3）ので同じ endpoint を直接叩く
+            writer.client.databases.query = lambda database_id, **body: writer.client.request(
+                path=f"databases/{database_id}/query", method="POST", body=body)
+        scheduler = NotionWriteScheduler(writer_factory=lambda: writer, rate=rate, burst=1, max_retries=20)
+
+        async def main():
+            await scheduler.start()
+            try:
+                started = time.monotonic()
+                await scheduler.submit({"mode": "upsert", "key": "k", "title": "t"})
+                _, fut = await scheduler.submit({"mode": "append", "key": "k", "append": long_job(450)})
+                await fut
+                return time.monotonic() - started
+            finally:
+                await scheduler.stop()
+
+        elapsed = asyncio.run(main())
+        writer.sync.close()
+
+    # query + create（100 blocks）+ append 4 回 + 429 の再送分、すべて token を 1 つずつ取る
+    requests = notion.stats["requests"]
+    assert requests >= 6 + notion.stats["rate_limited"]
+    assert notion.stats["rate_limited"] >= 1
+    assert (requests - 1) / elapsed <= rate * 1.1
+    assert len(notion.pages) == 1
+
+
+class FakeAsyncWriter(FakeWriter):
+    is_async = True
+
+    async def write_merged(self, key, data, appends, props=None, prop_appends=()):
+        return FakeWriter.write_merged(self, key, data, appends)
+
+
+def test_async_writer_is_awaited_directly():
+    writer = FakeAsyncWriter()
+
+    async def scenario(s):
+        _, fut = await s.submit({"mode": "upsert", "key": "k", "summary": "s"})
+        return await fut
+
+    _, res = run(writer, scenario)
+    assert res["id"] == "p-k"
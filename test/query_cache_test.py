@@ -0,0 +1,131 @@
+# test/query_cache_test.py
+# ------------------------------------------------------------
+# QueryCache：TTL / 合流 / invalidate / バイト数上限
+# ------------------------------------------------------------
+
+import sys
+import os
+import asyncio
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from utils.query_cache import QueryCache, normalize_flux
+
+
+def counting_loader(calls, value, delay=0.0):
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value
+    return load
+
+
+def test_normalize_flux_keeps_string_literals():
+    q = 'range(start: -1h)\n   |>  filter(fn: (r) => r.host == "a  b")  '
+    assert normalize_flux(q) == 'range(start: -1h) |> filter(fn: (r) => r.host == "a  b")'
+
+
+def test_hit_and_whitespace_insensitive_key():
+    cache = QueryCache(ttl=60, max_bytes=10_000)
+    calls = []
+
+    async def scenario():
+        a = await cache.get("b", "range(start: -1h)", counting_loader(calls, [1]))
+        b = await cache.get("b", "range(start:  -1h)", counting_loader(calls, [2]))
+        return a, b
+
+    assert asyncio.run(scenario()) == ([1], [1])
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_identical_queries_are_coalesced():
+    cache = QueryCache(ttl=60, max_bytes=10_000)
+    calls = []
+
+    async def scenario():
+        loader = counting_loader(calls, [{"v": 1}], delay=0.05)
+        return await asyncio.gather(*(cache.get("b", "q", loader) for _ in range(10)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == [{"v": 1}] for r in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_query_after_write_does_not_join_an_older_inflight_load():
+    cache = QueryCache(ttl=60, max_bytes=10_000)
+    calls = []
+
+    async def scenario():
+        before = asyncio.ensure_future(cache.get("b", "q", counting_loader(calls, ["old"], delay=0.05)))
+        await asyncio.sleep(0.01)
+        cache.invalidate("b")   # 読み込み中に書き込みがあった
+        after = await cache.get("b", "q", counting_loader(calls, ["new"], delay=0.01))
+        return await before, after, await cache.get("b", "q", counting_loader(calls, ["x"]))
+
+    assert asyncio.run(scenario()) == (["old"], ["new"], ["new"])
+    assert len(calls) == 2
+    assert cache.stats()["coalesced"] == 0
+
+
+def test_invalidate_and_ttl():
+    cache = QueryCache(ttl=60, max_bytes=10_000)
+    calls = []
+
+    async def scenario():
+        await cache.get("b", "q", counting_loader(calls, [1]))
+        await cache.get("other", "q", counting_loader(calls, [1]))
+        cache.invalidate("b")
+        await cache.get("b", "q", counting_loader(calls, [1]))
+        await cache.get("other", "q", counting_loader(calls, [1]))
+
+        cache.ttl = 0.01
+        await cache.get("x", "q", counting_loader(calls, [1]))
+        await asyncio.sleep(0.02)
+        await cache.get("x", "q", counting_loader(calls, [1]))
+
+    asyncio.run(scenario())
+    assert len(calls) == 5
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = QueryCache(ttl=60, max_bytes=30)
+
+    async def scenario():
+        await cache.get("b", "q1", counting_loader([], "x" * 10))
+        await cache.get("b", "q2", counting_loader([], "y" * 10))
+        await cache.get("b", "q1", counting_loader([], "unused"))   # q1 を最新に
+        await cache.get("b", "q3", counting_loader([], "z" * 10))   # q2 が追い出される
+
+    asyncio.run(scenario())
+    keys = [k[1] for k in cache._entries]
+    assert keys == ["q1", "q3"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cancelled_first_caller_does_not_fail_coalesced_waiters():
+    cache = QueryCache(ttl=60, max_bytes=10_000)
+    calls = []
+
+    async def scenario():
+        loader = counting_loader(calls, [1], delay=0.05)
+        first = asyncio.ensure_future(cache.get("b", "q", loader))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get("b", "q", loader))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await waiter
+
+    assert asyncio.run(scenario()) == [1]
+    assert len(calls) == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_ttl_is_capped_with_multiple_workers():
+    assert QueryCache(ttl=60, workers=1).ttl == 60
+    assert QueryCache(ttl=60, workers=4).ttl <= 1
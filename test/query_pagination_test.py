@@ -0,0 +1,130 @@
+# test/query_pagination_test.py
+# ------------------------------------------------------------
+# /query のカーソルページング：同時刻に多数の series がある時も含め、
+# 全ページを辿ると重複・欠落なく (_time, series) 順に全行が返ること、
+# 行数上限（413）と不正なカーソル（400）（Influx は付加した Flux を解釈するスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+import re
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.query_api as query_api
+from modules.query_pagination import (
+    QueryCursorError, QueryRowLimitError, decode_cursor, encode_cursor, paginate, series_key,
+)
+from utils.query_cache import QueryCache
+
+_AFTER = re.compile(r"r\._time > time\(v: (-?\d+)\)")
+_AT = re.compile(r"r\._time == time\(v: (-?\d+)\)")
+_LIMIT = re.compile(r"limit\(n: (\d+)\)")
+
+
+def dataset(shard: int):
+    # 時刻 0〜9、各時刻に host 0〜6（時刻 5 だけ 40 host）。シャードは host の偶奇
+    rows = []
+    for t in range(10):
+        for h in range(40 if t == 5 else 7):
+            if h % 2 == shard:
+                rows.append({"result": "_result", "table": h, "_time": f"t{t}", "_value": t * 100 + h,
+                             "_measurement": "cpu", "_field": "v", "host": f"h{h:02d}", "_cursor": t})
+    return rows
+
+
+def fake_influx(stage: str, rows: list[dict]) -> list[dict]:
+    if m := _AFTER.search(stage):
+        rows = [r for r in rows if r["_cursor"] > int(m.group(1))]
+    if m := _AT.search(stage):
+        rows = [r for r in rows if r["_cursor"] == int(m.group(1))]
+    # Influx 側の同時刻の並びは不定（ここでは host 逆順）
+    rows = sorted(rows, key=lambda r: (r["_cursor"], -r["table"]))
+    return [dict(r) for r in rows[:int(_LIMIT.search(stage).group(1))]]
+
+
+def fetch(stage):
+    return [fake_influx(stage, dataset(0)), fake_influx(stage, dataset(1))]
+
+
+def walk(page_size):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = paginate(fetch, page_size, cursor, max_rows=100)
+        pages.append(rows)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 7, 10, 39, 41, 100])
+def test_walking_all_pages_returns_every_row_once_in_order(page_size):
+    pages = walk(page_size)
+    rows = [r for page in pages for r in page]
+    expected = sorted(dataset(0) + dataset(1), key=lambda r: (r["_cursor"], series_key(r)))
+
+    assert [r["_value"] for r in rows] == [r["_value"] for r in expected]
+    assert all(0 < len(page) <= page_size for page in pages if page)
+    assert all("_cursor" not in r for r in rows)
+
+
+def test_cursor_round_trip_and_errors():
+    key = (("_field", "v"), ("host", "a b"))
+    assert decode_cursor(encode_cursor(123, key)) == (123, key)
+    assert decode_cursor(encode_cursor(-5, None)) == (-5, None)
+    for bad in ("", "nope", encode_cursor(1, None)[:-3] + "!!!"):
+        with pytest.raises(QueryCursorError):
+            decode_cursor(bad)
+    with pytest.raises(QueryCursorError):
+        paginate(fetch, 0)
+    # 1 つの時刻（時刻 5 の 40 行）が上限を超える
+    with pytest.raises(QueryRowLimitError):
+        cursor = None
+        for _ in range(100):
+            _, cursor = paginate(fetch, 5, cursor, max_rows=30)
+
+
+def make_client(monkeypatch, n=50):
+    monkeypatch.setattr(query_api, "query_cache", QueryCache())
+    monkeypatch.setattr(query_api, "QUERY_MAX_ROWS", 100)
+
+    def fake_query(bucket, query, max_rows=None):
+        if "group()" in query:
+            return fake_influx(query, dataset(0))
+        rows = [{"_value": i} for i in range(n)]
+        if max_rows is not None and len(rows) > max_rows:
+            raise QueryRowLimitError(f"Query returned more than {max_rows} rows")
+        return rows
+
+    monkeypatch.setattr(query_api, "influx_query", fake_query)
+    app = FastAPI()
+    app.include_router(query_api.router, prefix="/query")
+    return TestClient(app)
+
+
+def test_query_api_pages_and_caps(monkeypatch):
+    client = make_client(monkeypatch, n=150)
+    params = {"q": "range(start: -1h)"}
+
+    first = client.get("/query/query", params={**params, "page_size": 4}).json()
+    second = client.get("/query/query", params={**params, "page_size": 4, "cursor": first["next_cursor"]}).json()
+    assert [r["host"] for r in first["results"]] == ["h00", "h02", "h04", "h06"]
+    assert second["results"][0]["_value"] == 100
+
+    too_many = client.get("/query/query", params=params)
+    bad_cursor = client.get("/query/query", params={**params, "cursor": "garbage"})
+    streamed = client.get("/query/query", params={**params, "page_size": 4, "format": "ndjson"})
+    assert too_many.status_code == 413 and "page_size" in too_many.json()["detail"]
+    assert bad_cursor.status_code == 400 and streamed.status_code == 400
+
+    small = make_client(monkeypatch, n=20).get("/query/query", params=params).json()
+    assert len(small["results"]) == 20 and "next_cursor" not in small
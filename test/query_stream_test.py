@@ -0,0 +1,73 @@
+# test/query_stream_test.py
+# ------------------------------------------------------------
+# Query API ストリーミング（NDJSON / CSV）テスト（Influx はスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+import json
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.query_api as query_api
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_client(monkeypatch, n=1200):
+    def fake_stream(bucket, query):
+        if "broken" in query:
+            raise RuntimeError("bad flux")
+        for i in range(n):
+            yield {"_time": T0, "_value": i, "_measurement": "m"}
+
+    def fake_csv(bucket, query):
+        yield ["", "result", "table", "_value"]
+        for i in range(n):
+            yield ["", "_result", "0", str(i)]
+
+    monkeypatch.setattr(query_api, "influx_query_stream", fake_stream)
+    monkeypatch.setattr(query_api, "influx_query_csv", fake_csv)
+
+    app = FastAPI()
+    app.include_router(query_api.router, prefix="/query")
+    return TestClient(app)
+
+
+def test_ndjson_by_format_param(monkeypatch):
+    client = make_client(monkeypatch)
+    res = client.get("/query/query", params={"q": "range(start: -1h)", "format": "ndjson"})
+
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    lines = res.text.strip().split("\n")
+    assert len(lines) == 1200
+    assert json.loads(lines[0]) == {"_time": T0.isoformat(), "_value": 0, "_measurement": "m"}
+
+
+def test_csv_by_accept_header(monkeypatch):
+    client = make_client(monkeypatch, n=3)
+    res = client.get("/query/query", params={"q": "x"}, headers={"Accept": "text/csv"})
+
+    assert res.headers["content-type"].startswith("text/csv")
+    assert res.text.split("\n")[:2] == [",result,table,_value", ",_result,0,0"]
+
+
+def test_query_error_before_stream_starts(monkeypatch):
+    client = make_client(monkeypatch)
+    res = client.get("/query/query", params={"q": "broken", "format": "ndjson"})
+    assert res.status_code == 500
+
+
+def test_unknown_format_is_400(monkeypatch):
+    client = make_client(monkeypatch)
+    assert client.get("/query/query", params={"format": "xml"}).status_code == 400
@@ -0,0 +1,72 @@
+# test/ready_test.py
+# ------------------------------------------------------------
+# 遅延初期化と GET /ready（backend ごとの probe 結果）
+# ------------------------------------------------------------
+
+import sys
+import os
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.health_api as health_api
+
+
+def test_import_does_not_build_clients_or_need_env():
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("INFLUX_", "NOTION_"))}
+    out = subprocess.check_output(
+        [sys.executable, "-c",
+         "import sys, server.app; server.app.create_app();"
+         "print('influxdb_client' in sys.modules, 'notion_client' in sys.modules)"],
+        cwd=PROJECT_ROOT, env=env, text=True,
+    )
+    assert out.split() == ["False", "False"]
+
+
+def make_client(monkeypatch, influx, notion):
+    monkeypatch.setattr(health_api, "influx_ping", influx)
+    monkeypatch.setattr(health_api, "notion_ping", notion)
+    app = FastAPI()
+    app.include_router(health_api.router)
+    return TestClient(app)
+
+
+def test_ready_reports_each_backend(monkeypatch):
+    async def notion_ok():
+        return True
+
+    client = make_client(monkeypatch, lambda target=None: True, notion_ok)
+    res = client.get("/ready")
+    assert res.status_code == 200
+    assert res.json()["backends"]["influx"]["status"] == "ok"
+    assert res.json()["backends"]["notion"]["status"] == "ok"
+
+
+def test_ready_is_503_when_a_backend_is_down(monkeypatch):
+    async def notion_down():
+        raise RuntimeError("環境変数 NOTION_TOKEN_AUTOJOURNAL が未設定です。")
+
+    monkeypatch.setattr(health_api, "READY_TIMEOUT", 0.05)
+
+    async def notion_hangs():
+        await asyncio.sleep(1)
+
+    client = make_client(monkeypatch, lambda target=None: False, notion_down)
+    res = client.get("/ready")
+    assert res.status_code == 503
+    body = res.json()["backends"]
+    assert body["influx"] == {"status": "error", "latency_ms": body["influx"]["latency_ms"], "error": "ping failed"}
+    assert "NOTION_TOKEN" in body["notion"]["error"]
+
+    client = make_client(monkeypatch, lambda target=None: True, notion_hangs)
+    assert "timeout" in client.get("/ready").json()["backends"]["notion"]["error"]
+
+    # /health は backend に触れないので 200 のまま
+    assert client.get("/health").status_code == 200
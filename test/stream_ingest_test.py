@@ -0,0 +1,144 @@
+# test/stream_ingest_test.py
+# ------------------------------------------------------------
+# stream ingest（WS / chunked HTTP）：JSON 行と line protocol の混在、累積 ack、
+# 行ごとの reject、writer が詰まった時の pause / resume（Influx 書き込みはスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+import json
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import gzip
+import threading
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+import routes.stream_api as stream_api
+from modules.line_protocol import parse_line, LineProtocolError
+from utils.influx_writer import WriterQueueFull
+
+
+@pytest.fixture
+def stream_app(monkeypatch, fake_ingest_app):
+    monkeypatch.setattr(stream_api, "STREAM_ACK_INTERVAL", 0)
+    monkeypatch.setattr(stream_api, "STREAM_FLUSH_INTERVAL", 0.01)
+
+    def build(**writer_opts):
+        writer_opts.setdefault("batch_size", 10)
+        return fake_ingest_app((stream_api.router, "/ingest"), module=stream_api, **writer_opts)
+
+    return build
+
+
+LINES = [
+    'cpu,host=a usage=0.5,n=3i 1700000000000000000',
+    json.dumps({"measurement": "mem", "fields": {"used": 10}}),
+    '',
+    '# comment',
+    'broken line',
+    'disk,host=a free=1',
+]
+
+
+def test_parse_line_protocol():
+    assert parse_line('cpu,host=a,dc=eu\\ west v=1,s="a \\"b\\"",ok=t,n=2i 123') == {
+        "measurement": "cpu", "tags": {"host": "a", "dc": "eu west"},
+        "fields": {"v": 1.0, "s": 'a "b"', "ok": True, "n": 2}, "timestamp": 123,
+    }
+    assert parse_line("m\\,x,k\\=1=v\\,2 f=1")["tags"] == {"k=1": "v,2"}
+    for bad in ("cpu", "cpu v=", 'cpu s="x', "cpu v=1 ts", "cpu v=abc", "cpu,t v=1"):
+        with pytest.raises(LineProtocolError):
+            parse_line(bad)
+
+
+def test_http_stream_acks_cumulatively(stream_app):
+    client, calls, _ = stream_app()
+    body = gzip.compress("\n".join(LINES).encode())
+    with client:
+        res = client.post("/ingest/stream?mode=sandbox", content=body, headers={"content-encoding": "gzip"})
+
+    acks = [json.loads(line) for line in res.text.splitlines()]
+    final = acks[-1]
+    assert final["final"] is True
+    assert final["seq"] == 4 and final["accepted"] == 3 and final["rejected"] == 1
+    errors = [e for a in acks for e in a.get("errors", [])]
+    assert errors[0]["line"] == 3
+    assert all(a["accepted"] + a["rejected"] == a["seq"] for a in acks if "seq" in a)
+
+    points = {p["measurement"]: (bucket, p) for bucket, ps in calls for p in ps}
+    assert set(points) == {"cpu", "mem", "disk"}
+    assert points["cpu"][0] == "chrono_test"
+    assert points["cpu"][1]["timestamp"] == 1700000000000000000
+    # line protocol の 3i は int のまま（float にすると既存の int field と型が衝突する）
+    assert points["cpu"][1]["fields"] == {"usage": 0.5, "n": 3}
+    assert type(points["cpu"][1]["fields"]["n"]) is int
+
+
+def test_websocket_stream(stream_app):
+    client, calls, _ = stream_app()
+    with client, client.websocket_connect("/ingest/stream") as ws:
+        ws.send_text("\n".join(LINES[:2]))
+        ws.send_text("\n".join(LINES[4:]))
+        ws.send_text("")
+        messages = []
+        while True:
+            msg = ws.receive_json()
+            messages.append(msg)
+            if msg.get("final"):
+                break
+
+    assert messages[-1]["seq"] == 4 and messages[-1]["accepted"] == 3
+    assert sum(len(p) for _, p in calls) == 3
+
+
+def test_stream_pauses_when_writer_falls_behind(monkeypatch, stream_app):
+    gate = threading.Event()
+    client, calls, _ = stream_app(sink=lambda bucket, points: gate.wait(), queue_max=20)
+    monkeypatch.setattr(stream_api, "STREAM_BATCH", 10)
+
+    body = "\n".join(f"cpu v={i}" for i in range(60)).encode()
+    threading.Timer(0.3, gate.set).start()
+    with client:
+        res = client.post("/ingest/stream", content=body)
+
+    acks = [json.loads(line) for line in res.text.splitlines()]
+    pauses = [a["pause"] for a in acks if "pause" in a]
+    assert pauses and pauses[0] is True and pauses[-1] is False
+    assert acks[-1]["seq"] == 60 and acks[-1]["accepted"] == 60
+    assert sum(len(p) for _, p in calls) == 60
+
+
+def test_websocket_closes_with_1013_when_writer_is_full(monkeypatch, stream_app):
+    client, calls, writer = stream_app()
+    monkeypatch.setattr(stream_api, "STREAM_BATCH", 2)
+    submit = writer.submit
+
+    def submit_once(bucket, points, durable=True):
+        if calls or writer.stats["enqueued"]:
+            raise WriterQueueFull("writer queue full")
+        return submit(bucket, points, durable)
+
+    monkeypatch.setattr(writer, "submit", submit_once)
+    messages = []
+    with client, client.websocket_connect("/ingest/stream") as ws:
+        ws.send_text("\n".join(f"cpu v={i}i,ok=true" for i in range(4)))
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                messages.append(ws.receive_json())
+
+    assert closed.value.code == 1013
+    assert any(m.get("overloaded") for m in messages)
+    final = messages[-1]
+    # 投入できた 2 行だけ accepted、投入できなかった 2 行は reject（seq は 4 まで）
+    assert final["final"] is True
+    assert final["accepted"] == 2 and final["rejected"] == 2 and final["seq"] == 4
+    assert calls and calls[0][1][0]["fields"] == {"v": 0, "ok": True}
@@ -0,0 +1,79 @@
+# test/timestamps_test.py
+# ------------------------------------------------------------
+# timestamp → epoch ns：RFC3339 の ns 精度 / precision 換算 / バッチのエラー位置、
+# ingest の ?precision と writer に渡る int ns（Influx 書き込みはスタブ）
+# ------------------------------------------------------------
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("INFLUX_URL", "http://localhost:8086")
+os.environ.setdefault("INFLUX_TOKEN", "test-token")
+os.environ.setdefault("INFLUX_ORG", "test-org")
+
+import pytest
+
+from modules.timestamps import TimestampError, parse_rfc3339, precision_factor, to_ns, to_ns_batch
+
+T = 1700000000  # 2023-11-14T22:13:20Z
+
+
+@pytest.mark.parametrize("s, ns", [
+    ("2023-11-14T22:13:20Z", T * 10 ** 9),
+    ("2023-11-14T22:13:20.5Z", T * 10 ** 9 + 500_000_000),
+    ("2023-11-14T22:13:20.123456789Z", T * 10 ** 9 + 123_456_789),
+    ("2023-11-14T22:13:20.1234567Z", T * 10 ** 9 + 123_456_700),
+    ("2023-11-15T07:13:20.000000001+09:00", T * 10 ** 9 + 1),
+    ("2023-11-14T22:13:20", T * 10 ** 9),
+    ("1969-12-31T23:59:59Z", -10 ** 9),
+])
+def test_parse_rfc3339_keeps_nanoseconds(s, ns):
+    assert parse_rfc3339(s) == ns
+
+
+def test_to_ns_precisions_and_errors():
+    assert to_ns(None) is None
+    assert to_ns(T, precision_factor("s")) == T * 10 ** 9
+    assert to_ns(str(T * 1000), precision_factor("ms")) == T * 10 ** 9
+    assert to_ns(T + 0.25, precision_factor("s")) == T * 10 ** 9 + 250_000_000
+    assert precision_factor(None) == 1
+    for bad in ("yesterday", "2023-13-01T00:00:00Z", True):
+        with pytest.raises(TimestampError):
+            to_ns(bad)
+    with pytest.raises(TimestampError):
+        precision_factor("h")
+
+
+def test_to_ns_batch_reports_error_positions():
+    assert to_ns_batch([1, 2, 3], 1000) == ([1000, 2000, 3000], {})
+    out, errors = to_ns_batch([T, "bad", None, "2023-11-14T22:13:20Z"], 10 ** 9)
+    assert out == [T * 10 ** 9, None, None, T * 10 ** 9]
+    assert list(errors) == [1]
+
+
+def test_ingest_precision_reaches_writer_as_int_ns(fake_ingest_app):
+    client, calls, _ = fake_ingest_app()
+
+    body = [
+        {"measurement": "ts", "fields": {"v": 1}, "timestamp": T},
+        {"measurement": "ts", "fields": {"v": 2}, "timestamp": "2023-11-14T22:13:21.000000001Z"},
+        {"measurement": "ts", "fields": {"v": 3}, "timestamp": "not a time"},
+    ]
+    with client:
+        batch = client.post("/ingest/ingest/batch?precision=s", json=body).json()
+        single = client.post("/ingest/ingest?precision=ms", json={"measurement": "ts", "fields": {"v": 4},
+                                                                  "timestamp": T * 1000 + 7})
+        bad_single = client.post("/ingest/ingest", json=body[2])
+        bad_precision = client.post("/ingest/ingest/batch?precision=h", json=body)
+
+    assert batch["status"] == "partial" and batch["rejected"] == 1
+    assert batch["results"][2]["status"] == "rejected"
+    assert single.status_code == 200
+    assert bad_single.status_code == 422 and bad_precision.status_code == 400
+
+    stamps = sorted(p["timestamp"] for _, points in calls for p in points)
+    assert stamps == [T * 10 ** 9, T * 10 ** 9 + 7_000_000, (T + 1) * 10 ** 9 + 1]
@@ -0,0 +1,173 @@
+# utils/cardinality.py
+"""
+ChronoNeura – tag の cardinality ガード（HyperLogLog による distinct 数の推定）
+
+- (measurement, tag key) ごとに HyperLogLog（2^p 個の 1 byte レジスタ）で distinct な値の数を推定する
+  p=10 で 1 KB / 誤差 約 3%。sketch 数は CARDINALITY_MAX_SKETCHES で打ち切る（メモリ上限）
+- 既定は無効（CARDINALITY_MAX_VALUES=0、全ての point をそのまま通す）。上限を設定した時だけ、
+  推定値が CARDINALITY_MAX_VALUES を超えた tag key は「制限中」になり、以降は
+  CARDINALITY_POLICY に従って扱う（DELETE /admin/cardinality/... で解除するまで続く）
+    demote : tag を field に移す（同名 field があれば {key}_tag）
+    drop   : tag を捨てる
+    reject : point を reject（API 側で 422 / バッチは行ごとの rejected）
+- 正規化の後・重複判定の前に適用する（書き込まれる point の tag を見る）
+- プロセスごとの推定（マルチワーカー時はワーカー単位で判定）
+"""
+
+import math
+import os
+from hashlib import blake2b
+
+CARDINALITY_MAX_VALUES = int(os.getenv("CARDINALITY_MAX_VALUES", "0"))      # 例：10000
+CARDINALITY_POLICY = os.getenv("CARDINALITY_POLICY", "demote")
+CARDINALITY_PRECISION = int(os.getenv("CARDINALITY_PRECISION", "10"))
+CARDINALITY_MAX_SKETCHES = int(os.getenv("CARDINALITY_MAX_SKETCHES", "10000"))
+
+POLICIES = ("demote", "drop", "reject")
+
+
+class HyperLogLog:
+    """64bit ハッシュの HyperLogLog。推定値は add ごとに差分更新した和から O(1) で出す"""
+
+    __slots__ = ("p", "m", "registers", "_sum", "_zeros")
+
+    def __init__(self, p: int = CARDINALITY_PRECISION):
+        if not 4 <= p <= 16:
+            raise ValueError("precision must be in 4..16")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._sum = float(self.m)     # Σ 2^-M[j]
+        self._zeros = self.m
+
+    def add(self, value: str) -> bool:
+        """レジスタが更新されたら True"""
+        h = int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+        j = h >> (64 - self.p)
+        w = h & ((1 << (64 - self.p)) - 1)
+        rho = (64 - self.p) - w.bit_length() + 1
+
+        old = self.registers[j]
+        if rho <= old:
+            return False
+        self.registers[j] = rho
+        self._sum += 2.0 ** -rho - 2.0 ** -old
+        if old == 0:
+            self._zeros -= 1
+        return True
+
+    def estimate(self) -> float:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        e = alpha * m * m / self._sum
+        # 小さい範囲は linear counting
+        if e <= 2.5 * m and self._zeros:
+            return m * math.log(m / self._zeros)
+        return e
+
+    def __len__(self):
+        return round(self.estimate())
+
+
+class CardinalityRejected(ValueError):
+    """reject policy で point を拒否（API 側で 422）"""
+
+
+class CardinalityGuard:
+
+    def __init__(self,
+                 max_values: int = CARDINALITY_MAX_VALUES,
+                 policy: str = CARDINALITY_POLICY,
+                 precision: int = CARDINALITY_PRECISION,
+                 max_sketches: int = CARDINALITY_MAX_SKETCHES):
+
+        if policy not in POLICIES:
+            raise RuntimeError(f"未知の cardinality policy：{policy}")
+
+        self.max_values = max_values
+        self.policy = policy
+        self.precision = precision
+        self.max_sketches = max_sketches
+
+        self._sketches: dict[tuple[str, str], HyperLogLog] = {}
+        self._limited: set[tuple[str, str]] = set()
+        self.stats = {"demoted": 0, "dropped": 0, "rejected": 0, "untracked": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_values > 0
+
+    def _observe(self, key: tuple[str, str], value: str) -> bool:
+        """値を sketch に入れ、制限中なら True"""
+        if key in self._limited:
+            return True
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            if len(self._sketches) >= self.max_sketches:
+                self.stats["untracked"] += 1
+                return False
+            sketch = self._sketches[key] = HyperLogLog(self.precision)
+        if sketch.add(value) and sketch.estimate() > self.max_values:
+            self._limited.add(key)
+            return True
+        return False
+
+    def apply(self, point: dict) -> list[str]:
+        """制限中の tag に policy を適用し（point を直接書き換える）、該当した tag key を返す。
+        reject なら CardinalityRejected"""
+        tags = point["tags"]
+        if not tags or not self.enabled:
+            return []
+
+        measurement = point["measurement"]
+        limited = [k for k, v in tags.items() if self._observe((measurement, k), v)]
+        if not limited:
+            return limited
+
+        if self.policy == "reject":
+            self.stats["rejected"] += 1
+            raise CardinalityRejected(
+                f"tag cardinality limit exceeded: {measurement}.{','.join(limited)} (max {self.max_values})")
+
+        fields = point["fields"]
+        for k in limited:
+            v = tags.pop(k)
+            if self.policy == "demote":
+                fields[f"{k}_tag" if k in fields else k] = v
+                self.stats["demoted"] += 1
+            else:
+                self.stats["dropped"] += 1
+        return limited
+
+    # ---------------------------------------------------------
+    # admin
+    # ---------------------------------------------------------
+    def estimates(self, measurement: str | None = None) -> list[dict]:
+        rows = [
+            {"measurement": m, "tag": k, "estimate": len(sketch), "limited": (m, k) in self._limited}
+            for (m, k), sketch in self._sketches.items()
+            if measurement is None or m == measurement
+        ]
+        rows.sort(key=lambda r: r["estimate"], reverse=True)
+        return rows
+
+    def reset(self, measurement: str, tag: str) -> bool:
+        """sketch と制限を外す（tag を意図的に許可する時 / 送信元を直した後）"""
+        key = (measurement, tag)
+        self._limited.discard(key)
+        return self._sketches.pop(key, None) is not None
+
+    def info(self) -> dict:
+        return {
+            "max_values": self.max_values,
+            "policy": self.policy,
+            "sketches": len(self._sketches),
+            "limited": len(self._limited),
+            **self.stats,
+        }
+
+
+# ------------------------------------
+# アプリ共有インスタンス（CARDINALITY_MAX_VALUES を設定した時だけ有効）
+# ------------------------------------
+cardinality_guard = CardinalityGuard()
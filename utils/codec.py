@@ -0,0 +1,186 @@
+# utils/codec.py
+"""
+ChronoNeura – ingest 本体のデコード / レスポンスのエンコード
+
+- Content-Encoding : gzip / deflate（標準ライブラリ）、zstd（zstandard があれば）
+                     展開後サイズは INGEST_MAX_BODY_BYTES で打ち切り（413、zstd も展開しながら数える）
+- Content-Type     : application/json（orjson があれば orjson）、
+                     application/msgpack（msgpack があれば）
+- FastJSONResponse : orjson でシリアライズ（無ければ標準 json）
+orjson / msgpack / zstandard は requirements.txt に含める（イメージでは全形式が有効）。
+import できない環境（requirements を入れていない開発環境など）では、無い形式を 415 にし、
+JSON は標準 json で扱う。
+"""
+
+import json
+import os
+import zlib
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INGEST_MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# 1 回の decompress で展開する最大バイト数（圧縮爆弾でもメモリを一気に使わない）
+_INFLATE_STEP = 1024 * 1024
+
+
+def json_loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def content_type(request: Request) -> str:
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+# --------------------------
+# Content-Encoding
+# --------------------------
+class _Inflater:
+    """zlib（gzip / deflate）を max_length ずつ展開する"""
+
+    def __init__(self, wbits: int):
+        self._d = zlib.decompressobj(wbits=wbits)
+
+    def feed(self, chunk: bytes):
+        data = self._d.decompress(chunk, _INFLATE_STEP)
+        while data:
+            yield data
+            data = self._d.decompress(self._d.unconsumed_tail, _INFLATE_STEP) if self._d.unconsumed_tail else b""
+
+    def finish(self):
+        data = self._d.flush()
+        if data:
+            yield data
+
+
+class _Zstd:
+    """zstd を stream_writer 経由で _INFLATE_STEP ずつ受け取る
+    （decompressobj は 1 回の入力を丸ごと展開するので、上限は出力を受け取る側で数えて打ち切る）
+    capped=False では 1 回の feed あたりの展開量を INGEST_MAX_BODY_BYTES で打ち切る"""
+
+    def __init__(self, capped: bool = True):
+        self._capped = capped
+        self._size = 0
+        self._out = []
+        self._w = zstandard.ZstdDecompressor().stream_writer(self, write_size=_INFLATE_STEP)
+
+    def write(self, data) -> int:
+        self._size += len(data)
+        if self._size > INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body too large (max {INGEST_MAX_BODY_BYTES} bytes)")
+        self._out.append(bytes(data))
+        return len(data)
+
+    def feed(self, chunk: bytes):
+        if not self._capped:
+            self._size = 0
+        self._w.write(chunk)
+        out, self._out = self._out, []
+        yield from out
+
+    def finish(self):
+        return iter(())
+
+
+def _decoder(request: Request, capped: bool = True):
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return _Inflater(wbits=31)
+    if encoding == "deflate":
+        return _Inflater(wbits=15)
+    if encoding == "zstd" and zstandard is not None:
+        return _Zstd(capped)
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+
+async def iter_body(request: Request, capped: bool = True):
+    """展開済みの本体をチャンク単位で yield（上限超過は 413、壊れた圧縮は 400）
+    capped=False は長時間の stream ingest 用（総量ではなく行の長さで制限する）"""
+    decoder = _decoder(request, capped)
+    total = 0
+
+    def _count(data: bytes) -> bytes:
+        nonlocal total
+        total += len(data)
+        if capped and total > INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body too large (max {INGEST_MAX_BODY_BYTES} bytes)")
+        return data
+
+    try:
+        async for chunk in request.stream():
+            if decoder is None:
+                if chunk:
+                    yield _count(chunk)
+                continue
+            for data in decoder.feed(chunk):
+                yield _count(data)
+        if decoder is not None:
+            for data in decoder.finish():
+                yield _count(data)
+    except (zlib.error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid compressed body: {e}")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise HTTPException(status_code=400, detail=f"Invalid compressed body: {e}")
+        raise
+
+
+async def read_body(request: Request) -> bytes:
+    return b"".join([chunk async for chunk in iter_body(request)])
+
+
+# --------------------------
+# Content-Type
+# --------------------------
+async def read_payload(request: Request):
+    """JSON / MessagePack の本体をデコードして返す（壊れていれば 400）"""
+    ctype = content_type(request)
+    is_msgpack = ctype in MSGPACK_TYPES
+    if is_msgpack and msgpack is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {ctype} (msgpack not installed)")
+
+    body = await read_body(request)
+    try:
+        if is_msgpack:
+            return msgpack.unpackb(body, raw=False)
+        return json_loads(body)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {'MessagePack' if is_msgpack else 'JSON'} body: {e}")
+
+
+# --------------------------
+# レスポンス
+# --------------------------
+class FastJSONResponse(JSONResponse):
+    """orjson があれば orjson でシリアライズする JSONResponse"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return json_dumps(content)
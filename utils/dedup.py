@@ -0,0 +1,91 @@
+# utils/dedup.py
+"""
+ChronoNeura – ingest の重複抑止（時間窓つきの in-memory dedup）
+
+- キーは 64bit の整数（blake2b 8 byte）だけを保持し、1 エントリあたりのメモリを抑える
+- 2 世代の set を window/2 ごとに入れ替える（古い世代ごと捨てるので期限切れ処理は O(1)）
+  → 記録した key は少なくとも window/2、最大 window の間「重複」と判定される
+- 1 世代が max_entries/2 を超えたら時間を待たずに入れ替える（メモリ上限）
+- 書き込みに失敗した key は discard して、リトライを抑止しないようにする
+- プロセスごとの窓（マルチワーカー時はワーカー単位で判定）
+"""
+
+import os
+import time
+from hashlib import blake2b
+
+INGEST_DEDUP_WINDOW = float(os.getenv("INGEST_DEDUP_WINDOW", "300"))
+INGEST_DEDUP_MAX = int(os.getenv("INGEST_DEDUP_MAX", "1000000"))
+
+# 正規化済み point の内容ハッシュでも重複判定する（既定は Idempotency-Key のみ）
+INGEST_DEDUP_HASH = os.getenv("INGEST_DEDUP_HASH", "0").lower() in ("1", "true", "yes")
+
+
+def _digest(data: bytes) -> int:
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+
+def request_key(idempotency_key: str) -> int:
+    return _digest(b"k\0" + idempotency_key.encode())
+
+
+def point_key(bucket: str, point: dict) -> int | None:
+    """(bucket, measurement, tags, fields, timestamp) のハッシュ。timestamp が無ければ None
+    （サーバ側で時刻を振る point は、同じ値でも別の観測なので重複扱いしない）"""
+    ts = point.get("timestamp")
+    if ts is None:
+        return None
+    body = repr((bucket, point["measurement"],
+                 sorted((point.get("tags") or {}).items()),
+                 sorted(point["fields"].items()), ts))
+    return _digest(b"p\0" + body.encode())
+
+
+class DedupWindow:
+
+    def __init__(self, window: float = INGEST_DEDUP_WINDOW, max_entries: int = INGEST_DEDUP_MAX):
+        self.window = window
+        self.max_entries = max_entries
+        self._current: set = set()
+        self._previous: set = set()
+        self._rotated = time.monotonic()
+        self.stats = {"checked": 0, "suppressed": 0, "rotations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        if now - self._rotated >= self.window / 2 or len(self._current) >= self.max_entries // 2:
+            # 半窓を 2 回以上空けたら、前の世代も期限切れ
+            self._previous = self._current if now - self._rotated < self.window else set()
+            self._current = set()
+            self._rotated = now
+            self.stats["rotations"] += 1
+
+    def seen(self, key: int) -> bool:
+        """既出なら True、初出なら記録して False"""
+        self._maybe_rotate()
+        self.stats["checked"] += 1
+        if key in self._current or key in self._previous:
+            self.stats["suppressed"] += 1
+            return True
+        self._current.add(key)
+        return False
+
+    def discard(self, key: int):
+        self._current.discard(key)
+        self._previous.discard(key)
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def info(self) -> dict:
+        return {"window": self.window, "size": len(self), "hash": INGEST_DEDUP_HASH, **self.stats}
+
+
+# ------------------------------------
+# アプリ共有インスタンス（INGEST_DEDUP_WINDOW=0 で無効）
+# ------------------------------------
+ingest_dedup = DedupWindow()
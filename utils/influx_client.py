@@ -1,67 +1,179 @@
 # utils/influx_client.py
 # ChronoNeura InfluxDB Client v1
+#   influxdb_client の import とクライアント生成は初回使用時まで遅らせる
+#   （プロセス起動を軽くし、Influx 不達でも起動・/health は通す。状態は /ready で見る）
+#   INFLUX_TARGETS で複数台を設定した場合はターゲットごとにクライアント（接続プール）を持ち、
+#   書き込み先・問い合わせ先は modules/influx_router.py のキー（"target/bucket"）で指定する
 
 import os
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+import threading
 
-INFLUX_URL = os.getenv("INFLUX_URL")
-INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
-INFLUX_ORG = os.getenv("INFLUX_ORG")
+from modules.influx_router import influx_router
+from modules.line_protocol import line_encoder
+from modules.query_pagination import QueryRowLimitError
+from utils.metrics import timed_stage, record_error, points_written
+
+INFLUX_TIMEOUT_MS = int(os.getenv("INFLUX_TIMEOUT_MS", "10000"))
 
 # ------------------------------------
-# InfluxDB クライアント生成
+# InfluxDB クライアント（ターゲットごとに遅延生成、lifespan 終了時に close_client）
 # ------------------------------------
-client = InfluxDBClient(
-    url=INFLUX_URL,
-    token=INFLUX_TOKEN,
-    org=INFLUX_ORG,
-    timeout=10000,
-)
+_clients: dict[str, dict] = {}
+_client_lock = threading.Lock()
+
+
+def influx_targets() -> list[str]:
+    return list(influx_router.targets)
+
+
+def get_client(target: str | None = None):
+    """{"client", "write_api", "query_api", "org"} を返す（ターゲットごとに初回のみ生成）"""
+    name = target or influx_router.default_target
+    entry = _clients.get(name)
+    if entry:
+        return entry
+
+    with _client_lock:
+        if name not in _clients:
+            conf = influx_router.targets.get(name)
+            if conf is None:
+                raise RuntimeError(f"Unknown Influx target: {name}")
+            if not conf.url:
+                raise RuntimeError("環境変数 INFLUX_URL が未設定です。")
+
+            from influxdb_client import InfluxDBClient
+            from influxdb_client.client.write_api import SYNCHRONOUS
+
+            client = InfluxDBClient(
+                url=conf.url,
+                token=conf.token,
+                org=conf.org,
+                timeout=INFLUX_TIMEOUT_MS,
+            )
+            # バッチングは utils/influx_writer.py 側で行うため、ここは同期書き込み
+            _clients[name] = {
+                "client": client,
+                "write_api": client.write_api(write_options=SYNCHRONOUS),
+                "query_api": client.query_api(),
+                "org": conf.org,
+            }
+    return _clients[name]
+
+
+def close_client():
+    with _client_lock:
+        for entry in _clients.values():
+            entry["client"].close()
+        _clients.clear()
 
-write_api = client.write_api(write_options=WriteOptions(batch_size=1))
-query_api = client.query_api()
+
+def influx_ping(target: str | None = None) -> bool:
+    """Influx の /ping（readiness 用）"""
+    return get_client(target)["client"].ping()
 
 
 # ------------------------------------
-# 書き込みモジュール（正式名：influx_write_point）
+# line protocol 生成（単発・バッチ共通）
+#   Point を組み立てず modules/line_protocol.py のエンコーダで直接 bytes にする
+#   （出力は Point.to_line_protocol() と同じ。timestamp は int ns）
 # ------------------------------------
-def influx_write_point(bucket: str, measurement: str, fields: dict, tags: dict, timestamp: str | None):
-    try:
-        p = Point(measurement)
-
-        # tags
-        for k, v in tags.items():
-            p = p.tag(k, v)
+def _ns():
+    from influxdb_client import WritePrecision
+    return WritePrecision.NS
 
-        # fields
-        for k, v in fields.items():
-            p = p.field(k, v)
 
-        # timestamp
-        if timestamp:
-            p = p.time(timestamp)
+# ------------------------------------
+# バッチ書き込み（同一 bucket の複数 point を 1 回の write で送る）
+#   bucket: 書き込み先キー（bucket 名、またはシャード時は "target/bucket"）
+#   points: [{"measurement", "fields", "tags", "timestamp"}, ...]
+# ------------------------------------
+def influx_write_points(bucket: str, points: list[dict]):
+    if not points:
+        return 0
 
-        write_api.write(bucket=bucket, record=p)
-        return True
+    try:
+        with timed_stage("line_protocol"):
+            body = line_encoder.encode(points)
+        target, bucket = influx_router.split(bucket)
+        write_api = get_client(target)["write_api"]
+        with timed_stage("influx_write", "influx"):
+            write_api.write(bucket=bucket, record=body, write_precision=_ns())
+        points_written.inc(value=len(points))
+        return len(points)
 
     except Exception as e:
-        raise RuntimeError(f"Influx write failed: {e}")
+        raise RuntimeError(f"Influx batch write failed: {e}")
 
 
 # ------------------------------------
 # クエリモジュール
+#   bucket はいずれも書き込み先と同じキー（"target/bucket" なら持ち主のターゲットへ問い合わせる）
 # ------------------------------------
-def influx_query(bucket: str, query: str):
+def _flux(bucket: str, query: str) -> tuple[str, str]:
+    target, bucket = influx_router.split(bucket)
+    return target, f'from(bucket:"{bucket}") |> {query}'
+
+
+def influx_query(bucket: str, query: str, max_rows: int | None = None):
+    target, q = _flux(bucket, query)
+    return influx_query_flux(q, target, max_rows)
+
+
+# ------------------------------------
+# 完成済み Flux をそのまま実行（modules/flux_builder.py の出力など）
+#   max_rows を超えたら読むのをやめて QueryRowLimitError（結果を全部メモリに載せない）
+# ------------------------------------
+def influx_query_flux(q: str, target: str | None = None, max_rows: int | None = None):
     try:
-        q = f'from(bucket:"{bucket}") |> {query}'
-        tables = query_api.query(org=INFLUX_ORG, query=q)
+        client = get_client(target)
+        if max_rows is None:
+            with timed_stage("influx_query", "influx"):
+                tables = client["query_api"].query(org=client["org"], query=q)
+            return [row.values for table in tables for row in table.records]
 
         results = []
-        for table in tables:
-            for row in table.records:
-                results.append(row.values)
-
+        with timed_stage("influx_query", "influx"):
+            for record in client["query_api"].query_stream(org=client["org"], query=q):
+                if len(results) >= max_rows:
+                    raise QueryRowLimitError(f"Query returned more than {max_rows} rows")
+                results.append(record.values)
         return results
 
+    except QueryRowLimitError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Influx query failed: {e}")
+
+
+# ------------------------------------
+# ストリーミングクエリ（結果を溜めずに 1 レコードずつ返す）
+#   - influx_query_stream : FluxRecord.values の dict を逐次 yield
+#   - influx_query_csv    : Influx の CSV 行（list[str]）を逐次 yield（annotation なし）
+#   どちらもジェネレータで、最初の next() で Influx へ問い合わせる
+# ------------------------------------
+def _csv_dialect():
+    from influxdb_client import Dialect
+    return Dialect(header=True, annotations=[], delimiter=",", date_time_format="RFC3339")
+
+
+def influx_query_stream(bucket: str, query: str):
+    try:
+        target, q = _flux(bucket, query)
+        client = get_client(target)
+        for record in client["query_api"].query_stream(org=client["org"], query=q):
+            yield record.values
+
+    except Exception as e:
+        record_error("influx", e)
+        raise RuntimeError(f"Influx query failed: {e}")
+
+
+def influx_query_csv(bucket: str, query: str):
+    try:
+        target, q = _flux(bucket, query)
+        client = get_client(target)
+        yield from client["query_api"].query_csv(org=client["org"], query=q, dialect=_csv_dialect())
+
     except Exception as e:
+        record_error("influx", e)
         raise RuntimeError(f"Influx query failed: {e}")
@@ -0,0 +1,377 @@
+# utils/influx_rollup.py
+"""
+ChronoNeura – ingest 側の事前集約（rollup）
+
+高頻度の measurement（100 Hz のセンサーなど）を、正規化の後で window ごとに 1 point へ
+まとめてから Influx writer へ流す。
+
+  INGEST_ROLLUP='{"accel_*": "1s", "temp": {"window": "10s", "aggs": ["mean", "last"]}}'
+  （JSON 文字列 または JSON ファイルのパス。measurement は glob で、先に一致したものが優先）
+
+- series（書き込み先キー, measurement, tags）ごとに、開いている window 1 つ分のアキュムレータを持つ
+  数値 field（float / int）は {f}_min / {f}_max / {f}_mean / {f}_count / {f}_last（aggs で選択）、
+  それ以外は {f}_last
+- window は timestamp（無ければ受信時刻）を window 幅で切り捨てて決め、集約 point の時刻は window の開始
+- window を閉じる契機
+    * 同じ series に次の window の point が来た
+    * window の終端を過ぎ、INGEST_ROLLUP_IDLE 秒 point が来ていない（tick で確認）
+    * 停止時（lifespan で writer より先に drain する）
+- series ごとに最後に閉じた window（アキュムレータごと、最大 INGEST_ROLLUP_MAX_SERIES 件）も残す
+    * その window に入る遅着 point は合算し、合算後の集約 point を同じ時刻で書き直す（stats["merged"]）
+      （閉じた後に新しい window として書くと、Influx 上で先の集約を部分的な集約で上書きしてしまう）
+    * それより前の point は RollupLate で拒否する（ack しない、stats["late"]）
+- series 数が INGEST_ROLLUP_MAX_SERIES に達したら、新しい series は集約せずそのまま書く
+- writer が詰まっている間、閉じた window は INGEST_ROLLUP_MAX_PENDING 件まで保持して次の tick で再送
+  （超えた分は捨てて stats["dropped"] / chrono_rollup_dropped_total に数える）
+- ack は受け付け時点（集約 point は後から書く。プロセスが落ちると開いている window は失われる）
+
+!! 集約の状態はプロセスごと。マルチワーカー（server/serve.py の CHRONO_WORKERS > 1）では
+   同じ series が複数のワーカーに割れ、同じ window 時刻の集約 point を各ワーカーが書く
+   （Influx は最後の 1 つだけ残すので min / max / mean / count が黙って壊れる）。
+   そのため INGEST_ROLLUP はワーカーが 1 つの時だけ有効で、複数ワーカーでは起動時にエラーにする
+"""
+
+import asyncio
+import fnmatch
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from modules.flux_builder import duration_seconds
+from utils.influx_spool import SpoolFull
+from utils.influx_writer import influx_writer, WriterQueueFull
+from utils.metrics import rollup_dropped
+from utils.query_cache import query_cache
+from utils.worker import WORKERS
+
+INGEST_ROLLUP = os.getenv("INGEST_ROLLUP", "")
+INGEST_ROLLUP_IDLE = float(os.getenv("INGEST_ROLLUP_IDLE", "1"))
+INGEST_ROLLUP_MAX_SERIES = int(os.getenv("INGEST_ROLLUP_MAX_SERIES", "100000"))
+INGEST_ROLLUP_MAX_PENDING = int(os.getenv("INGEST_ROLLUP_MAX_PENDING", "100000"))
+
+AGGS = ("min", "max", "mean", "count", "last")
+
+
+class RollupLate(ValueError):
+    """集約済み（合算できない）window への遅着 point"""
+
+
+class RollupRule(NamedTuple):
+    pattern: str
+    window: float
+    aggs: tuple
+
+
+def parse_rules(config) -> list[RollupRule]:
+    """{"pattern": "1s" | 秒数 | {"window", "aggs"}} → [RollupRule]"""
+    rules = []
+    for pattern, spec in (config or {}).items():
+        if not isinstance(spec, dict):
+            spec = {"window": spec}
+        window = spec.get("window")
+        window = float(window) if isinstance(window, (int, float)) else duration_seconds(str(window))
+        if window <= 0:
+            raise ValueError(f"{pattern}: window must be positive")
+        aggs = tuple(spec.get("aggs") or AGGS)
+        unknown = set(aggs) - set(AGGS)
+        if unknown:
+            raise ValueError(f"{pattern}: unknown aggs {sorted(unknown)}")
+        rules.append(RollupRule(pattern, window, aggs))
+    return rules
+
+
+def load_rules(raw: str = INGEST_ROLLUP) -> list[RollupRule]:
+    raw = raw.strip()
+    if not raw:
+        return []
+    try:
+        if raw[0] == "{":
+            return parse_rules(json.loads(raw))
+        with open(raw, encoding="utf-8") as f:
+            return parse_rules(json.load(f))
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"INGEST_ROLLUP の読み込みに失敗しました: {e}")
+
+
+def _epoch(ts: str | int | None, now: float) -> float | None:
+    if ts is None:
+        return now
+    if type(ts) is int:
+        # ingest で正規化済みの int ns
+        return ts / 1e9
+    try:
+        t = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+class _Window:
+    __slots__ = ("rule", "start", "scope", "touched", "num", "other")
+
+    def __init__(self, rule: RollupRule, start: float, scope: str, now: float):
+        self.rule = rule
+        self.start = start
+        self.scope = scope
+        self.touched = now
+        self.num: dict[str, list] = {}      # field -> [count, sum, min, max, last]
+        self.other: dict[str, object] = {}  # 数値以外の field -> last
+
+    def add(self, fields: dict, now: float):
+        self.touched = now
+        for k, v in fields.items():
+            # 正規化後の数値 field は float、line protocol の整数（5i）は int。bool・文字列は last のみ
+            if type(v) is not float and type(v) is not int:
+                self.other[k] = v
+                continue
+            acc = self.num.get(k)
+            if acc is None:
+                self.num[k] = [1, v, v, v, v]
+            else:
+                acc[0] += 1
+                acc[1] += v
+                if v < acc[2]:
+                    acc[2] = v
+                if v > acc[3]:
+                    acc[3] = v
+                acc[4] = v
+
+    def fields(self) -> dict:
+        aggs = self.rule.aggs
+        out = {}
+        for k, (count, total, lo, hi, last) in self.num.items():
+            if "min" in aggs:
+                out[f"{k}_min"] = lo
+            if "max" in aggs:
+                out[f"{k}_max"] = hi
+            if "mean" in aggs:
+                out[f"{k}_mean"] = total / count
+            if "count" in aggs:
+                out[f"{k}_count"] = count
+            if "last" in aggs:
+                out[f"{k}_last"] = last
+        if "last" in aggs:
+            for k, v in self.other.items():
+                out[f"{k}_last"] = v
+        return out
+
+
+class InfluxRollup:
+
+    def __init__(self,
+                 rules: list[RollupRule],
+                 writer=influx_writer,
+                 idle: float = INGEST_ROLLUP_IDLE,
+                 max_series: int = INGEST_ROLLUP_MAX_SERIES,
+                 max_pending: int = INGEST_ROLLUP_MAX_PENDING,
+                 workers: int = WORKERS):
+        self.rules = rules
+        self.writer = writer
+        self.idle = idle
+        self.max_series = max_series
+        self.max_pending = max_pending
+        self.workers = workers
+        self.tick = max(0.05, min(0.5, idle / 2))
+
+        self._rule_cache: dict[str, RollupRule | None] = {}
+        self._series: dict[tuple, _Window] = {}
+        self._closed: OrderedDict[tuple, _Window] = OrderedDict()   # series -> 最後に閉じた window
+        self._out: list[tuple[str, str, dict]] = []   # 閉じた window：(書き込み先キー, cache scope, point)
+        self._task: asyncio.Task | None = None
+        self._stopping: asyncio.Event | None = None
+
+        self.stats = {"points": 0, "emitted": 0, "late": 0, "merged": 0, "overflow": 0, "failed": 0,
+                      "dropped": 0}
+
+    # ---------------------------------------------------------
+    # lifecycle
+    # ---------------------------------------------------------
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.rules and self.workers > 1:
+            raise RuntimeError(
+                f"INGEST_ROLLUP はワーカーが 1 つの時だけ使えます（CHRONO_WORKERS={self.workers}）。"
+                "集約の状態がプロセスごとのため、複数ワーカーでは同じ window の集約 point が上書きされます")
+        if self.rules and not self.running:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """開いている window を全て閉じ、writer へ渡してから停止（writer.stop より前に呼ぶ）"""
+        if self._task is None:
+            return
+        # flush の途中で cancel しない（取り出し済みの集約 point を失わないように）
+        self._stopping.set()
+        await self._task
+        self._task = None
+        self.close_all()
+        await self.flush(retry=False)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.tick)
+            except asyncio.TimeoutError:
+                pass
+            self.close_idle()
+            await self.flush()
+
+    # ---------------------------------------------------------
+    # 集約
+    # ---------------------------------------------------------
+    def rule(self, measurement: str) -> RollupRule | None:
+        try:
+            return self._rule_cache[measurement]
+        except KeyError:
+            rule = next((r for r in self.rules if fnmatch.fnmatchcase(measurement, r.pattern)), None)
+            self._rule_cache[measurement] = rule
+            return rule
+
+    def add(self, key: str, scope: str, point: dict, now: float | None = None) -> bool:
+        """集約に取り込めば True。対象外・timestamp を解釈できない・series 上限なら False（そのまま書く）
+        合算できない遅着 point は RollupLate"""
+        rule = self.rule(point["measurement"])
+        if rule is None:
+            return False
+        now = time.time() if now is None else now
+        t = _epoch(point.get("timestamp"), now)
+        if t is None:
+            return False
+
+        series = (key, point["measurement"], tuple(sorted(point["tags"].items())))
+        start = math.floor(t / rule.window) * rule.window
+        window = self._series.get(series)
+        closed = self._closed.get(series)
+        if closed is not None and start <= closed.start:
+            if start < closed.start:
+                self.stats["late"] += 1
+                raise RollupLate(
+                    f"point is older than the written rollup window {closed.start} of {point['measurement']}")
+            self.stats["merged"] += 1
+            if window is not None:
+                # 次の window が開いている：書き済みの window へ合算してすぐ書き直す
+                closed.add(point["fields"], now)
+                self._emit(series, closed)
+                self.stats["points"] += 1
+                return True
+            # idle で閉じた window の続き：開き直し、次に閉じる時に合算した集約 point で書き直す
+            window = self._series[series] = self._closed.pop(series)
+        elif window is None:
+            if len(self._series) >= self.max_series:
+                self.stats["overflow"] += 1
+                return False
+            window = self._series[series] = _Window(rule, start, scope, now)
+        elif start > window.start:
+            self._close(series, window)
+            window = self._series[series] = _Window(rule, start, scope, now)
+        elif start < window.start:
+            self.stats["late"] += 1
+            raise RollupLate(
+                f"point is older than the open rollup window {window.start} of {point['measurement']}")
+
+        window.add(point["fields"], now)
+        self.stats["points"] += 1
+        return True
+
+    def _close(self, series: tuple, window: _Window):
+        """window を送出して、遅着の合算用に series の最後の window として残す"""
+        self._emit(series, window)
+        self._closed[series] = window
+        self._closed.move_to_end(series)
+        while len(self._closed) > self.max_series:
+            self._closed.popitem(last=False)
+
+    def _emit(self, series: tuple, window: _Window):
+        fields = window.fields()
+        if not fields:
+            return
+        key, measurement, tags = series
+        self._queue([(key, window.scope, {
+            "measurement": measurement,
+            "fields": fields,
+            "tags": dict(tags),
+            "timestamp": round(window.start * 1e9),   # int ns（ingest の正規化後と同じ）
+        })])
+
+    def _queue(self, entries: list):
+        """送出待ちへ追加（max_pending を超えた分は捨てる）"""
+        room = self.max_pending - len(self._out)
+        if len(entries) > room:
+            dropped = len(entries) - max(room, 0)
+            self.stats["dropped"] += dropped
+            rollup_dropped.inc(value=dropped)
+            entries = entries[:max(room, 0)]
+        self._out.extend(entries)
+
+    def close_idle(self, now: float | None = None) -> int:
+        """終端を過ぎて idle 秒 point の来ていない window を閉じる"""
+        now = time.time() if now is None else now
+        closed = [s for s, w in self._series.items()
+                  if now - w.touched >= self.idle and now >= w.start + w.rule.window]
+        for series in closed:
+            self._close(series, self._series.pop(series))
+        return len(closed)
+
+    def close_all(self) -> int:
+        n = len(self._series)
+        for series, window in self._series.items():
+            self._close(series, window)
+        self._series.clear()
+        return n
+
+    # ---------------------------------------------------------
+    # 送出（書き込み先キーごとに writer へ）
+    # ---------------------------------------------------------
+    async def flush(self, retry: bool = True):
+        if not self._out:
+            return
+        out, self._out = self._out, []
+
+        groups: dict[str, list] = {}
+        for entry in out:
+            groups.setdefault(entry[0], []).append(entry)
+
+        async def _write(key, entries):
+            try:
+                await self.writer.write(key, [point for _, _, point in entries])
+            except (WriterQueueFull, SpoolFull):
+                # writer が詰まっている間は次の tick で再送
+                if retry:
+                    self._queue(entries)
+                else:
+                    self.stats["failed"] += len(entries)
+                return
+            except Exception:
+                self.stats["failed"] += len(entries)
+                return
+            self.stats["emitted"] += len(entries)
+            for scope in {scope for _, scope, _ in entries}:
+                query_cache.invalidate(scope)
+
+        await asyncio.gather(*(_write(k, entries) for k, entries in groups.items()))
+
+    def depth(self) -> int:
+        return len(self._series)
+
+    def info(self) -> dict:
+        return {
+            "rules": {r.pattern: {"window": r.window, "aggs": list(r.aggs)} for r in self.rules},
+            "series": len(self._series),
+            "pending": len(self._out),
+            **self.stats,
+        }
+
+
+# ------------------------------------
+# アプリ共有インスタンス（INGEST_ROLLUP 未設定なら start しても何もしない）
+# ------------------------------------
+influx_rollup = InfluxRollup(load_rules())
@@ -0,0 +1,373 @@
+# utils/influx_spool.py
+# ChronoNeura Influx Spool（ローカル write-ahead log）
+#   writer → spool（追記 + fsync）→ replay タスク → Influx
+#
+#   - セグメント分割の追記専用ファイル（1 行 = 1 バッチの JSON）
+#   - append は 1 バッチ 1 fsync（writer の flush 単位でまとめて同期）
+#   - replay は順序を保って Influx へ送り、失敗時は指数バックオフ
+#   - Influx が受け付けないと確定したエラー（400 / 422、field 型の衝突など）・エンコードできない
+#     レコードは、1 件ずつ送り直して切り分け、通らないものだけ dead letter（deadletter.jsonl）へ
+#     移して先へ進む（後続の ack 済みレコードを止めない）
+#   - 送信済みセグメントは削除し、checkpoint で再起動後も続きから再送
+#   - 合計サイズ上限を超えたら SpoolFull（API 側で 503）
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from utils.influx_client import influx_write_points
+from utils.metrics import spool_dead_letters
+from utils.worker import worker_path
+
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "5000"))
+SPOOL_BACKOFF_MIN = float(os.getenv("SPOOL_BACKOFF_MIN", "0.5"))
+SPOOL_BACKOFF_MAX = float(os.getenv("SPOOL_BACKOFF_MAX", "30"))
+
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint.json"
+DEAD_LETTER_FILE = "deadletter.jsonl"
+
+# 再送しても通らない HTTP ステータス（書き込み内容そのものの問題）
+PERMANENT_STATUSES = (400, 422)
+
+
+class SpoolFull(RuntimeError):
+    """spool の容量上限超過（呼び出し側は 503 を返す）"""
+
+
+def is_permanent(e: BaseException) -> bool:
+    """再送しても通らないエラーか（sink が包んだ例外も __cause__ / __context__ を辿って見る）"""
+    seen = 0
+    while e is not None and seen < 10:
+        if getattr(e, "status", None) in PERMANENT_STATUSES:
+            return True
+        # line protocol にできない値・存在しない書き込み先（modules/influx_router.py）
+        if isinstance(e, (ValueError, TypeError)):
+            return True
+        e = e.__cause__ or e.__context__
+        seen += 1
+    return False
+
+
+class InfluxSpool:
+
+    def __init__(self,
+                 directory: str,
+                 sink=influx_write_points,
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES,
+                 max_bytes: int = SPOOL_MAX_BYTES,
+                 replay_batch: int = SPOOL_REPLAY_BATCH,
+                 backoff_min: float = SPOOL_BACKOFF_MIN,
+                 backoff_max: float = SPOOL_BACKOFF_MAX):
+
+        self.directory = directory
+        self.sink = sink
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.replay_batch = replay_batch
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._wakeup: asyncio.Event | None = None
+
+        # ファイルは open()（start() / 初回の append）で開く。import・生成時にはディスクを触らない
+        self._fh = None
+        self._segments: list[int] = []
+        self._sizes: dict[int, int] = {}
+        self._read_seq = self._read_offset = self._write_seq = 0
+
+        self._oldest_pending = None   # replay 待ち先頭レコードの append 時刻
+        self.stats = {"appended": 0, "replayed": 0, "retries": 0, "rejected": 0, "corrupt": 0,
+                      "dead_letter": 0}
+
+    def open(self):
+        """既存セグメントと checkpoint を復元し、書き込み中のセグメントを開く（開いていれば何もしない）"""
+        with self._lock:
+            if self._fh is not None:
+                return
+
+            os.makedirs(self.directory, exist_ok=True)
+
+            self._segments = sorted(self._list_segments())
+            self._sizes = {seq: os.path.getsize(self._path(seq)) for seq in self._segments}
+            self._read_seq, self._read_offset = self._load_checkpoint()
+            self._segments = [s for s in self._segments if s >= self._read_seq]
+
+            if not self._segments:
+                self._segments = [self._read_seq]
+                self._sizes[self._read_seq] = 0
+                self._read_offset = 0
+            elif self._segments[0] != self._read_seq:
+                self._read_seq, self._read_offset = self._segments[0], 0
+
+            self._write_seq = self._segments[-1]
+            self._repair_tail(self._path(self._write_seq))
+            self._fh = open(self._path(self._write_seq), "ab")
+            self._sizes[self._write_seq] = self._fh.tell()
+
+    # ---------------------------------------------------------
+    # ファイル操作
+    # ---------------------------------------------------------
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                yield int(name[:-len(SEGMENT_SUFFIX)])
+
+    @staticmethod
+    def _repair_tail(path: str):
+        """クラッシュで途切れた末尾行を切り詰め、次の追記と混ざらないようにする"""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                cp = json.load(f)
+            return int(cp["segment"]), int(cp["offset"])
+        except (OSError, ValueError, KeyError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self._read_seq, "offset": self._read_offset}, f)
+        os.replace(tmp, path)
+
+    def total_bytes(self) -> int:
+        return sum(self._sizes.get(seq, 0) for seq in self._segments)
+
+    def pending_bytes(self) -> int:
+        return self.total_bytes() - self._read_offset
+
+    # ---------------------------------------------------------
+    # append（writer の sink として呼ばれる / スレッドから）
+    # ---------------------------------------------------------
+    def append(self, bucket: str, points: list[dict]) -> int:
+        now_ns = time.time_ns()
+
+        # replay で再送されても同じ point になるよう、時刻未指定の point は受付時刻で確定
+        stamped = [p if p.get("timestamp") else {**p, "timestamp": now_ns} for p in points]
+        line = json.dumps({"t": now_ns, "b": bucket, "p": stamped},
+                          separators=(",", ":"), default=str).encode() + b"\n"
+
+        if self._fh is None:
+            self.open()
+        with self._lock:
+            if self.total_bytes() + len(line) > self.max_bytes:
+                self.stats["rejected"] += len(points)
+                raise SpoolFull(f"spool full ({self.total_bytes()}/{self.max_bytes} bytes)")
+
+            if self._sizes[self._write_seq] and self._sizes[self._write_seq] + len(line) > self.segment_bytes:
+                self._roll()
+
+            self._fh.write(line)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._sizes[self._write_seq] += len(line)
+            self.stats["appended"] += len(points)
+
+        if self._wakeup is not None:
+            self._wakeup_loop.call_soon_threadsafe(self._wakeup.set)
+        return len(points)
+
+    def _roll(self):
+        self._fh.close()
+        self._write_seq += 1
+        self._segments.append(self._write_seq)
+        self._sizes[self._write_seq] = 0
+        self._fh = open(self._path(self._write_seq), "ab")
+
+    # ---------------------------------------------------------
+    # replay
+    # ---------------------------------------------------------
+    def _read_records(self):
+        """checkpoint から読める分を読み、同一 bucket の連続レコードをまとめて返す"""
+        with self._lock:
+            seq, offset = self._read_seq, self._read_offset
+            active = seq == self._write_seq
+            if active and offset >= self._sizes[seq]:
+                return None
+
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            bucket, points, appended_at, end = None, [], None, offset
+            while len(points) < self.replay_batch:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    # 書き込み中の行は待つ / 閉じたセグメントの途切れた末尾は捨てる
+                    if not active:
+                        end += len(line)
+                    break
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    self.stats["corrupt"] += 1
+                    end += len(line)
+                    continue
+                if bucket is not None and rec["b"] != bucket:
+                    break
+                bucket = rec["b"]
+                appended_at = appended_at or rec["t"]
+                points.extend(rec["p"])
+                end += len(line)
+
+        if end == offset and active:
+            return None
+        return seq, end, bucket, points, appended_at
+
+    def _read_one(self, seq: int, offset: int):
+        """offset から 1 レコード → (次の offset, レコード or None（壊れた行）)"""
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            line = f.readline()
+        try:
+            return offset + len(line), json.loads(line)
+        except ValueError:
+            self.stats["corrupt"] += 1
+            return offset + len(line), None
+
+    def _dead_letter(self, rec: dict, error: BaseException):
+        line = json.dumps({"t": time.time_ns(), "error": str(error), "record": rec},
+                          separators=(",", ":"), default=str).encode() + b"\n"
+        with open(os.path.join(self.directory, DEAD_LETTER_FILE), "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["dead_letter"] += len(rec["p"])
+        spool_dead_letters.inc(value=len(rec["p"]))
+
+    def _isolate(self, seq: int, end: int) -> bool:
+        """バッチを 1 レコードずつ送り、通らないものは dead letter へ。一時エラーなら False（続きは次回）"""
+        offset = self._read_offset
+        while offset < end:
+            nxt, rec = self._read_one(seq, offset)
+            if rec is not None:
+                try:
+                    self.sink(rec["b"], rec["p"])
+                    self.stats["replayed"] += len(rec["p"])
+                except Exception as e:
+                    if not is_permanent(e):
+                        return False
+                    self._dead_letter(rec, e)
+            self._advance(seq, nxt)
+            offset = nxt
+        return True
+
+    def _advance(self, seq: int, end: int):
+        with self._lock:
+            self._read_offset = end
+            # 読み終えたセグメント（書き込み中以外）を削除
+            while self._read_seq != self._write_seq and self._read_offset >= self._sizes[self._read_seq]:
+                done = self._read_seq
+                self._segments.remove(done)
+                self._sizes.pop(done, None)
+                self._read_seq = self._segments[0]
+                self._read_offset = 0
+                os.remove(self._path(done))
+            self._save_checkpoint()
+
+    async def _replay_loop(self):
+        backoff = self.backoff_min
+
+        while True:
+            batch = await asyncio.to_thread(self._read_records)
+
+            if batch is None:
+                self._oldest_pending = None
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            seq, end, bucket, points, appended_at = batch
+            self._oldest_pending = appended_at
+
+            if points:
+                try:
+                    await asyncio.to_thread(self.sink, bucket, points)
+                except Exception as e:
+                    if self._closing:
+                        return
+                    if is_permanent(e) and await asyncio.to_thread(self._isolate, seq, end):
+                        backoff = self.backoff_min
+                        continue
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            backoff = self.backoff_min
+            self.stats["replayed"] += len(points)
+            await asyncio.to_thread(self._advance, seq, end)
+
+    # ---------------------------------------------------------
+    # lifecycle
+    # ---------------------------------------------------------
+    async def start(self):
+        if self._task is not None:
+            return
+        await asyncio.to_thread(self.open)
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._wakeup_loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._replay_loop())
+
+    async def stop(self, timeout: float = 10.0):
+        """残りの replay を timeout まで試み、未送信分はディスクに残して停止"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+        self._wakeup = None
+        with self._lock:
+            self._fh.close()
+            self._fh = None
+
+    # ---------------------------------------------------------
+    # /health 用の lag 指標
+    # ---------------------------------------------------------
+    def lag(self) -> dict:
+        oldest = self._oldest_pending
+        return {
+            "segments": len(self._segments),
+            "pending_bytes": self.pending_bytes(),
+            "total_bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "lag_seconds": round((time.time_ns() - oldest) / 1e9, 3) if oldest else 0.0,
+            **self.stats,
+        }
+
+
+# ------------------------------------
+# アプリ共有インスタンス（INGEST_SPOOL_DIR 未設定なら無効、app lifespan で start / stop）
+#   生成はパスを決めるだけで、セグメントの復元・オープンは start() で行う
+#   マルチワーカー時は <dir>.<worker id> をワーカーごとに使う（segment を奪い合わない）
+# ------------------------------------
+influx_spool = InfluxSpool(worker_path(INGEST_SPOOL_DIR)) if INGEST_SPOOL_DIR else None
@@ -0,0 +1,208 @@
+# utils/influx_writer.py
+# ChronoNeura Influx Batch Writer
+#   ingest ハンドラから Influx への同期 round trip を切り離す asyncio ネイティブの書き込み層
+#
+#   - 有界キュー（point 数で上限）→ 満杯なら WriterQueueFull（API 側で 503）
+#   - bucket ごとにバッファし、件数 or 経過時間で flush
+#     durable の待ち手がいる bucket は、キューが空になってから linger（既定 2ms）で flush
+#     （flush_interval は enqueue 分の上限。durable 応答を interval まで待たせない）
+#   - ack モード
+#       durable : Influx への書き込み完了後に応答（デフォルト）
+#       enqueue : キュー投入直後に応答
+#   - stop() で残りを必ず flush してから終了
+#   - INGEST_SPOOL_DIR 設定時は flush 先が spool（utils/influx_spool.py）になり、
+#     durable ack は「spool に fsync 済み」を意味する
+
+import asyncio
+import os
+import time
+
+from utils.influx_client import influx_write_points
+from utils.influx_spool import influx_spool
+
+INGEST_ACK_MODE = os.getenv("INGEST_ACK_MODE", "durable")
+INFLUX_WRITER_QUEUE_MAX = int(os.getenv("INFLUX_WRITER_QUEUE_MAX", "100000"))
+INFLUX_WRITER_BATCH_SIZE = int(os.getenv("INFLUX_WRITER_BATCH_SIZE", "5000"))
+INFLUX_WRITER_FLUSH_INTERVAL = float(os.getenv("INFLUX_WRITER_FLUSH_INTERVAL", "0.5"))
+INFLUX_WRITER_LINGER = float(os.getenv("INFLUX_WRITER_LINGER", "0.002"))
+
+ACK_MODES = ("durable", "enqueue")
+
+
+class WriterQueueFull(RuntimeError):
+    """キューが満杯（呼び出し側は 503 を返す）"""
+
+
+class InfluxBatchWriter:
+
+    def __init__(self,
+                 sink=influx_write_points,
+                 queue_max: int = INFLUX_WRITER_QUEUE_MAX,
+                 batch_size: int = INFLUX_WRITER_BATCH_SIZE,
+                 flush_interval: float = INFLUX_WRITER_FLUSH_INTERVAL,
+                 ack_mode: str = INGEST_ACK_MODE,
+                 linger: float = INFLUX_WRITER_LINGER):
+
+        if ack_mode not in ACK_MODES:
+            raise RuntimeError(f"未知の ack mode：{ack_mode}")
+
+        self.sink = sink
+        self.queue_max = queue_max
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ack_mode = ack_mode
+        self.linger = linger
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._pending = 0          # キュー + バッファ内の point 数
+        self._buffers: dict[str, list] = {}
+        self._waiters: dict[str, list] = {}
+        self._linger_at: dict[str, float] = {}   # durable の待ち手がいる bucket → flush 時刻
+
+        self.stats = {"enqueued": 0, "written": 0, "failed": 0, "rejected": 0, "flushes": 0}
+
+    # ---------------------------------------------------------
+    # lifecycle
+    # ---------------------------------------------------------
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """残りのキュー・バッファを全て flush してから停止"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def depth(self) -> int:
+        return self._pending
+
+    # ---------------------------------------------------------
+    # 投入
+    # ---------------------------------------------------------
+    def submit(self, bucket: str, points: list[dict], durable: bool = True) -> asyncio.Future:
+        """point をキューへ投入し、flush 完了で解決される Future を返す
+        durable=True（Future を待つ呼び出し）は linger 後に flush、False は flush_interval まで溜める"""
+        if not self.running:
+            raise RuntimeError("InfluxBatchWriter が起動していません")
+
+        if self._pending + len(points) > self.queue_max:
+            self.stats["rejected"] += len(points)
+            raise WriterQueueFull(f"writer queue full ({self._pending}/{self.queue_max})")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._pending += len(points)
+        self.stats["enqueued"] += len(points)
+        self._queue.put_nowait((bucket, points, fut, durable))
+        return fut
+
+    async def write(self, bucket: str, points: list[dict]) -> int:
+        """ack_mode に従って投入（durable なら書き込み完了まで待つ）"""
+        if not self.running:
+            await self.start()
+
+        fut = self.submit(bucket, points, durable=self.ack_mode == "durable")
+        if self.ack_mode == "durable":
+            return await fut
+        return len(points)
+
+    # ---------------------------------------------------------
+    # consumer
+    # ---------------------------------------------------------
+    async def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        closing = False
+
+        while not closing:
+            wake = min(deadline, min(self._linger_at.values(), default=deadline))
+            timeout = max(0.0, wake - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = ()
+
+            if item is None:
+                closing = True
+            elif item:
+                self._take(item)
+
+                # キューに溜まっている分もまとめて取り込む
+                while not self._queue.empty():
+                    nxt = self._queue.get_nowait()
+                    if nxt is None:
+                        closing = True
+                        break
+                    self._take(nxt)
+
+            # 件数到達 / linger 経過 / 時間経過 / 停止 のいずれかで flush
+            now = time.monotonic()
+            if closing or now >= deadline:
+                ready = list(self._buffers)
+                deadline = now + self.flush_interval
+            else:
+                ready = [b for b, buf in self._buffers.items()
+                         if len(buf) >= self.batch_size or self._linger_at.get(b, deadline) <= now]
+
+            if ready:
+                await asyncio.gather(*(self._flush(b) for b in ready))
+
+    def _take(self, item):
+        bucket, points, fut, durable = item
+        self._buffers.setdefault(bucket, []).extend(points)
+        self._waiters.setdefault(bucket, []).append((fut, len(points)))
+        if durable and bucket not in self._linger_at:
+            self._linger_at[bucket] = time.monotonic() + self.linger
+
+    async def _flush(self, bucket: str):
+        points = self._buffers.pop(bucket, [])
+        waiters = self._waiters.pop(bucket, [])
+        self._linger_at.pop(bucket, None)
+        if not points:
+            return
+
+        self.stats["flushes"] += 1
+        try:
+            # sub-batch ごとに送り、失敗した範囲 [lo, hi) を覚える（1 つ失敗しても残りは送る）
+            failed = []
+            for i in range(0, len(points), self.batch_size):
+                part = points[i:i + self.batch_size]
+                try:
+                    await asyncio.to_thread(self.sink, bucket, part)
+                except Exception as e:
+                    self.stats["failed"] += len(part)
+                    failed.append((i, i + len(part), e))
+                else:
+                    self.stats["written"] += len(part)
+
+            # 待ち手は自分の point を含む sub-batch が失敗した時だけ失敗する
+            offset = 0
+            for fut, n in waiters:
+                error = next((e for lo, hi, e in failed if lo < offset + n and offset < hi), None)
+                offset += n
+                if fut.done():
+                    continue
+                if error is None:
+                    fut.set_result(n)
+                else:
+                    fut.set_exception(error)
+                    # enqueue モードでは誰も await しないため警告を抑止
+                    fut.exception()
+        finally:
+            self._pending -= len(points)
+
+
+# ------------------------------------
+# アプリ共有インスタンス（lifespan で start / stop）
+# ------------------------------------
+influx_writer = InfluxBatchWriter(
+    sink=influx_spool.append if influx_spool else influx_write_points,
+)
@@ -0,0 +1,237 @@
+# utils/metrics.py
+"""
+ChronoNeura – Prometheus メトリクス（外部依存なしの軽量レジストリ）
+
+- Counter / Histogram はラベル値のタプルごとに保持、observe は bisect + lock のみ
+- gauge は scrape 時に callback で読む（writer / scheduler の queue depth など）
+- render() は text exposition format（version 0.0.4、GET /metrics は routes/metrics.py）
+- MetricsMiddleware は素の ASGI middleware（BaseHTTPMiddleware より軽い）
+  route はパステンプレート（/query/cache/stats など）でラベル付けし、系列数を抑える
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+# 秒（1ms 未満の正規化から 10s の Notion 呼び出しまで）
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+# ============================================================
+# metric 型
+# ============================================================
+class Counter:
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket ごとの件数（+Inf 含む）, sum]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def count(self, *labels) -> int:
+        s = self._series.get(labels)
+        return sum(s[0]) if s else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(s[0]), s[1]) for labels, s in self._series.items()]
+
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (_num(bound),))} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acc}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._gauges: Dict[str, tuple] = {}
+
+    def counter(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, doc, labelnames))
+
+    def histogram(self, name: str, doc: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, doc, labelnames, buckets))
+
+    def gauge(self, name: str, doc: str, fn: Callable[[], float]):
+        """scrape 時に fn() を読む gauge（同名は上書き）"""
+        self._gauges[name] = (doc, fn)
+
+    def render(self) -> str:
+        lines = []
+        for m in list(self._metrics.values()):
+            lines.extend(m.render())
+        for name, (doc, fn) in list(self._gauges.items()):
+            try:
+                v = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_num(v or 0)}")
+        return "\n".join(lines) + "\n"
+
+
+# ------------------------------------
+# アプリ共有レジストリと、各所から使う metric
+# ------------------------------------
+registry = Registry()
+
+http_duration = registry.histogram(
+    "chrono_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+http_requests = registry.counter(
+    "chrono_http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_bytes_in = registry.counter(
+    "chrono_http_request_bytes_total", "Request body bytes received", ("route",))
+
+# stage：normalize / normalize_batch / influx_write / influx_query / notion_<op>
+stage_duration = registry.histogram(
+    "chrono_stage_duration_seconds", "Hot-path stage latency", ("stage",))
+
+# points/s は rate(chrono_influx_points_written_total[1m]) で見る
+points_written = registry.counter(
+    "chrono_influx_points_written_total", "Points written to InfluxDB")
+ingest_duplicates = registry.counter(
+    "chrono_ingest_duplicates_total", "Ingest requests / points acknowledged without writing (kind=key|hash)",
+    ("kind",))
+ingest_cardinality_limited = registry.counter(
+    "chrono_ingest_cardinality_limited_total",
+    "Points whose tags hit the cardinality limit (policy=demote|drop|reject)", ("policy",))
+rollup_dropped = registry.counter(
+    "chrono_rollup_dropped_total", "Closed rollup windows dropped while the Influx writer stayed full")
+spool_dead_letters = registry.counter(
+    "chrono_spool_dead_letter_total", "Spooled points moved to the dead-letter file after a permanent Influx rejection")
+upstream_errors = registry.counter(
+    "chrono_upstream_errors_total", "InfluxDB / Notion call failures (kind=error|rate_limited)", ("target", "kind"))
+
+
+def record_error(target: str, e: Exception):
+    kind = "rate_limited" if getattr(e, "status", None) == 429 else "error"
+    upstream_errors.inc(target, kind)
+
+
+@contextmanager
+def timed_stage(stage: str, target: str | None = None):
+    """stage の所要時間を記録（target があれば例外を upstream_errors に数える）"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if target:
+            record_error(target, e)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - t0, stage)
+
+
+# ============================================================
+# ASGI middleware
+# ============================================================
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        status = [500]
+        received = [0]
+
+        async def receive_counted():
+            message = await receive()
+            if message["type"] == "http.request":
+                received[0] += len(message.get("body", b""))
+            return message
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_duration.observe(time.perf_counter() - t0, method, path)
+            http_requests.inc(method, path, status[0])
+            if received[0]:
+                http_bytes_in.inc(path, value=received[0])
+
@@ -0,0 +1,48 @@
+# utils/ndjson.py
+# NDJSON（1 行 1 JSON）ボディの逐次読み出し（Content-Encoding は utils/codec.py で展開）
+
+from fastapi import HTTPException, Request
+
+from utils.codec import content_type, iter_body, json_loads, read_payload
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def is_ndjson(request: Request) -> bool:
+    """media type は大文字小文字を区別しない（"Application/X-NDJSON; charset=utf-8" も NDJSON）"""
+    return content_type(request) in NDJSON_TYPES
+
+
+async def iter_ndjson(request: Request):
+    """受信チャンクを行単位に切り出して yield（空行は飛ばす）"""
+    buf = b""
+    async for chunk in iter_body(request):
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buf.strip():
+        yield buf
+
+
+async def read_records(request: Request, limit: int, label: str = "Batch") -> list:
+    """JSON / MessagePack の配列 または NDJSON → レコードのリスト（limit 件まで、超えたら 413）
+    NDJSON の壊れた行はインデックスを保ったまま例外オブジェクトとして入れる（呼び出し側で reject）"""
+    items = []
+    if is_ndjson(request):
+        async for line in iter_ndjson(request):
+            if len(items) >= limit:
+                raise HTTPException(status_code=413, detail=f"{label} too large (max {limit})")
+            try:
+                items.append(json_loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+
+    items = await read_payload(request)
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail=f"{label} body must be an array")
+    if len(items) > limit:
+        raise HTTPException(status_code=413, detail=f"{label} too large (max {limit})")
+    return items
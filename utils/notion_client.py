@@ -3,25 +3,163 @@
 ChronoNeura SyncBridge – Notion Writer 正式版（TitleBuilder 分離構造）
 """
 
+import asyncio
 import os
+import time
 from typing import Dict, Any, Optional
 
-from notion_client import Client
+import httpx
 from utils.notion_title_builder import TitleBuilder
+from utils.notion_key_index import database_query, is_live, is_stale, notion_key_index, page_key
+from utils.metrics import timed_stage
+
+# keep-alive 接続プール（プロセス内で共有する Writer が 1 つの pool を使い回す）
+NOTION_POOL_SIZE = int(os.getenv("NOTION_POOL_SIZE", "10"))
+NOTION_KEEPALIVE_EXPIRY = float(os.getenv("NOTION_KEEPALIVE_EXPIRY", "60"))
+
+# API の接続先（ベンチマーク用の fake Notion へ向ける時だけ変更）
+NOTION_BASE_URL = os.getenv("NOTION_BASE_URL", "https://api.notion.com")
+
+# append の書き方
+#   blocks   : ページ末尾へ block children として追加（履歴長に依存しない O(1)）
+#   property : Details の rich_text を読み出して連結し、丸ごと書き戻す（旧方式）
+NOTION_APPEND_MODE = os.getenv("NOTION_APPEND_MODE", "blocks")
+
+# Notion API の上限
+NOTION_TEXT_LIMIT = 2000        # rich_text 1 要素の文字数（UTF-16 単位）
+NOTION_RICH_TEXT_MAX = 100      # rich_text 配列の要素数
+NOTION_CHILDREN_MAX = 100       # 1 リクエストで追加できる block 数
+NOTION_FILTER_MAX = 100         # compound filter（or）の条件数
+
+# 429 を受けた呼び出しを Retry-After 後に再送する回数
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+
+
+class NotionPageNotFound(RuntimeError):
+    """key に一致するページが無い"""
+
+
+class NotionRichTextFull(RuntimeError):
+    """追記すると rich_text プロパティが NOTION_RICH_TEXT_MAX 要素を超える（黙って切り捨てない）"""
+
+
+class NotionRateLimited(RuntimeError):
+    """リトライ上限まで 429 が続いた"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """429 なら Retry-After（秒）を返す。429 以外は None"""
+    if getattr(e, "status", None) != 429:
+        return None
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def split_text(text: str, limit: int = NOTION_TEXT_LIMIT) -> list:
+    """Notion の文字数上限（UTF-16 単位）に収まるよう text を分割"""
+    chunks = []
+    i = 0
+    while i < len(text):
+        j = min(i + limit, len(text))
+        while True:
+            excess = len(text[i:j].encode("utf-16-le")) // 2 - limit
+            if excess <= 0:
+                break
+            j -= excess
+        chunks.append(text[i:j])
+        i = j
+    return chunks
+
+
+def text_blocks(text: str) -> list:
+    """追記テキストを paragraph block 列へ（1 行 1 paragraph、長い行は rich_text を分割）"""
+    blocks = []
+    for line in text.split("\n"):
+        parts = [{"type": "text", "text": {"content": c}} for c in split_text(line)]
+        for i in range(0, max(len(parts), 1), NOTION_RICH_TEXT_MAX):
+            blocks.append({
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {"rich_text": parts[i:i + NOTION_RICH_TEXT_MAX]},
+            })
+    return blocks
+
+
+def keys_filter(key: str, values: list) -> Dict[str, Any]:
+    return {"or": [{"property": key, "rich_text": {"equals": v}} for v in values]}
+
+
+def _retry_options() -> Dict[str, Any]:
+    """429 の再送は _api が token bucket 越しに行う（notion-client 3.x 内蔵の自動リトライは切る、2.x には無い）"""
+    from notion_client.client import ClientOptions
+
+    return {"retry": False} if "retry" in getattr(ClientOptions, "__dataclass_fields__", {}) else {}
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=NOTION_POOL_SIZE,
+        max_keepalive_connections=NOTION_POOL_SIZE,
+        keepalive_expiry=NOTION_KEEPALIVE_EXPIRY,
+    )
 
 
 # ============================================================
 # Trace層：Notion API の低レベルクラス（通信・変換のみ）
+#   HTTP 呼び出しはすべて _api を通す（stage 計測・rate limit・429 リトライの一箇所）
+#   limiter（utils/notion_scheduler.TokenBucket）があれば 1 呼び出しごとに token を取る
+#   429 はその呼び出しだけを Retry-After 後に再送する（手順全体はやり直さない：
+#   create 済みのページへ append が 429 になっても create は繰り返さない）
 # ============================================================
 class NotionClientCore:
     """Notion API の生I/O層"""
 
-    def __init__(self, token_env="NOTION_TOKEN_AUTOJOURNAL"):
+    is_async = False
+
+    def __init__(self, token_env="NOTION_TOKEN_AUTOJOURNAL", limiter=None, max_retries: int = NOTION_MAX_RETRIES):
         token = os.getenv(token_env)
         if not token:
             raise RuntimeError(f"環境変数 {token_env} が未設定です。")
 
-        self.client = Client(auth=token)
+        self.client = self._make_client(token)
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def _make_client(self, token: str):
+        from notion_client import Client
+
+        self.http = httpx.Client(limits=_pool_limits())
+        return Client(auth=token, client=self.http, base_url=NOTION_BASE_URL, **_retry_options())
+
+    def close(self):
+        self.http.close()
+
+    def _api(self, stage: str, endpoint, **kwargs):
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.take()
+            try:
+                with timed_stage(stage, "notion"):
+                    return endpoint(**kwargs)
+            except Exception as e:
+                wait = retry_after_seconds(e)
+                if wait is None:
+                    raise
+                attempt += 1
+                if self.limiter is not None:
+                    self.limiter.pause(wait)
+                if attempt > self.max_retries:
+                    raise NotionRateLimited(f"Notion rate limited: {e}", wait) from e
+                if self.limiter is None:
+                    time.sleep(wait)
 
     # --- property builder ---
     def build_prop(self, t: str, v: Any):
@@ -42,25 +180,47 @@ class NotionClientCore:
         return {"rich_text": [{"text": {"content": str(v)}}]}
 
     # --- create ---
-    def create_page(self, db_id: str, props: Dict[str, Any]):
-        return self.client.pages.create(
-            parent={"database_id": db_id},
-            properties=props
-        )
+    def create_page(self, db_id: str, props: Dict[str, Any], children: Optional[list] = None):
+        extra = {"children": children[:NOTION_CHILDREN_MAX]} if children else {}
+        res = self._api("notion_create_page", self.client.pages.create,
+                        parent={"database_id": db_id}, properties=props, **extra)
+        if children and len(children) > NOTION_CHILDREN_MAX:
+            self.append_blocks(res["id"], children[NOTION_CHILDREN_MAX:])
+        return res
+
+    # --- append blocks（100 件ずつ）---
+    def append_blocks(self, page_id: str, children: list):
+        for i in range(0, len(children), NOTION_CHILDREN_MAX):
+            self._api("notion_append_blocks", self.client.blocks.children.append,
+                      block_id=page_id, children=children[i:i + NOTION_CHILDREN_MAX])
+        return {"id": page_id, "appended_blocks": len(children)}
 
     # --- update ---
     def update_page(self, page_id: str, props: Dict[str, Any]):
-        return self.client.pages.update(page_id, properties=props)
+        return self._api("notion_update_page", self.client.pages.update, page_id=page_id, properties=props)
+
+    # --- retrieve ---
+    def retrieve_page(self, page_id: str):
+        return self._api("notion_retrieve_page", self.client.pages.retrieve, page_id=page_id)
 
     # --- query ---
     def query_by_key(self, db_id: str, key: str, value: str):
-        res = self.client.databases.query(
-            database_id=db_id,
-            filter={"property": key, "rich_text": {"equals": value}}
-        )
+        res = self._api("notion_query_by_key", database_query(self.client),
+                        database_id=db_id, filter={"property": key, "rich_text": {"equals": value}})
         arr = res.get("results", [])
         return arr[0] if arr else None
 
+    def query_by_keys(self, db_id: str, key: str, values: list):
+        """複数の値を 1 本の or フィルタで引く（values は NOTION_FILTER_MAX 件まで）"""
+        query = {"database_id": db_id, "filter": keys_filter(key, values), "page_size": 100}
+        pages = []
+        while True:
+            res = self._api("notion_query_by_keys", database_query(self.client), **query)
+            pages.extend(res.get("results", []))
+            if not res.get("has_more"):
+                return pages
+            query["start_cursor"] = res.get("next_cursor")
+
 
 # ============================================================
 # SyncBridge層：Writer（create / upsert / append を統合した高層）
@@ -70,9 +230,17 @@ class NotionWriter(NotionClientCore):
 
     def __init__(self,
                  token_env="NOTION_TOKEN_AUTOJOURNAL",
-                 db_env="NOTION_DB_DEVLOG_ID"):
+                 db_env="NOTION_DB_DEVLOG_ID",
+                 key_index=None,
+                 append_mode=NOTION_APPEND_MODE,
+                 limiter=None,
+                 max_retries: int = NOTION_MAX_RETRIES):
+
+        super().__init__(token_env, limiter, max_retries)
 
-        super().__init__(token_env)
+        if append_mode not in ("blocks", "property"):
+            raise RuntimeError(f"未知の append mode：{append_mode}")
+        self.append_mode = append_mode
 
         db_id = os.getenv(db_env)
         if not db_id:
@@ -80,41 +248,193 @@ class NotionWriter(NotionClientCore):
 
         self.db_id = db_id
 
+        # Key → page_id インデックス（utils/notion_key_index.py、None なら毎回 query）
+        self.key_index = key_index
+
+    # ---------------------------------------------------------
+    # Key → page 解決（key_index → query_by_key フォールバック）
+    # ---------------------------------------------------------
+    def _query_page(self, key: str):
+        page = self.query_by_key(self.db_id, "Key", key)
+        if page and self.key_index is not None:
+            self.key_index.put(key, page["id"])
+        return page
+
+    def _find_page(self, key: str, need_props: bool):
+        page_id = self.key_index.get(key) if self.key_index is not None else None
+        if page_id:
+            if not need_props:
+                return {"id": page_id}, True
+            try:
+                page = self.retrieve_page(page_id)
+            except Exception as e:
+                if not is_stale(e):
+                    raise
+            else:
+                if is_live(page):
+                    return page, True
+            self.key_index.discard(key)
+
+        return self._query_page(key), False
+
+    def _on_page(self, key: str, fn, need_props: bool = False):
+        """key のページを解決して fn(page) を実行（index の page_id が古ければ引き直して 1 回だけ再実行）"""
+        page, from_index = self._find_page(key, need_props)
+        try:
+            return fn(page)
+        except Exception as e:
+            if not (from_index and is_stale(e)):
+                raise
+            self.key_index.discard(key)
+            return fn(self._query_page(key))
+
+    def _unresolved(self, keys):
+        missing = self.key_index.missing(keys)
+        for i in range(0, len(missing), NOTION_FILTER_MAX):
+            yield missing[i:i + NOTION_FILTER_MAX]
+
+    def resolve_keys(self, keys) -> int:
+        """index に無い key をまとめて引いて index に載せる（bulk import の前処理）"""
+        if self.key_index is None:
+            return 0
+        n = 0
+        for chunk in self._unresolved(keys):
+            for page in self.query_by_keys(self.db_id, "Key", chunk):
+                self.key_index.put(page_key(page), page["id"])
+                n += 1
+        return n
+
+    def _create(self, key: Optional[str], props: Dict[str, Any], children: Optional[list] = None):
+        res = self.create_page(self.db_id, props, children)
+        if key and self.key_index is not None:
+            self.key_index.put(key, res.get("id"))
+        return res
+
     # ---------------------------------------------------------
     # create
     # ---------------------------------------------------------
     def write_create(self, data: Dict[str, Any]):
         props = self._convert(data)
-        return self.create_page(self.db_id, props)
+        return self._create(data.get("key"), props)
 
     # ---------------------------------------------------------
     # upsert（存在すれば更新・無ければ生成）
     # ---------------------------------------------------------
     def write_upsert(self, key: str, data: Dict[str, Any]):
-        page = self.query_by_key(self.db_id, "Key", key)
         props = self._convert(data)
 
-        if page:
-            return self.update_page(page["id"], props)
+        def write(page):
+            if page:
+                return self.update_page(page["id"], props)
+            return self._create(key, props)
 
-        return self.create_page(self.db_id, props)
+        return self._on_page(key, write)
 
     # ---------------------------------------------------------
-    # append（Details に追記）
+    # append（blocks：ページ末尾へ追加 / property：Details に追記）
     # ---------------------------------------------------------
     def write_append(self, key: str, text: str):
-        page = self.query_by_key(self.db_id, "Key", key)
-        if not page:
-            raise RuntimeError(f"append 対象 key={key} のページが見つかりません")
 
-        page_id = page["id"]
-        existing = page["properties"]["Details"]["rich_text"]
-        merged = existing + [{"text": {"content": "\n" + text}}]
+        def write(page):
+            if not page:
+                raise NotionPageNotFound(f"append 対象 key={key} のページが見つかりません")
+            if self.append_mode == "blocks":
+                return self.append_blocks(page["id"], text_blocks(text))
+            return self.update_page(page["id"], self._append_props(page, [text]))
 
-        return self.update_page(
-            page_id,
-            {"Details": {"rich_text": merged}}
-        )
+        return self._on_page(key, write, need_props=self.append_mode == "property")
+
+    # ---------------------------------------------------------
+    # 任意の rich_text プロパティへ追記（Summary / NextAction など、常に read-modify-write）
+    # ---------------------------------------------------------
+    def write_append_property(self, key: str, prop: str, text: str, props: Optional[Dict[str, Any]] = None):
+        """props は同じ update_page で一緒に書くプロパティ（UpdatedAt など）"""
+
+        def write(page):
+            if not page:
+                raise NotionPageNotFound(f"append 対象 key={key} のページが見つかりません")
+            return self.update_page(page["id"], {**(props or {}), **self._append_text_prop(page, prop, text)})
+
+        return self._on_page(key, write, need_props=True)
+
+    @staticmethod
+    def _append_text_prop(page, prop: str, text: str):
+        current = page["properties"].get(prop) or {}
+        existing = "".join(rt.get("plain_text", "") for rt in current.get("rich_text", []))
+        updated = existing + "\n" + text if existing else text
+        chunks = split_text(updated)
+        if len(chunks) > NOTION_RICH_TEXT_MAX:
+            raise NotionRichTextFull(f"{prop} が rich_text の上限（{NOTION_RICH_TEXT_MAX} 要素）を超えます")
+        return {prop: {"rich_text": [{"type": "text", "text": {"content": c}} for c in chunks]}}
+
+    @staticmethod
+    def _append_props(page, texts: list, props: Optional[Dict[str, Any]] = None):
+        """Details の既存 rich_text（props 側に新しい Details があればそちら）へ texts を連結"""
+        props = dict(props or {})
+        if props.get("Details"):
+            base = props["Details"]["rich_text"]
+        elif page and "properties" in page:
+            base = page["properties"]["Details"]["rich_text"]
+        else:
+            base = []
+        added = [{"text": {"content": c}} for t in texts for c in split_text("\n" + t)]
+        if len(base) + len(added) > NOTION_RICH_TEXT_MAX:
+            raise NotionRichTextFull(
+                f"Details が rich_text の上限（{NOTION_RICH_TEXT_MAX} 要素）を超えます（NOTION_APPEND_MODE=blocks を使う）")
+        props["Details"] = {"rich_text": base + added}
+        return props
+
+    # ---------------------------------------------------------
+    # merged（同一 key の upsert / append をまとめて 1 回で書く）
+    #   utils/notion_scheduler.py から呼ばれる
+    #   data         : upsert のプロパティ（None なら append のみ）
+    #   appends      : Details へ追記するテキスト（順序通り）
+    #   props        : そのまま一緒に書くプロパティ（UpdatedAt など）
+    #   prop_appends : Details 以外の rich_text プロパティへの追記 (prop, text)（順序通り）
+    # ---------------------------------------------------------
+    def write_merged(self, key: str, data: Optional[Dict[str, Any]], appends: list,
+                     props: Optional[Dict[str, Any]] = None, prop_appends: tuple = ()):
+        base_props = self._convert(data) if data else {}
+
+        def extra(page):
+            texts: Dict[str, list] = {}
+            for prop, text in prop_appends:
+                texts.setdefault(prop, []).append(text)
+            out = dict(props or {})
+            for prop, t in texts.items():
+                out.update(self._append_text_prop(page or {"properties": {}}, prop, "\n".join(t)))
+            return out
+
+        if self.append_mode == "blocks":
+            blocks = [b for t in appends for b in text_blocks(t)]
+
+            def write(page):
+                update = {**base_props, **extra(page)}
+                if not page:
+                    if data is None:
+                        raise NotionPageNotFound(f"append 対象 key={key} のページが見つかりません")
+                    return self._create(key, update, blocks)
+                res = self.update_page(page["id"], update) if update else {"id": page["id"]}
+                if blocks:
+                    self.append_blocks(page["id"], blocks)
+                return res
+
+            return self._on_page(key, write, need_props=bool(prop_appends))
+
+        def write(page):
+            update = self._append_props(page, appends, base_props) if appends else dict(base_props)
+            update.update(extra(page))
+
+            if page:
+                return self.update_page(page["id"], update)
+
+            if data is None:
+                raise NotionPageNotFound(f"append 対象 key={key} のページが見つかりません")
+
+            return self._create(key, update)
+
+        need_props = (bool(appends) and not base_props.get("Details")) or bool(prop_appends)
+        return self._on_page(key, write, need_props=need_props)
 
     # ---------------------------------------------------------
     # 動的モード判定（create / upsert / append 自動判別）
@@ -170,3 +490,105 @@ class NotionWriter(NotionClientCore):
             props["Title"] = self.build_prop("title", title_text)
 
         return props
+
+
+# ============================================================
+# Async 版 Writer（同期 NotionWriter を threadpool で呼ぶ薄いラッパー）
+#   手順は NotionWriter だけに書き、ここでは 1 メソッド = 1 回の to_thread にする
+# ============================================================
+class AsyncNotionWriter:
+    """NotionWriter の非同期版（event loop を塞がずに呼ぶ）"""
+
+    is_async = True
+
+    def __init__(self, writer: Optional[NotionWriter] = None, **kwargs):
+        self.sync = writer if writer is not None else NotionWriter(**kwargs)
+
+    # --- NotionKeyIndex.arefresh などが参照する属性 ---
+    @property
+    def client(self):
+        return self.sync.client
+
+    @property
+    def db_id(self) -> str:
+        return self.sync.db_id
+
+    @property
+    def key_index(self):
+        return self.sync.key_index
+
+    # --- rate limit は同期 Writer の _api が 1 呼び出しごとに掛ける ---
+    @property
+    def limiter(self):
+        return self.sync.limiter
+
+    @limiter.setter
+    def limiter(self, limiter):
+        self.sync.limiter = limiter
+
+    @property
+    def max_retries(self) -> int:
+        return self.sync.max_retries
+
+    @max_retries.setter
+    def max_retries(self, n: int):
+        self.sync.max_retries = n
+
+    async def aclose(self):
+        await asyncio.to_thread(self.sync.close)
+
+    async def resolve_keys(self, keys) -> int:
+        return await asyncio.to_thread(self.sync.resolve_keys, keys)
+
+    async def write_create(self, data: Dict[str, Any]):
+        return await asyncio.to_thread(self.sync.write_create, data)
+
+    async def write_upsert(self, key: str, data: Dict[str, Any]):
+        return await asyncio.to_thread(self.sync.write_upsert, key, data)
+
+    async def write_append(self, key: str, text: str):
+        return await asyncio.to_thread(self.sync.write_append, key, text)
+
+    async def write_append_property(self, key: str, prop: str, text: str,
+                                    props: Optional[Dict[str, Any]] = None):
+        return await asyncio.to_thread(self.sync.write_append_property, key, prop, text, props)
+
+    async def write_merged(self, key: str, data: Optional[Dict[str, Any]], appends: list,
+                           props: Optional[Dict[str, Any]] = None, prop_appends: tuple = ()):
+        return await asyncio.to_thread(self.sync.write_merged, key, data, appends, props, prop_appends)
+
+    async def write_dynamic(self, data: Dict[str, Any]):
+        return await asyncio.to_thread(self.sync.write_dynamic, data)
+
+
+# ============================================================
+# プロセス共有の Writer（app lifespan で close_shared_writers()）
+#   リクエストごとに Writer を作ると env 読み直し + TCP/TLS を毎回払うため、1 つを使い回す
+#   async 版は共有の同期 Writer を包むだけなので、接続プールも 1 つ
+# ============================================================
+_shared: Dict[str, Any] = {}
+
+
+def shared_writer() -> NotionWriter:
+    if "sync" not in _shared:
+        _shared["sync"] = NotionWriter(key_index=notion_key_index)
+    return _shared["sync"]
+
+
+def shared_async_writer() -> AsyncNotionWriter:
+    if "async" not in _shared:
+        _shared["async"] = AsyncNotionWriter(shared_writer())
+    return _shared["async"]
+
+
+async def close_shared_writers():
+    _shared.pop("async", None)
+    writer = _shared.pop("sync", None)
+    if writer is not None:
+        await asyncio.to_thread(writer.close)
+
+
+async def notion_ping() -> bool:
+    """token で users.me が引けるか（readiness 用）"""
+    await asyncio.to_thread(shared_writer().client.users.me)
+    return True
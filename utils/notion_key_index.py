@@ -0,0 +1,269 @@
+# utils/notion_key_index.py
+"""
+ChronoNeura SyncBridge – devlog DB の Key → page_id インデックス
+
+- 有界の LRU（NOTION_KEY_INDEX_SIZE 件）
+- 起動時に DB をページングで全件スキャンして warm（ファイルがあれば差分のみ）
+- create_page の戻り値で追加、last_edited_time フィルタで差分更新
+- ローカルファイルへ保存し、再起動時のフルスキャンを避ける
+- ミス / 古いエントリ（削除・archive 済み）時は NotionWriter 側が query_by_key にフォールバック
+- Key を書き換えたページは古い Key の対応を消す（page_id → Key の逆引きを持つ）
+- マルチワーカー時、DB スキャンとファイル保存はワーカー 0 だけ。他のワーカーはファイルを読み直す
+  スキャンの 1 リクエストごとに scheduler の token bucket を取る（書き込みと同じ rate limit に数える）
+- notion-client 3.x（databases.query が無い版）は未対応（requirements.txt で <3 に固定）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from utils.worker import WORKER_ID
+
+NOTION_KEY_INDEX_SIZE = int(os.getenv("NOTION_KEY_INDEX_SIZE", "50000"))
+NOTION_KEY_INDEX_FILE = os.getenv(
+    "NOTION_KEY_INDEX_FILE",
+    os.path.join(tempfile.gettempdir(), "chrono_notion_key_index.json"),
+)
+NOTION_KEY_INDEX_REFRESH = float(os.getenv("NOTION_KEY_INDEX_REFRESH", "60"))
+
+# DB スキャン・ファイル保存を担当するプロセスか（単一プロセス または ワーカー 0）
+NOTION_KEY_INDEX_OWNER = WORKER_ID in (None, "0")
+
+# last_edited_time は分単位の精度なので、差分更新は少し巻き戻して取る
+REFRESH_OVERLAP = timedelta(minutes=2)
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(page: Dict[str, Any], key_property: str = "Key") -> Optional[str]:
+    """ページの Key プロパティ（rich_text）を文字列で取り出す"""
+    prop = page.get("properties", {}).get(key_property) or {}
+    parts = prop.get("rich_text") or prop.get("title") or []
+    text = "".join(rt.get("plain_text") or rt.get("text", {}).get("content", "") for rt in parts)
+    return text or None
+
+
+def is_not_found(e: Exception) -> bool:
+    return getattr(e, "status", None) == 404 or getattr(e, "code", None) == "object_not_found"
+
+
+def is_archived(e: Exception) -> bool:
+    """archive / ゴミ箱のページへの書き込み（400 validation_error "Can't edit block that is archived"）"""
+    return getattr(e, "status", None) == 400 and "archived" in str(e).lower()
+
+
+def is_stale(e: Exception) -> bool:
+    """index の page_id がもう使えない（引き直せば通りうる）"""
+    return is_not_found(e) or is_archived(e)
+
+
+def is_live(page: Dict[str, Any]) -> bool:
+    return not (page.get("archived") or page.get("in_trash"))
+
+
+def database_query(client):
+    """client.databases.query（notion-client 3.x には無い）"""
+    query = getattr(client.databases, "query", None)
+    if query is None:
+        raise RuntimeError("notion-client 3.x は未対応です（databases.query が無い）。notion-client<3 を使ってください。")
+    return query
+
+
+class NotionKeyIndex:
+
+    def __init__(self, path: Optional[str] = NOTION_KEY_INDEX_FILE, max_size: int = NOTION_KEY_INDEX_SIZE,
+                 owner: bool = True):
+        self.path = path
+        self.max_size = max_size
+        self.owner = owner                     # False ならファイルは読むだけ（保存・スキャンはワーカー 0）
+        self.synced_at: Optional[str] = None   # 最後に DB と同期した時刻（ISO8601）
+
+        self._map: OrderedDict = OrderedDict()
+        self._ids: Dict[str, str] = {}         # page_id → Key（Key の書き換え検出用）
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "scanned": 0}
+
+    # ---------------------------------------------------------
+    # 参照 / 更新（NotionWriter からスレッド越しに呼ばれる）
+    # ---------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            page_id = self._map.get(key)
+            if page_id is None:
+                self.stats["misses"] += 1
+                return None
+            self._map.move_to_end(key)
+            self.stats["hits"] += 1
+            return page_id
+
+    def put(self, key: Optional[str], page_id: Optional[str]):
+        if not key or not page_id:
+            return
+        with self._lock:
+            # Key を書き換えたページは古い Key の対応を消す
+            old_key = self._ids.get(page_id)
+            if old_key is not None and old_key != key:
+                self._map.pop(old_key, None)
+            old_id = self._map.get(key)
+            if old_id is not None and old_id != page_id:
+                self._ids.pop(old_id, None)
+
+            self._map[key] = page_id
+            self._ids[page_id] = key
+            self._map.move_to_end(key)
+            while len(self._map) > self.max_size:
+                _, evicted = self._map.popitem(last=False)
+                self._ids.pop(evicted, None)
+
+    def discard(self, key: str):
+        with self._lock:
+            page_id = self._map.pop(key, None)
+            if page_id is not None:
+                self._ids.pop(page_id, None)
+                self.stats["stale"] += 1
+
+    def discard_page(self, page_id: str):
+        """削除・archive されたページの対応を消す"""
+        with self._lock:
+            key = self._ids.pop(page_id, None)
+            if key is not None and self._map.get(key) == page_id:
+                del self._map[key]
+                self.stats["stale"] += 1
+
+    def missing(self, keys) -> list:
+        """index に載っていない key（重複・空は除く、順序保持、統計には数えない）"""
+        with self._lock:
+            return [k for k in dict.fromkeys(keys) if k and k not in self._map]
+
+    def __len__(self):
+        return len(self._map)
+
+    # ---------------------------------------------------------
+    # 永続化
+    # ---------------------------------------------------------
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        for k, v in data.get("pages", {}).items():
+            self.put(k, v)
+        self.synced_at = data.get("synced_at")
+        return True
+
+    def save(self):
+        if not self.path or not self.owner:
+            return
+        with self._lock:
+            data = {"synced_at": self.synced_at, "pages": dict(self._map)}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    # ---------------------------------------------------------
+    # DB スキャン（client は notion_client.Client）
+    # ---------------------------------------------------------
+    def _scan_query(self, db_id: str, since: Optional[str]) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"database_id": db_id, "page_size": 100}
+        if since:
+            after = datetime.fromisoformat(since) - REFRESH_OVERLAP
+            query["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": after.isoformat()},
+            }
+        return query
+
+    def _take(self, res: Dict[str, Any], key_property: str) -> int:
+        pages = res.get("results", [])
+        for page in pages:
+            if is_live(page):
+                self.put(page_key(page, key_property), page["id"])
+            else:
+                self.discard_page(page["id"])
+        return len(pages)
+
+    def refresh(self, client, db_id: str, key_property: str = "Key", since: Optional[str] = None) -> int:
+        """since 以降に更新されたページ（None なら全件）を取り込む"""
+        started = datetime.now(timezone.utc)
+        query = self._scan_query(db_id, since)
+        fetch = database_query(client)
+
+        n = 0
+        while True:
+            res = fetch(**query)
+            n += self._take(res, key_property)
+            if not res.get("has_more"):
+                break
+            query["start_cursor"] = res.get("next_cursor")
+
+        self.stats["scanned"] += n
+        self.synced_at = started.isoformat()
+        return n
+
+    async def arefresh(self, writer, key_property: str = "Key", since: Optional[str] = None,
+                       acquire=None) -> int:
+        """refresh() の event loop 版（writer は NotionWriter / AsyncNotionWriter、DB は threadpool で引く、
+        acquire は 1 リクエストごとに await する rate limit（scheduler の token bucket））"""
+        started = datetime.now(timezone.utc)
+        query = self._scan_query(writer.db_id, since)
+        fetch = database_query(writer.client)
+
+        n = 0
+        while True:
+            if acquire is not None:
+                await acquire()
+            res = await asyncio.to_thread(fetch, **query)
+            n += self._take(res, key_property)
+            if not res.get("has_more"):
+                break
+            query["start_cursor"] = res.get("next_cursor")
+
+        self.stats["scanned"] += n
+        self.synced_at = started.isoformat()
+        return n
+
+    def warm(self, client, db_id: str, key_property: str = "Key") -> int:
+        """ファイルがあれば差分更新、無ければフルスキャン"""
+        since = self.synced_at if (self.load() and self.synced_at) else None
+        n = self.refresh(client, db_id, key_property, since=since)
+        self.save()
+        return n
+
+    async def keep_fresh(self, get_writer, interval: float = NOTION_KEY_INDEX_REFRESH, acquire=None):
+        """lifespan 中のバックグラウンドタスク：warm → interval ごとに差分更新
+        owner でなければ DB は引かず、owner が保存したファイルを interval ごとに読み直す"""
+        loaded = await asyncio.to_thread(self.load)
+        since = self.synced_at if loaded else None
+
+        while True:
+            try:
+                if self.owner:
+                    await self.arefresh(get_writer(), since=since, acquire=acquire)
+                    await asyncio.to_thread(self.save)
+                    since = self.synced_at
+                else:
+                    await asyncio.to_thread(self.load)
+            except Exception as e:
+                # Notion 不達でも ingest は query_by_key フォールバックで動く
+                logger.warning("notion key index refresh failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def info(self) -> Dict[str, Any]:
+        return {"size": len(self._map), "max_size": self.max_size, "synced_at": self.synced_at, **self.stats}
+
+
+# ------------------------------------
+# アプリ共有インスタンス
+# ------------------------------------
+notion_key_index = NotionKeyIndex(path=NOTION_KEY_INDEX_FILE, owner=NOTION_KEY_INDEX_OWNER)
@@ -0,0 +1,323 @@
+# utils/notion_scheduler.py
+"""
+ChronoNeura SyncBridge – Notion 書き込みスケジューラ
+
+- token bucket で Notion の ~3 req/s 制限内に収め、429 の Retry-After に従って一時停止
+  （bucket は Writer に渡し、Writer の _api が HTTP 呼び出し 1 回ごとに token を取る。
+   429 はその呼び出しだけを再送し、ジョブ全体はやり直さない）
+- 同じ key への未着手 upsert / append は 1 回の update_page にまとめる
+- 同時実行数は NOTION_CONCURRENCY で上限
+- submit() は Future を返す（API 側で「受付のみ」か「結果待ち」かを選べる）
+- task_id は "<ワーカー ID>-<uuid>"。結果の履歴はプロセスごとなので、マルチワーカー時は
+  別のワーカーに届いた問い合わせを task_owner() で見分けて 404 の理由に出す
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import httpx
+
+from utils.metrics import timed_stage
+# NotionRateLimited は routes がここから import する
+from utils.notion_client import NOTION_MAX_RETRIES, NotionRateLimited  # noqa: F401
+from utils.worker import WORKERS, WORKER_ID
+
+NOTION_RATE_PER_SEC = float(os.getenv("NOTION_RATE_PER_SEC", "3"))
+NOTION_BURST = int(os.getenv("NOTION_BURST", "3"))
+NOTION_CONCURRENCY = int(os.getenv("NOTION_CONCURRENCY", "3"))
+
+# 完了済みタスクの結果を保持する件数（GET /notion/devlog/tasks/{id} 用）
+NOTION_TASK_HISTORY = 1000
+
+
+def is_unapplied(e: Exception) -> bool:
+    """Notion に届いていないと分かっているエラー（接続できなかった / pool が空かなかった）
+    5xx・読み取りタイムアウトは反映済みのことがあるので含めない（create / append の再送は重複する）"""
+    return isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def new_task_id() -> str:
+    """ワーカーをまたいでも重複しない task_id（先頭は発行したワーカーの ID）"""
+    return f"{WORKER_ID or 0}-{uuid.uuid4().hex}"
+
+
+def task_owner(task_id: str) -> str | None:
+    """task_id を発行したワーカーの ID（形式が違えば None）"""
+    owner, sep, _ = task_id.partition("-")
+    return owner if sep and owner.isdigit() else None
+
+
+# ============================================================
+# token bucket（Retry-After による一時停止つき）
+#   Writer の _api（threadpool 上）は take()、event loop 側（key index の差分更新）は acquire()
+# ============================================================
+class TokenBucket:
+
+    def __init__(self, rate: float = NOTION_RATE_PER_SEC, burst: int = NOTION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.rate_limited = 0          # pause() した回数（= 受けた 429 の数）
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+    def _try_take(self) -> float:
+        """token を 1 つ取れたら 0、取れなければ次に試すまでの秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def take(self):
+        while (wait := self._try_take()) > 0:
+            time.sleep(wait)
+
+    async def acquire(self):
+        while (wait := self._try_take()) > 0:
+            await asyncio.sleep(wait)
+
+
+# ============================================================
+# 未着手の書き込み（同一 key はここにマージされる）
+# ============================================================
+class _PendingWrite:
+
+    def __init__(self, task_id: str, key: Optional[str], future: asyncio.Future):
+        self.task_id = task_id
+        self.key = key
+        self.future = future
+        self.data: Optional[Dict[str, Any]] = None   # upsert / create のプロパティ
+        self.appends: list[str] = []                 # Details への append テキスト（順序保持）
+        self.props: Dict[str, Any] = {}              # そのまま書くプロパティ（UpdatedAt など、後勝ち）
+        self.prop_appends: list[tuple] = []          # Details 以外への追記 (prop, text)（順序保持）
+        self.create = False                          # key なし create
+        self.merged = 0
+
+    def merge(self, data: Dict[str, Any]):
+        data = dict(data)
+        self.props.update(data.pop("props", None) or {})
+        mode = data.get("mode", "create")
+        if mode == "append":
+            prop = data.pop("append_to", None) or "Details"
+            if prop == "Details":
+                self.appends.append(data["append"])
+            else:
+                self.prop_appends.append((prop, data["append"]))
+        else:
+            # 後勝ち（None は「指定なし」として既存値を残す）
+            base = self.data or {}
+            base.update({k: v for k, v in data.items() if v is not None})
+            self.data = base
+        self.merged += 1
+
+
+class NotionWriteScheduler:
+
+    def __init__(self,
+                 writer_factory,
+                 rate: float = NOTION_RATE_PER_SEC,
+                 burst: int = NOTION_BURST,
+                 concurrency: int = NOTION_CONCURRENCY,
+                 max_retries: int = NOTION_MAX_RETRIES):
+
+        self.writer_factory = writer_factory
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+        self._writer = None
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._pending: Dict[str, _PendingWrite] = {}     # key -> 未着手の書き込み
+        self._key_locks: Dict[str, list] = {}           # key -> [Lock, 利用中の数]
+        self._history: OrderedDict = OrderedDict()       # task_id -> Future
+
+        self._counts = {"submitted": 0, "merged": 0, "executed": 0, "failed": 0}
+
+    # ---------------------------------------------------------
+    # lifecycle
+    # ---------------------------------------------------------
+    @property
+    def writer(self):
+        if self._writer is None:
+            self._writer = self.writer_factory()
+            # token は Writer の _api が HTTP 呼び出しごとに取る（429 もその呼び出しだけ再送）
+            self._writer.limiter = self.bucket
+            self._writer.max_retries = self.max_retries
+        return self._writer
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {**self._counts, "rate_limited": self.bucket.rate_limited}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """投入済みの書き込みを全て処理してから停止"""
+        if not self.running:
+            return
+        await self._queue.join()
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ---------------------------------------------------------
+    # 投入
+    # ---------------------------------------------------------
+    async def submit(self, data: Dict[str, Any]) -> tuple[str, asyncio.Future]:
+        """(task_id, Future) を返す。同一 key の未着手タスクがあればそこへマージ
+        append は append_to（既定 Details）で追記先の rich_text プロパティを、
+        props で同じ書き込みに載せるプロパティ（UpdatedAt など）を指定できる"""
+        if not self.running:
+            await self.start()
+
+        mode = data.get("mode", "create")
+        key = data.get("key")
+        self._counts["submitted"] += 1
+
+        if mode in ("upsert", "append"):
+            if not key:
+                raise RuntimeError(f"{mode} には 'key' が必要です。")
+            if mode == "append" and not data.get("append"):
+                raise RuntimeError("append には 'key' と 'append' が必要です。")
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.merge(data)
+                self._counts["merged"] += 1
+                return pending.task_id, pending.future
+        elif mode != "create":
+            raise RuntimeError(f"未知の mode：{mode}")
+
+        pending = _PendingWrite(new_task_id(), key, asyncio.get_running_loop().create_future())
+        if mode == "create":
+            pending.create = True
+            pending.data = data
+        else:
+            pending.merge(data)
+            self._pending[key] = pending
+
+        self._remember(pending)
+        self._queue.put_nowait(pending)
+        return pending.task_id, pending.future
+
+    async def resolve_keys(self, keys) -> int:
+        """未知の key を 100 件ずつ 1 クエリで引いて index に載せる（bulk import の前処理）"""
+        index = getattr(self.writer, "key_index", None)
+        if index is None:
+            return 0
+        return await self._call(self.writer.resolve_keys, index.missing(keys))
+
+    def _remember(self, pending: _PendingWrite):
+        self._history[pending.task_id] = pending.future
+        while len(self._history) > NOTION_TASK_HISTORY:
+            self._history.popitem(last=False)
+
+    def task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        fut = self._history.get(task_id)
+        if fut is None:
+            return None
+        if not fut.done():
+            return {"task_id": task_id, "status": "pending"}
+        if fut.exception():
+            return {"task_id": task_id, "status": "error", "error": str(fut.exception())}
+        res = fut.result() or {}
+        return {"task_id": task_id, "status": "success", "page_id": res.get("id"), "url": res.get("url")}
+
+    # ---------------------------------------------------------
+    # worker
+    # ---------------------------------------------------------
+    async def _worker(self):
+        while True:
+            pending = await self._queue.get()
+            try:
+                await self._execute(pending)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, pending: _PendingWrite):
+        lock = None
+        if pending.key is not None:
+            # ここから先のマージは受け付けない（次の submit は新しいタスクになる）
+            if self._pending.get(pending.key) is pending:
+                del self._pending[pending.key]
+            lock = self._key_locks.setdefault(pending.key, [asyncio.Lock(), 0])
+            lock[1] += 1
+            await lock[0].acquire()
+
+        try:
+            result = await self._write(pending)
+        except Exception as e:
+            self._counts["failed"] += 1
+            pending.future.set_exception(e)
+            pending.future.exception()   # 受付のみの場合の警告を抑止
+        else:
+            self._counts["executed"] += 1
+            pending.future.set_result(result)
+        finally:
+            if lock is not None:
+                lock[0].release()
+                lock[1] -= 1
+                if lock[1] == 0:
+                    self._key_locks.pop(pending.key, None)
+
+    async def _call(self, fn, *args):
+        # AsyncNotionWriter はそのまま await、同期 NotionWriter は threadpool へ
+        with timed_stage(f"notion_{fn.__name__}"):
+            if getattr(self.writer, "is_async", False):
+                return await fn(*args)
+            return await asyncio.to_thread(fn, *args)
+
+    async def _write(self, pending: _PendingWrite):
+        if pending.create:
+            return await self._call(self.writer.write_create, pending.data)
+        return await self._call(self.writer.write_merged, pending.key, pending.data, pending.appends,
+                                pending.props, tuple(pending.prop_appends))
+
+
+# ------------------------------------
+# アプリ共有インスタンス（共有 AsyncNotionWriter を使い回す、lifespan で start / stop）
+#   Notion の rate limit は integration 単位なので、マルチワーカー時は頭割りする
+# ------------------------------------
+def _default_writer():
+    from utils.notion_client import shared_async_writer
+    return shared_async_writer()
+
+
+notion_scheduler = NotionWriteScheduler(
+    writer_factory=_default_writer,
+    rate=NOTION_RATE_PER_SEC / WORKERS,
+    burst=max(1, NOTION_BURST // WORKERS),
+)
@@ -0,0 +1,140 @@
+# utils/query_cache.py
+# ChronoNeura Query Cache
+#   influx_query の前段に置くキャッシュ
+#
+#   - key = (bucket, 空白を正規化した Flux 文字列)
+#   - エントリごとの TTL、合計バイト数で上限を持つ LRU
+#   - 同一クエリの同時実行は 1 本の Influx 呼び出しに合流（coalescing）
+#   - ingest による書き込みで bucket 単位に invalidate
+#     （世代番号を進めるだけの O(1)、古い世代のエントリは参照時・LRU で破棄）
+#   - invalidate はプロセス内だけ。マルチワーカー（CHRONO_WORKERS > 1）では他のワーカーの書き込みが
+#     届かないので、TTL を QUERY_CACHE_WORKER_TTL 以下に切り詰め、古い結果を返す時間を抑える
+#   - 合流した読み込みは独立したタスクで実行する（最初の呼び出し元が cancel されても他の待ち手は結果を受け取る）
+#   - 合流は同じ世代の読み込みだけ（invalidate 後のクエリが書き込み前に始まった読み込みの結果を受け取らない）
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+from utils.worker import WORKERS
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "5"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUERY_CACHE_WORKER_TTL = float(os.getenv("QUERY_CACHE_WORKER_TTL", "1"))
+
+# 文字列リテラルはそのまま残し、それ以外の連続空白だけを 1 つに畳む
+_FLUX_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|\s+')
+
+
+def normalize_flux(query: str) -> str:
+    return _FLUX_TOKENS.sub(lambda m: m.group(0) if m.group(0)[0] == '"' else " ", query).strip()
+
+
+class QueryCache:
+
+    def __init__(self, ttl: float = QUERY_CACHE_TTL, max_bytes: int = QUERY_CACHE_MAX_BYTES,
+                 workers: int = WORKERS):
+        # 他のワーカーの invalidate は届かない
+        self.ttl = min(ttl, QUERY_CACHE_WORKER_TTL) if workers > 1 else ttl
+        self.max_bytes = max_bytes
+
+        self._entries: OrderedDict = OrderedDict()   # key -> (expires_at, size, value, generation)
+        self._inflight: dict = {}                    # (key, generation) -> asyncio.Task
+        self._generation: dict[str, int] = {}        # bucket -> invalidate 回数
+        self._bytes = 0
+
+        # invalidations：invalidate の回数、invalidated：それで捨てたエントリ、expired：TTL 切れ
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0,
+                         "invalidations": 0, "invalidated": 0, "expired": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    # ---------------------------------------------------------
+    # 取得（loader は await 可能な 0 引数関数）
+    # ---------------------------------------------------------
+    async def get(self, bucket: str, query: str, loader):
+        if not self.enabled:
+            return await loader()
+
+        key = (bucket, normalize_flux(query))
+
+        generation = self._generation.get(bucket, 0)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic() and entry[3] == generation:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[2]
+            self._drop(key)
+            self.counters["invalidated" if entry[3] != generation else "expired"] += 1
+
+        inflight = self._inflight.get((key, generation))
+        if inflight is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        self.counters["misses"] += 1
+        task = asyncio.ensure_future(self._load(key, bucket, generation, loader))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())   # 待ち手がいない場合の警告を抑止
+        self._inflight[(key, generation)] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, bucket: str, generation: int, loader):
+        try:
+            value = await loader()
+        finally:
+            self._inflight.pop((key, generation), None)
+
+        # 実行中に invalidate された結果は保存しない
+        if self._generation.get(bucket, 0) == generation:
+            self._store(key, value, generation)
+        return value
+
+    # ---------------------------------------------------------
+    # 保存 / 削除
+    # ---------------------------------------------------------
+    def _store(self, key, value, generation: int):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value, generation)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            old_key = next(iter(self._entries))
+            self._drop(old_key)
+            self.counters["evictions"] += 1
+
+    def _drop(self, key):
+        size = self._entries.pop(key)[1]
+        self._bytes -= size
+
+    def invalidate(self, bucket: str):
+        self._generation[bucket] = self._generation.get(bucket, 0) + 1
+        self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "inflight": len(self._inflight),
+            **self.counters,
+        }
+
+
+# ------------------------------------
+# アプリ共有インスタンス
+# ------------------------------------
+query_cache = QueryCache()
@@ -0,0 +1,16 @@
+# utils/worker.py
+# マルチプロセス配信時のワーカー情報（server/serve.py が子プロセスの環境変数に設定）
+#   CHRONO_WORKERS   : ワーカー数（プロセス全体で共有する上限を頭割りする時に使う）
+#   CHRONO_WORKER_ID : 0 始まりの固定 ID（再起動しても同じ ID で立ち上がる）
+
+import os
+
+WORKERS = max(1, int(os.getenv("CHRONO_WORKERS", "1")))
+WORKER_ID = os.getenv("CHRONO_WORKER_ID")
+
+
+def worker_path(path: str | None) -> str | None:
+    """ワーカーごとに分けるファイル / ディレクトリ（単一プロセスなら path のまま）"""
+    if not path or WORKER_ID is None:
+        return path
+    return f"{path}.{WORKER_ID}"